@@ -1,4 +1,4 @@
-from typing import List, Dict
+from typing import AsyncIterator, Callable, List, Dict, Optional
 import uuid
 from llama_index.core.agent import ReActAgent, FunctionCallingAgent
 from llama_index.core.tools import ToolOutput
@@ -6,18 +6,24 @@ from llama_index.llms.openai import OpenAI
 from langchain_openai import ChatOpenAI
 from llama_index.llms.langchain import LangChainLLM
 from llama_index.llms.ollama import Ollama
+from llm_clients import get_llm, aclose_llm_clients
 import asyncio
-from tool_code_executor import create_task_workspace
-from tool_code_executor import create_code_executor_docker_tool, create_code_executor_local_tool, close_docker_container, create_browser_docker_tool
-from tool_code_generator import create_code_generator_tool
-from tool_webpage_crawler import create_webpage_crawler_tool
+from tool_code_executor import create_task_workspace, get_container_pool
+from tool_code_executor import create_code_executor_docker_tool, create_code_executor_local_tool, close_docker_container, create_browser_docker_tool, close_all_docker_containers
+from tool_code_executor import forget_user_tasks, get_executor_metrics, close_task_container
+from registry import LRURegistry
+from memory_manager import MemoryManager
+from tool_code_generator import create_code_generator_tool, create_code_runner_tool
+from tool_webpage_crawler import create_webpage_crawler_tool, create_webpage_batch_crawler_tool, aclose_crawler_sessions
 from llama_index.core.llms import ChatMessage
 from prompts import REACT_AGENT_CONTEXT, DEFAULT_INITIAL_PLAN_PROMPT, DEFAULT_PLAN_REFINE_PROMPT
 from llama_index.core.agent import (
     StructuredPlannerAgent,
     FunctionCallingAgentWorker,
     ReActAgentWorker,
+    ReActChatFormatter,
 )
+from planner_agent import ParallelPlannerAgent, PLANNER_MAX_CONCURRENCY
 import shutil
 import os
 
@@ -25,12 +31,37 @@ import os
 # os.environ["http_proxy"] = "http://127.0.0.1:11434"
 # os.environ["https_proxy"] = "http://127.0.0.1:11434"
 
-# api
-api_key = "本地模型 API"
-base_url = "API 链接"
+# Agent数量上限与空闲过期时间（秒），超出后淘汰最久未使用的Agent并停止其容器
+AGENT_MAX_COUNT = 200
+AGENT_TTL = 1800
+
+# Agent执行模式："react" 逐步执行；"planner" 先把任务拆成有依赖关系的子任务，
+# 互不依赖的子任务（如采集多个网页、安装依赖的同时生成代码）并行执行，同时最多 PLANNER_MAX_CONCURRENCY 个
+AGENT_MODE = "react"
+
+
+# 全局变量 - 正在执行任务的用户及其任务数，这些用户的Agent和容器不会被淘汰
+_active_tasks: Dict[str, int] = {}
+
+# 全局变量 - 对话记忆管理，记忆超过token预算时总结较早的对话
+_memory_manager = MemoryManager()
+
+
+def _on_agent_evicted(user_id: str, agent: ReActAgent):
+    """Agent被淘汰时释放该用户的容器和任务目录记录"""
+    print(f"淘汰用户 {user_id} 的Agent")
+    close_docker_container(user_id)
+    forget_user_tasks(user_id)
+    _memory_manager.forget(user_id)
+
+
+def _has_active_task(user_id: str) -> bool:
+    return _active_tasks.get(user_id, 0) > 0
+
 
 # 全局变量 - Agent映射表（按用户ID组织）
-_agents: Dict[str, ReActAgent] = {}
+_agents: LRURegistry = LRURegistry(max_size=AGENT_MAX_COUNT, ttl=AGENT_TTL, on_evict=_on_agent_evicted,
+                                   is_busy=_has_active_task)
 
 
 def generate_task_id():
@@ -45,35 +76,61 @@ def get_agent(
     """获取或创建用户专属的Agent实例"""
     global _agents
 
-    if user_id not in _agents:
+    agent = _agents.get(user_id)
+    if agent is None:
 
-        # 如果没有提供LLM，创建默认的LLM
+        # 如果没有提供LLM，使用进程内共享的默认LLM
         if llm is None:
-            llm = LangChainLLM(llm=ChatOpenAI(model="模型名XXX", openai_api_key=api_key, openai_api_base=base_url))
+            llm = get_llm()
             # llm = Ollama(model="XXX", base_url="http://localhost:11434")
 
         # 创建用户专属的工具实例
         tool_code_executor_docker = create_code_executor_docker_tool()
         tool_browser_docker = create_browser_docker_tool()
         tool_code_generator = create_code_generator_tool()
+        tool_code_runner = create_code_runner_tool()
         tool_webpage_crawler = create_webpage_crawler_tool()  # 新增网页采集工具
+        tool_webpage_batch_crawler = create_webpage_batch_crawler_tool()
 
-        # 创建用户专属的Agent
+        tools = [
+            tool_code_runner,
+            tool_code_generator,
+            tool_code_executor_docker,
+            tool_browser_docker,
+            tool_webpage_crawler,  # 添加到工具列表
+            tool_webpage_batch_crawler
+        ]
 
-        _agents[user_id] = ReActAgent.from_tools(
-            max_iterations=20,
-            tools=[
-                tool_code_generator,
-                tool_code_executor_docker,
-                tool_browser_docker,
-                tool_webpage_crawler  # 添加到工具列表
-            ],
-            llm=llm,
-            verbose=True,
-            context=REACT_AGENT_CONTEXT
-        )
-
-    return _agents[user_id]
+        # 创建用户专属的Agent
+        if AGENT_MODE == "planner":
+            # 每个子任务由ReAct执行，子任务之间按依赖关系并行
+            worker = ReActAgentWorker.from_tools(
+                tools=tools,
+                llm=llm,
+                max_iterations=20,
+                react_chat_formatter=ReActChatFormatter.from_defaults(context=REACT_AGENT_CONTEXT),
+                verbose=True
+            )
+            agent = ParallelPlannerAgent(
+                worker,
+                tools=tools,
+                llm=llm,
+                initial_plan_prompt=DEFAULT_INITIAL_PLAN_PROMPT,
+                plan_refine_prompt=DEFAULT_PLAN_REFINE_PROMPT,
+                max_concurrency=PLANNER_MAX_CONCURRENCY,
+                verbose=True
+            )
+        else:
+            agent = ReActAgent.from_tools(
+                max_iterations=20,
+                tools=tools,
+                llm=llm,
+                verbose=True,
+                context=REACT_AGENT_CONTEXT
+            )
+        _agents[user_id] = agent
+
+    return agent
 
 
 def close_agent(user_id: str = "default"):
@@ -82,8 +139,10 @@ def close_agent(user_id: str = "default"):
     if user_id in _agents:
         # 关闭该用户的Docker容器
         close_docker_container(user_id)
+        forget_user_tasks(user_id)
+        _memory_manager.forget(user_id)
         # 移除Agent实例
-        del _agents[user_id]
+        _agents.pop(user_id)
 
 
 def close_all_agents():
@@ -94,12 +153,128 @@ def close_all_agents():
     # 逐个关闭用户的Agent和资源
     for user_id in user_ids:
         close_agent(user_id)
+    # 停止容器池中剩余的预热容器
+    close_all_docker_containers()
+
+
+def prepare_task(user_id: str, query: str, filename: str = "") -> Dict[str, str]:
+    """生成task_id，创建任务工作目录并拷贝待处理文件，返回交给Agent的任务输入
+
+    Args:
+        user_id: 用户ID
+        query: 任务描述
+        filename: 待处理的文件名（位于data目录下），为空表示无文件
+
+    Returns:
+        Dict: 包含user_id、task_id、task、target_file的任务输入
+    """
+    task_id = generate_task_id()
+
+    # 创建工作目录
+    workspace_path = create_task_workspace(user_id, task_id)
+
+    if filename:
+
+        # 检查文件是否存在
+        source_path = os.path.join(workspace_path, '../data', filename)
+        print(f"source_path: {source_path}")
+        if not os.path.exists(source_path):
+            raise FileNotFoundError(f"文件 {filename} 不存在于data目录中")
+
+        # 拷贝文件到工作目录
+        target_path = os.path.join(workspace_path, filename)
+        shutil.copy2(source_path, target_path)
+
+    else:
+        target_path = None
+
+    return {
+        "user_id": user_id,
+        "task_id": task_id,
+        "task": query.strip(),
+        "target_file": target_path
+    }
+
+
+def evict_expired_agents() -> int:
+    """淘汰空闲过期的Agent，返回淘汰数量"""
+    return _agents.evict_expired()
+
+
+def approximate_agent_memory(agent: ReActAgent) -> int:
+    """估算Agent对话记忆占用的字节数（按记忆中消息内容的UTF-8长度计算）"""
+    try:
+        messages = agent.memory.get_all()
+    except Exception:
+        return 0
+    return sum(len(str(message.content or "").encode("utf-8")) for message in messages)
+
+
+def get_registry_metrics() -> Dict:
+    """Agent与容器注册表的运行指标"""
+    agent_memory = {user_id: approximate_agent_memory(agent) for user_id, agent in _agents.items()}
+    return {
+        "live_agents": len(_agents),
+        "agents": _agents.stats(),
+        "agent_memory_bytes": agent_memory,
+        "agent_memory_bytes_total": sum(agent_memory.values()),
+        "agent_memory_tokens": _memory_manager.stats(),
+        **get_executor_metrics()
+    }
+
+
+async def astream_task(
+        agent: ReActAgent,
+        task_input: Dict[str, str],
+        on_token: Optional[Callable[[str], None]] = None
+) -> AsyncIterator[str]:
+    """以流式方式执行任务，逐段返回Agent最终回答的内容
+
+    Args:
+        agent: 用户的Agent
+        task_input: prepare_task 返回的任务输入
+        on_token: 每收到一段内容时调用的回调
+
+    Yields:
+        str: 新生成的回答片段
+    """
+    user_id = task_input["user_id"]
+    # 任务执行期间该用户的Agent不会被淘汰，避免容器在执行中被停止
+    _active_tasks[user_id] = _active_tasks.get(user_id, 0) + 1
+    try:
+        if isinstance(agent, ParallelPlannerAgent):
+            # 规划模式的子任务并行执行，最终回答在所有子任务完成后一次返回
+            answer = str(await agent.achat(str(task_input)))
+            if on_token:
+                on_token(answer)
+            yield answer
+        else:
+            response = await agent.astream_chat(str(task_input))
+            async for token in response.async_response_gen():
+                if on_token:
+                    on_token(token)
+                yield token
+        # 回答完成后检查对话记忆，超出预算时总结较早的对话，下一个任务的提示词不再无限增长
+        await _memory_manager.acompact(task_input["user_id"], agent.memory, get_llm())
+    finally:
+        # 任务结束（包括失败和取消）后归还任务的执行沙箱
+        try:
+            await asyncio.to_thread(close_task_container, user_id, task_input["task_id"])
+        finally:
+            _active_tasks[user_id] -= 1
+            if _active_tasks[user_id] <= 0:
+                _active_tasks.pop(user_id)
+            # 空闲时间从任务结束时开始计算；访问注册表可能淘汰其他Agent并停止容器，在线程中进行
+            await asyncio.to_thread(_agents.get, user_id)
 
 
 async def test_react_agent():
     try:
         print("欢迎使用Awesome Manus! 输入'exit'或'quit'退出程序。")
 
+        # 提前预热执行容器，避免首次调用工具时等待容器冷启动
+        get_container_pool()
+
         # 获取用户ID
         user_id = input("\n请输入用户ID (直接回车使用default): ").strip()
         if not user_id:
@@ -123,42 +298,24 @@ async def test_react_agent():
             # 获取或创建用户专属的Agent
             agent = get_agent(user_id)
 
-            # 生成task_id并组装任务
-            task_id = generate_task_id()
-
-            # 创建工作目录
-            workspace_path = create_task_workspace(user_id, task_id)
-
-            if filename:
-
-                # 检查文件是否存在
-                source_path = os.path.join(workspace_path, '../data', filename)
-                print(f"source_path: {source_path}")
-                if not os.path.exists(source_path):
-                    print(f"错误：文件 {filename} 不存在于data目录中")
-                    continue
-
-                # 拷贝文件到工作目录
-                target_path = os.path.join(workspace_path, filename)
-                shutil.copy2(source_path, target_path)
-
-            else:
-                target_path = None
-
-            task_input = {
-                "user_id": user_id,
-                "task_id": task_id,
-                "task": query.strip(),
-                "target_file": target_path
-            }
+            # 生成task_id并准备任务工作目录
+            try:
+                task_input = prepare_task(user_id, query, filename)
+            except FileNotFoundError as e:
+                print(f"错误：{str(e)}")
+                continue
 
-            # 使用非流式响应
-            response = await agent.achat(str(task_input))
-            print(f"任务执行结果: {response}")
+            # 使用流式响应，最终回答边生成边输出
+            print("任务执行结果: ", end="", flush=True)
+            async for token in astream_task(agent, task_input):
+                print(token, end="", flush=True)
+            print()
 
     finally:
         # 确保所有资源被清理
         close_all_agents()
+        await aclose_llm_clients()
+        await aclose_crawler_sessions()
 
 
 if __name__ == "__main__":
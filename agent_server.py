@@ -0,0 +1,399 @@
+import argparse
+import asyncio
+import json
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Deque, Dict, List, Optional
+from aiohttp import web
+from agent_main import get_agent, close_agent, close_all_agents, prepare_task, evict_expired_agents, get_registry_metrics, astream_task
+from tool_code_executor import get_container_pool, get_browser_pool
+from registry import LRURegistry
+from llm_clients import aclose_llm_clients
+from tool_webpage_crawler import aclose_crawler_sessions
+
+# 空闲Agent的清理间隔（秒）
+EVICT_INTERVAL = 60
+
+
+class QueueFullError(Exception):
+    """任务队列已满"""
+
+
+@dataclass
+class TaskRecord:
+    """一次任务提交的状态"""
+    task_id: str
+    user_id: str
+    task_input: Dict[str, str]
+    status: str = "queued"  # queued / running / done / failed / cancelled
+    result: str = ""
+    error: str = ""
+    submitted_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    # 订阅流式输出的队列，任务结束时收到None
+    listeners: List[asyncio.Queue] = field(default_factory=list, repr=False)
+    # 运行中任务的asyncio.Task，用于取消
+    handle: Optional[asyncio.Task] = field(default=None, repr=False)
+
+    def to_dict(self) -> Dict:
+        return {
+            "task_id": self.task_id,
+            "user_id": self.user_id,
+            "status": self.status,
+            "result": self.result,
+            "error": self.error,
+            "submitted_at": self.submitted_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at
+        }
+
+    def publish(self, token: Optional[str]):
+        for queue in self.listeners:
+            queue.put_nowait(token)
+
+
+class TaskScheduler:
+    """多用户任务调度器
+
+    - 全局最多同时运行 max_concurrency 个任务
+    - 每个用户最多同时运行 per_user_concurrency 个任务（同一个Agent的对话记忆不支持并发写入，默认为1）
+    - 各用户的任务在各自队列中排队，调度时按用户轮转，一个用户的长任务不会饿死其他用户
+    - 排队任务总数超过 max_queue_size 或单个用户超过 max_user_queue_size 时拒绝提交
+    """
+
+    def __init__(
+            self,
+            max_concurrency: int = 8,
+            per_user_concurrency: int = 1,
+            max_queue_size: int = 200,
+            max_user_queue_size: int = 20,
+            max_task_records: int = 10000
+    ):
+        self.max_concurrency = max_concurrency
+        self.per_user_concurrency = per_user_concurrency
+        self.max_queue_size = max_queue_size
+        self.max_user_queue_size = max_user_queue_size
+
+        # 只保留最近的任务记录供查询
+        self.tasks: LRURegistry = LRURegistry(max_size=max_task_records)
+        self._queues: Dict[str, Deque[TaskRecord]] = {}
+        self._user_order: Deque[str] = deque()
+        self._running: Dict[str, int] = {}
+        self._queued = 0
+        self._cond = asyncio.Condition()
+        self._workers: List[asyncio.Task] = []
+
+    async def submit(self, user_id: str, query: str, filename: str = "") -> TaskRecord:
+        """提交任务
+
+        Raises:
+            QueueFullError: 队列已满
+            FileNotFoundError: 待处理文件不存在
+        """
+        async with self._cond:
+            self._check_capacity(user_id)
+
+        # 创建工作目录、拷贝文件是磁盘IO，在线程中进行，不持有锁，也不阻塞事件循环
+        task_input = await asyncio.to_thread(prepare_task, user_id, query, filename)
+
+        async with self._cond:
+            # 准备期间队列可能已被其他请求占满
+            self._check_capacity(user_id)
+            record = TaskRecord(task_id=task_input["task_id"], user_id=user_id, task_input=task_input)
+            self.tasks[record.task_id] = record
+
+            if user_id not in self._queues:
+                self._queues[user_id] = deque()
+                self._user_order.append(user_id)
+            self._queues[user_id].append(record)
+            self._queued += 1
+            self._cond.notify()
+
+        return record
+
+    def _check_capacity(self, user_id: str):
+        """检查是否还能排队，需持有锁"""
+        if self._queued >= self.max_queue_size:
+            raise QueueFullError("任务队列已满，请稍后重试")
+        if len(self._queues.get(user_id, ())) >= self.max_user_queue_size:
+            raise QueueFullError(f"用户 {user_id} 排队的任务过多，请稍后重试")
+
+    def _next_record(self) -> Optional[TaskRecord]:
+        """按用户轮转取出下一个可以运行的任务，需持有锁"""
+        for _ in range(len(self._user_order)):
+            user_id = self._user_order[0]
+            self._user_order.rotate(-1)
+
+            queue = self._queues[user_id]
+            if queue and self._running.get(user_id, 0) < self.per_user_concurrency:
+                record = queue.popleft()
+                if not queue:
+                    del self._queues[user_id]
+                    self._user_order.remove(user_id)
+                return record
+        return None
+
+    async def _worker(self):
+        while True:
+            async with self._cond:
+                record = self._next_record()
+                while record is None:
+                    await self._cond.wait()
+                    record = self._next_record()
+                self._queued -= 1
+                self._running[record.user_id] = self._running.get(record.user_id, 0) + 1
+
+            # 任务在单独的Task中运行，取消任务时不影响worker
+            record.handle = asyncio.create_task(self._run(record))
+            try:
+                await asyncio.wait([record.handle])
+                if record.finished_at is None:
+                    # 在开始运行之前就被取消
+                    record.status = "cancelled"
+                    record.error = "任务已取消"
+                    record.finished_at = time.time()
+                    record.publish(None)
+            except asyncio.CancelledError:
+                record.handle.cancel()
+                raise
+            finally:
+                async with self._cond:
+                    self._running[record.user_id] -= 1
+                    if not self._running[record.user_id]:
+                        del self._running[record.user_id]
+                    # 该用户空出了并发名额，唤醒等待的worker
+                    self._cond.notify_all()
+
+    async def _run(self, record: TaskRecord):
+        record.status = "running"
+        record.started_at = time.time()
+        try:
+            # 创建Agent时可能淘汰其他Agent并停止容器，在线程中进行，不阻塞事件循环
+            agent = await asyncio.to_thread(get_agent, record.user_id)
+            # 流式执行，回答边生成边推送给订阅者
+            async for token in astream_task(agent, record.task_input):
+                record.result += token
+                record.publish(token)
+            record.status = "done"
+        except asyncio.CancelledError:
+            # 取消会传递到正在执行的工具，容器内的进程随之结束
+            record.error = "任务已取消"
+            record.status = "cancelled"
+            raise
+        except Exception as e:
+            record.error = str(e)
+            record.status = "failed"
+        finally:
+            record.finished_at = time.time()
+            record.publish(None)
+
+    async def cancel(self, task_id: str) -> bool:
+        """取消排队中或运行中的任务，任务不存在或已经结束时返回False"""
+        record = self.tasks.get(task_id)
+        if record is None:
+            return False
+
+        async with self._cond:
+            queue = self._queues.get(record.user_id)
+            if record.status == "queued" and queue and record in queue:
+                queue.remove(record)
+                self._queued -= 1
+                if not queue:
+                    del self._queues[record.user_id]
+                    self._user_order.remove(record.user_id)
+                record.status = "cancelled"
+                record.error = "任务已取消"
+                record.finished_at = time.time()
+                record.publish(None)
+                return True
+
+        if record.handle is not None and not record.handle.done():
+            record.handle.cancel()
+            return True
+        return False
+
+    def start(self):
+        """启动 max_concurrency 个worker"""
+        for _ in range(self.max_concurrency):
+            self._workers.append(asyncio.create_task(self._worker()))
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def stats(self) -> Dict:
+        return {
+            "queued": self._queued,
+            "running": sum(self._running.values()),
+            "running_by_user": dict(self._running),
+            "max_concurrency": self.max_concurrency,
+            "per_user_concurrency": self.per_user_concurrency,
+            "max_queue_size": self.max_queue_size
+        }
+
+
+async def handle_submit(request: web.Request) -> web.Response:
+    """POST /tasks  {"user_id": "...", "task": "...", "filename": "..."}"""
+    scheduler: TaskScheduler = request.app["scheduler"]
+    try:
+        body = await request.json()
+    except ValueError:
+        return web.json_response({"error": "请求体需要是JSON"}, status=400)
+
+    user_id = str(body.get("user_id") or "default")
+    query = str(body.get("task") or "").strip()
+    if not query:
+        return web.json_response({"error": "缺少task字段"}, status=400)
+
+    try:
+        record = await scheduler.submit(user_id, query, str(body.get("filename") or ""))
+    except QueueFullError as e:
+        # 队列满时返回429，由调用方退避重试
+        return web.json_response({"error": str(e)}, status=429, headers={"Retry-After": "5"})
+    except FileNotFoundError as e:
+        return web.json_response({"error": str(e)}, status=400)
+
+    return web.json_response(record.to_dict(), status=202)
+
+
+async def handle_get_task(request: web.Request) -> web.Response:
+    """GET /tasks/{task_id}"""
+    scheduler: TaskScheduler = request.app["scheduler"]
+    record = scheduler.tasks.get(request.match_info["task_id"])
+    if record is None:
+        return web.json_response({"error": "任务不存在"}, status=404)
+    return web.json_response(record.to_dict())
+
+
+async def handle_stream_task(request: web.Request) -> web.StreamResponse:
+    """GET /tasks/{task_id}/stream  以Server-Sent Events推送任务回答"""
+    scheduler: TaskScheduler = request.app["scheduler"]
+    record = scheduler.tasks.get(request.match_info["task_id"])
+    if record is None:
+        return web.json_response({"error": "任务不存在"}, status=404)
+
+    response = web.StreamResponse(headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache"})
+    await response.prepare(request)
+
+    # 先登记订阅再取已生成的内容，两步之间没有await，不会漏掉片段
+    queue: asyncio.Queue = asyncio.Queue()
+    finished = record.status in ("done", "failed", "cancelled")
+    if not finished:
+        record.listeners.append(queue)
+    generated = record.result
+
+    try:
+        if generated:
+            await response.write(f"data: {json.dumps(generated, ensure_ascii=False)}\n\n".encode("utf-8"))
+        while not finished:
+            token = await queue.get()
+            if token is None:
+                break
+            await response.write(f"data: {json.dumps(token, ensure_ascii=False)}\n\n".encode("utf-8"))
+        await response.write(f"event: end\ndata: {json.dumps(record.to_dict(), ensure_ascii=False)}\n\n".encode("utf-8"))
+    finally:
+        if queue in record.listeners:
+            record.listeners.remove(queue)
+
+    return response
+
+
+async def handle_cancel_task(request: web.Request) -> web.Response:
+    """DELETE /tasks/{task_id}  取消任务，正在执行的代码会被中断"""
+    scheduler: TaskScheduler = request.app["scheduler"]
+    task_id = request.match_info["task_id"]
+    if scheduler.tasks.get(task_id) is None:
+        return web.json_response({"error": "任务不存在"}, status=404)
+    if not await scheduler.cancel(task_id):
+        return web.json_response({"error": "任务已经结束"}, status=409)
+    return web.json_response({"cancelled": task_id}, status=202)
+
+
+async def handle_close_user(request: web.Request) -> web.Response:
+    """DELETE /users/{user_id}  关闭用户的Agent和容器"""
+    # 停止容器可能需要数秒，在线程中进行
+    await asyncio.to_thread(close_agent, request.match_info["user_id"])
+    return web.json_response({"closed": request.match_info["user_id"]})
+
+
+async def handle_stats(request: web.Request) -> web.Response:
+    """GET /stats"""
+    scheduler: TaskScheduler = request.app["scheduler"]
+    return web.json_response({
+        "scheduler": scheduler.stats(),
+        **get_registry_metrics()
+    })
+
+
+def create_app(
+        max_concurrency: int = 8,
+        per_user_concurrency: int = 1,
+        max_queue_size: int = 200,
+        max_user_queue_size: int = 20
+) -> web.Application:
+    """创建Agent服务"""
+    app = web.Application()
+    app["scheduler"] = TaskScheduler(
+        max_concurrency=max_concurrency,
+        per_user_concurrency=per_user_concurrency,
+        max_queue_size=max_queue_size,
+        max_user_queue_size=max_user_queue_size
+    )
+
+    async def evict_loop():
+        # 定期淘汰空闲过期的Agent，并停止它们的容器
+        while True:
+            await asyncio.sleep(EVICT_INTERVAL)
+            await asyncio.to_thread(evict_expired_agents)
+
+    async def on_startup(app: web.Application):
+        # 提前构建执行容器的快照镜像并启动回收线程，空闲容器在用户第一次租用后按用户预热
+        get_container_pool()
+        get_browser_pool()
+        app["scheduler"].start()
+        app["evict_task"] = asyncio.create_task(evict_loop())
+
+    async def on_cleanup(app: web.Application):
+        app["evict_task"].cancel()
+        await app["scheduler"].stop()
+        await asyncio.to_thread(close_all_agents)
+        await aclose_llm_clients()
+        await aclose_crawler_sessions()
+
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+
+    app.router.add_post("/tasks", handle_submit)
+    app.router.add_get("/tasks/{task_id}", handle_get_task)
+    app.router.add_get("/tasks/{task_id}/stream", handle_stream_task)
+    app.router.add_delete("/tasks/{task_id}", handle_cancel_task)
+    app.router.add_delete("/users/{user_id}", handle_close_user)
+    app.router.add_get("/stats", handle_stats)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Agent服务')
+    parser.add_argument('--host', type=str, default='0.0.0.0', help='监听地址')
+    parser.add_argument('--port', type=int, default=8000, help='监听端口')
+    parser.add_argument('--max-concurrency', type=int, default=8, help='全局最大并发任务数')
+    parser.add_argument('--per-user-concurrency', type=int, default=1, help='每个用户最大并发任务数')
+    parser.add_argument('--max-queue-size', type=int, default=200, help='全局最大排队任务数')
+    parser.add_argument('--max-user-queue-size', type=int, default=20, help='每个用户最大排队任务数')
+    args = parser.parse_args()
+
+    app = create_app(
+        max_concurrency=args.max_concurrency,
+        per_user_concurrency=args.per_user_concurrency,
+        max_queue_size=args.max_queue_size,
+        max_user_queue_size=args.max_user_queue_size
+    )
+    web.run_app(app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""浏览器任务的启动耗时：导入耗时，以及冷启动/复用已启动浏览器时到第一个浏览器操作完成的耗时
+
+需要在浏览器变体的容器中运行（依赖 browser_use 和 Chromium）:
+    docker run --rm -v "$PWD/benchmarks:/bench" --entrypoint python python_code_executor:3.11-browser \\
+        /bench/bench_browser_startup.py [--repeat 5] [--url about:blank]
+
+导入耗时在新的解释器进程中测量，与每次 browser_executor 调用启动命令时的开销一致。
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# 容器中 agent_browser.py 位于 /app，在仓库中运行时位于 docker_image
+AGENT_DIR = next(path for path in [
+    "/app",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "docker_image")
+] if os.path.exists(os.path.join(path, "agent_browser.py")))
+sys.path.insert(0, AGENT_DIR)
+
+# 在新进程中执行的启动步骤：名称 -> 代码
+IMPORT_CASES = {
+    "client --help": "import runpy, sys; sys.argv = ['browser_client.py', '--help']; "
+                     "runpy.run_path('browser_client.py', run_name='__main__')",
+    "import agent_browser": "import agent_browser",
+    "+ browser_use": "import agent_browser, browser_use",
+    "+ model client": "import agent_browser, browser_use; agent_browser.get_llm('gpt-4o-mini')",
+}
+
+
+def time_process(code: str, repeat: int) -> list:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], cwd=AGENT_DIR, stdout=subprocess.DEVNULL,
+                       stderr=subprocess.DEVNULL, env={**os.environ, "OPENAI_API_KEY": os.getenv("OPENAI_API_KEY", "x")})
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+async def first_action(browser, url: str):
+    """新建上下文并打开页面，即代理执行任务时的第一个浏览器操作"""
+    context = await browser.new_context()
+    try:
+        page = await context.get_current_page()
+        await page.goto(url)
+    finally:
+        await context.close()
+
+
+async def time_browser(url: str, repeat: int):
+    from agent_browser import new_browser
+
+    cold = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        browser = new_browser()
+        try:
+            await first_action(browser, url)
+            cold.append(time.perf_counter() - start)
+        finally:
+            await browser.close()
+
+    # 复用已启动的浏览器，与 browser_worker.py 的浏览器池一致
+    warm = []
+    browser = new_browser()
+    try:
+        await browser.get_playwright_browser()
+        for _ in range(repeat):
+            start = time.perf_counter()
+            await first_action(browser, url)
+            warm.append(time.perf_counter() - start)
+    finally:
+        await browser.close()
+    return cold, warm
+
+
+def report(name: str, timings: list):
+    print(f"{name:<32}{statistics.median(timings) * 1000:>12.0f}{min(timings) * 1000:>12.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="浏览器任务启动耗时基准测试")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--url", default="about:blank")
+    args = parser.parse_args()
+
+    print(f"{'step':<32}{'median ms':>12}{'min ms':>12}")
+    for name, code in IMPORT_CASES.items():
+        report(name, time_process(code, args.repeat))
+
+    cold, warm = asyncio.run(time_browser(args.url, args.repeat))
+    report("first action (cold browser)", cold)
+    report("first action (warm browser)", warm)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""比较各执行镜像变体的镜像大小、启动到第一次执行完成的耗时和空闲内存占用
+
+用法:
+    python benchmarks/bench_executor_image.py [--images python_code_executor:3.11 python_code_executor:3.11-browser]
+                                              [--repeat 5]
+
+第一次执行的耗时从 containers.run 开始计时，包括等待就绪文件（见 DockerContainer.wait_ready）
+和执行一段 print 的时间，与执行工具租用冷启动容器时的等待时间一致。
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+
+import docker
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from docker_container import DockerContainer  # noqa: E402
+
+DEFAULT_IMAGES = ["python_code_executor:3.11", "python_code_executor:3.11-browser"]
+
+
+def first_exec(image: str, work_dir: str):
+    """启动一个容器并执行一次代码，返回 (耗时秒, 空闲时的内存占用字节)"""
+    container = DockerContainer(
+        image=image,
+        container_name=f"bench-executor-{str(uuid.uuid4())[:8]}",
+        base_work_dir=work_dir,
+        container_dir="/workspace",
+        vnc_port=None,
+        headless=True,
+        use_kernel=False
+    )
+    start_time = time.perf_counter()
+    try:
+        container.start()
+        exit_code, output = container.container.exec_run(["python", "-c", "print('ready')"])
+        elapsed = time.perf_counter() - start_time
+        if exit_code != 0:
+            raise RuntimeError(output.decode("utf-8", errors="replace"))
+
+        # 等后台服务（浏览器变体的VNC）启动完成后再统计内存
+        time.sleep(3)
+        stats = container.container.stats(stream=False)
+        memory = stats.get("memory_stats", {}).get("usage", 0)
+        return elapsed, memory
+    finally:
+        container.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="执行镜像变体基准测试")
+    parser.add_argument("--images", nargs="+", default=DEFAULT_IMAGES)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    client = docker.from_env()
+    work_dir = tempfile.mkdtemp(prefix="bench-executor-")
+    print(f"{'image':<40}{'size MB':>10}{'first exec s':>15}{'min s':>10}{'idle mem MB':>14}")
+
+    for image in args.images:
+        try:
+            size = client.images.get(image).attrs["Size"]
+        except docker.errors.ImageNotFound:
+            print(f"{image:<40}{'镜像不存在':>10}")
+            continue
+
+        timings, memories = [], []
+        for _ in range(args.repeat):
+            elapsed, memory = first_exec(image, work_dir)
+            timings.append(elapsed)
+            memories.append(memory)
+
+        print(f"{image:<40}{size / 1024 / 1024:>10.0f}{statistics.median(timings):>15.2f}"
+              f"{min(timings):>10.2f}{statistics.median(memories) / 1024 / 1024:>14.0f}")
+
+
+if __name__ == "__main__":
+    main()
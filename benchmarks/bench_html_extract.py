@@ -0,0 +1,76 @@
+"""比较各正文提取后端的速度，并检查输出是否一致
+
+用法:
+    python benchmarks/bench_html_extract.py [--repeat 20] [--scale 50] [--fixtures DIR]
+
+--scale 将每个样例页面的<body>内容重复多次，模拟大页面。
+malformed_ 开头的样例是不规范的HTML，各后端的结果可能不同，只列出差异，不算作失败。
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from html_extractors import EXTRACTORS  # noqa: E402
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+# 不规范HTML样例的文件名前缀
+MALFORMED_PREFIX = "malformed_"
+
+
+def load_fixtures(fixtures_dir: str, scale: int):
+    pages = []
+    for name in sorted(os.listdir(fixtures_dir)):
+        if not name.endswith(".html"):
+            continue
+        with open(os.path.join(fixtures_dir, name), "r", encoding="utf-8") as f:
+            html = f.read()
+        if scale > 1:
+            start = html.find(">", html.find("<body")) + 1
+            end = html.rfind("</body>")
+            html = html[:end] + html[start:end] * (scale - 1) + html[end:]
+        pages.append((name, html))
+    return pages
+
+
+def timeit(extract, html: str, repeat: int) -> float:
+    """返回单次提取的最短耗时（毫秒）"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        extract(html)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="正文提取后端基准测试")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--scale", type=int, default=1)
+    parser.add_argument("--fixtures", default=FIXTURES_DIR)
+    args = parser.parse_args()
+
+    backends = list(EXTRACTORS)
+    print(f"{'fixture':<28}{'KB':>8}" + "".join(f"{name + ' ms':>12}" for name in backends)
+          + f"{'speedup':>10}{'equal':>8}")
+
+    mismatches = 0
+    for name, html in load_fixtures(args.fixtures, args.scale):
+        outputs = {backend: EXTRACTORS[backend](html) for backend in backends}
+        timings = {backend: timeit(EXTRACTORS[backend], html, args.repeat) for backend in backends}
+        equal = len(set(outputs.values())) == 1
+        malformed = name.startswith(MALFORMED_PREFIX)
+        mismatches += not equal and not malformed
+        print(f"{name:<28}{len(html.encode('utf-8')) / 1024:>8.1f}"
+              + "".join(f"{timings[backend]:>12.2f}" for backend in backends)
+              + f"{timings['bs4'] / timings['lxml']:>9.1f}x{'yes' if equal else ('diff' if malformed else 'NO'):>8}")
+
+    if mismatches:
+        print(f"\n{mismatches} 个样例的提取结果不一致")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
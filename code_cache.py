@@ -0,0 +1,129 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from typing import Dict, Optional
+from registry import LRURegistry
+
+
+def normalize_text(text: Optional[str]) -> str:
+    """规范化文本：去掉首尾空白并合并连续空白，避免仅空白不同的请求无法命中缓存"""
+    return re.sub(r"\s+", " ", (text or "").strip())
+
+
+class CodeCache:
+    """生成代码的内容寻址缓存
+
+    缓存键为 (提示词模板, 任务描述, 额外上下文, 模型名) 规范化后的sha256，
+    不包含用户ID和任务ID，不同用户、不同任务的相同请求可以共用结果。
+
+    - 内存层：LRU，最多 max_entries 条
+    - 磁盘层：cache_dir 下每个键一个JSON文件，进程重启后仍然可用
+    - 两层都按写入时间计算，超过 ttl 秒过期。内存层的条目记录写入时间，经常命中的条目也会过期
+    """
+
+    def __init__(
+            self,
+            cache_dir: str,
+            max_entries: int = 256,
+            ttl: float = 7 * 24 * 3600,
+            enabled: bool = True
+    ):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.enabled = enabled
+        # 键 -> (写入时间, 代码)。LRURegistry的ttl按最近访问时间计算，只用于淘汰不再使用的条目
+        self._memory = LRURegistry(max_size=max_entries, ttl=ttl)
+        self.stats: Dict[str, int] = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "writes": 0}
+
+    @staticmethod
+    def make_key(prompt_template: str, task_description: str, additional_context: str, model: str) -> str:
+        payload = json.dumps([
+            normalize_text(prompt_template),
+            normalize_text(task_description),
+            normalize_text(additional_context),
+            model
+        ], ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def get(self, key: str) -> Optional[str]:
+        """读取缓存的代码，未命中返回None"""
+        if not self.enabled:
+            return None
+
+        cached = self._memory.get(key)
+        if cached is not None:
+            created_at, code = cached
+            if time.time() - created_at <= self.ttl:
+                self.stats["memory_hits"] += 1
+                return code
+            self._memory.pop(key)
+
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            self.stats["misses"] += 1
+            return None
+
+        if time.time() - entry.get("created_at", 0) > self.ttl:
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+            self.stats["misses"] += 1
+            return None
+
+        self.stats["disk_hits"] += 1
+        self._memory[key] = (entry["created_at"], entry["code"])
+        return entry["code"]
+
+    def set(self, key: str, code: str, model: str = ""):
+        """写入缓存，空代码不缓存"""
+        if not self.enabled or not code:
+            return
+
+        created_at = time.time()
+        self._memory[key] = (created_at, code)
+
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # 先写临时文件再替换，避免并发读到写了一半的文件。同一进程的多个线程可能同时写同一个键，
+            # 临时文件名带上线程ID
+            temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump({"created_at": created_at, "model": model, "code": code}, f, ensure_ascii=False)
+            os.replace(temp_path, path)
+            self.stats["writes"] += 1
+        except OSError as e:
+            print(f"写入代码缓存失败: {str(e)}")
+
+    def delete(self, key: str):
+        """删除缓存的代码，如执行出错的代码"""
+        self._memory.pop(key)
+        try:
+            os.unlink(self._path(key))
+        except OSError:
+            pass
+
+    def purge_expired(self) -> int:
+        """删除磁盘上过期的缓存文件，返回删除数量"""
+        removed = 0
+        now = time.time()
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    if now - os.path.getmtime(path) > self.ttl:
+                        os.unlink(path)
+                        removed += 1
+                except OSError:
+                    pass
+        return removed
@@ -0,0 +1,243 @@
+import ast
+import json
+import sys
+import threading
+import weakref
+from typing import Dict, List, Optional, Set
+from docker_container import DockerContainer
+from package_cache import CONTAINER_WHEELHOUSE, PackageCache
+
+# 执行容器中的Python版本（docker_image/Dockerfile 的基础镜像）。宿主机版本更低时，
+# 宿主机解析失败的代码可能使用了新语法（如 match、except*），改为在容器中检查语法
+CONTAINER_PYTHON_VERSION = (3, 11)
+# 在容器中检查语法时代码通过命令行参数传入，单个参数的长度有上限，超过时不检查
+CONTAINER_SYNTAX_MAX_BYTES = 100 * 1024
+
+# 导入名与pip包名不同的常见包
+MODULE_PACKAGES = {
+    "bs4": "beautifulsoup4",
+    "cv2": "opencv-python-headless",
+    "dateutil": "python-dateutil",
+    "docx": "python-docx",
+    "fitz": "pymupdf",
+    "pptx": "python-pptx",
+    "PIL": "pillow",
+    "sklearn": "scikit-learn",
+    "skimage": "scikit-image",
+    "yaml": "pyyaml",
+    "Crypto": "pycryptodome",
+    "dotenv": "python-dotenv",
+}
+
+# 列出容器中可导入的顶层模块：内置模块，以及 sys.path 下的模块文件和目录（包括没有 __init__.py 的命名空间包）
+LIST_MODULES_SOURCE = """\
+import inspect, json, os, sys
+names = set(sys.builtin_module_names)
+for path in sys.path:
+    # 空路径为当前目录，其中的模块只在该目录可导入，不列出
+    if not path:
+        continue
+    try:
+        entries = os.listdir(path)
+    except OSError:
+        continue
+    for entry in entries:
+        name = inspect.getmodulename(entry)
+        if name is None and "." not in entry and os.path.isdir(os.path.join(path, entry)):
+            name = entry
+        if name and name.isidentifier():
+            names.add(name)
+print(json.dumps(sorted(names)))
+"""
+
+# 确认模块是否可导入，在任务目录中执行，任务目录下的文件也可导入；同时返回其中来自任务目录的模块
+FIND_MODULES_SOURCE = """\
+import importlib.util, json, os, sys
+sys.path.insert(0, os.getcwd())
+missing, local = [], []
+for name in sys.argv[1:]:
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        missing.append(name)
+    elif (spec.origin or "").startswith(os.getcwd()) or any(path.startswith(os.getcwd()) for path in spec.submodule_search_locations or []):
+        local.append(name)
+print(json.dumps({"missing": missing, "local": local}))
+"""
+
+# 在容器中检查语法，错误信息格式与 syntax_error 相同
+SYNTAX_CHECK_SOURCE = """\
+import ast, json, sys
+try:
+    ast.parse(sys.argv[1], "<cell>", "exec")
+    error = None
+except SyntaxError as e:
+    location = f'  File "<cell>", line {e.lineno}\\n' if e.lineno else ""
+    text = f"    {e.text.rstrip()}\\n" if e.text else ""
+    error = f"{location}{text}{type(e).__name__}: {e.msg}"
+print(json.dumps({"error": error}))
+"""
+
+
+def syntax_error(code: str) -> Optional[str]:
+    """代码的语法错误，格式与Python的报错一致；没有错误时返回None"""
+    try:
+        ast.parse(code, "<cell>", "exec")
+    except SyntaxError as e:
+        location = f'  File "<cell>", line {e.lineno}\n' if e.lineno else ""
+        text = f"    {e.text.rstrip()}\n" if e.text else ""
+        return f"{location}{text}{type(e).__name__}: {e.msg}"
+    return None
+
+
+def _collect_imports(statements: List[ast.stmt], modules: List[str]):
+    for node in statements:
+        if isinstance(node, ast.Import):
+            names = [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+            names = [node.module]
+        elif isinstance(node, (ast.With, ast.AsyncWith, ast.ClassDef)):
+            # with 和类定义的主体一定会执行
+            _collect_imports(node.body, modules)
+            continue
+        else:
+            continue
+        for name in names:
+            module = name.split(".", 1)[0]
+            if module not in modules:
+                modules.append(module)
+
+
+def imported_modules(code: str) -> List[str]:
+    """代码执行时一定会导入的顶层模块名，按出现顺序
+
+    只收集模块顶层（包括 with 和类定义主体中）的绝对导入。if / try 中的导入可能不执行或有备选方案，
+    函数中的导入可能不会被调用，都不检查，缺失时由实际执行报错。
+    """
+    modules: List[str] = []
+    _collect_imports(ast.parse(code, "<cell>", "exec").body, modules)
+    return modules
+
+
+class CodePreflight:
+    """在容器中执行Python代码之前的检查
+
+    - 语法错误：解析失败时直接返回错误，不租用容器、不执行。宿主机的Python比容器旧时，
+      宿主机解析失败的代码改为在容器中检查，避免拦截新语法
+    - 缺失的模块：代码一定会导入的模块与容器中可导入的模块比对，本地wheel仓库中有对应的包时自动安装，
+      没有时直接返回 ModuleNotFoundError，不执行代码
+
+    每个容器可导入的模块列出一次后缓存，导入的模块不在缓存中时再到容器中逐个确认
+    （可能是之后安装的包或任务目录下的文件）。
+    """
+
+    def __init__(self, package_cache: Optional[PackageCache] = None, auto_install: bool = True):
+        self.package_cache = package_cache
+        self.auto_install = auto_install and package_cache is not None
+        self._modules: "weakref.WeakKeyDictionary[DockerContainer, Set[str]]" = weakref.WeakKeyDictionary()
+        self._stats = {"checked": 0, "syntax_errors": 0, "missing_modules": 0, "installed": 0, "saved_executions": 0}
+        self._lock = threading.Lock()
+
+    def _count(self, name: str, value: int = 1):
+        with self._lock:
+            self._stats[name] += value
+
+    def _syntax_failed(self, error: str) -> str:
+        self._count("syntax_errors")
+        self._count("saved_executions")
+        return error
+
+    def check_syntax(self, code: str) -> Optional[str]:
+        """在宿主机上检查语法，有错误时返回错误信息
+
+        宿主机的Python比容器旧时不在这里拦截，由 check_imports 在容器中检查
+        """
+        self._count("checked")
+        error = syntax_error(DockerContainer._strip_markdown(code))
+        if error is None or sys.version_info[:2] < CONTAINER_PYTHON_VERSION:
+            return None
+        return self._syntax_failed(error)
+
+    def _container_syntax_error(self, container: DockerContainer, code: str) -> Optional[str]:
+        if len(code.encode("utf-8")) > CONTAINER_SYNTAX_MAX_BYTES:
+            return None
+        return self._exec_json(container, ["python", "-c", SYNTAX_CHECK_SOURCE, code])["error"]
+
+    @staticmethod
+    def _exec_json(container: DockerContainer, cmd: List[str], workdir: Optional[str] = None):
+        exit_code, output = container.container.exec_run(cmd, workdir=workdir or container.exec_workdir)
+        if exit_code != 0:
+            raise RuntimeError(output.decode("utf-8", errors="replace"))
+        return json.loads(output.decode("utf-8").strip().splitlines()[-1])
+
+    def _installed_modules(self, container: DockerContainer) -> Set[str]:
+        modules = self._modules.get(container)
+        if modules is None:
+            modules = set(self._exec_json(container, ["python", "-c", LIST_MODULES_SOURCE]))
+            self._modules[container] = modules
+        return modules
+
+    def _find_missing(self, container: DockerContainer, modules: List[str], workdir: Optional[str]) -> List[str]:
+        result = self._exec_json(container, ["python", "-c", FIND_MODULES_SOURCE, *modules], workdir)
+        # 之后安装的包加入缓存，任务目录下的模块只在该目录中可导入，不缓存
+        self._installed_modules(container).update(set(modules) - set(result["missing"]) - set(result["local"]))
+        return result["missing"]
+
+    def _install(self, container: DockerContainer, modules: List[str]) -> List[str]:
+        """从本地wheel仓库安装缺失模块对应的包，不访问网络，返回安装成功的模块"""
+        packages = {module: MODULE_PACKAGES.get(module, module) for module in modules}
+        packages = {module: package for module, package in packages.items() if self.package_cache.has_wheel(package)}
+        if not packages:
+            return []
+
+        print(f"执行前从本地wheel仓库安装: {', '.join(packages.values())}")
+        exit_code, output = container.container.exec_run(
+            ["python", "-m", "pip", "install", "--quiet", "--no-index", "--find-links", CONTAINER_WHEELHOUSE,
+             *packages.values()])
+        if exit_code != 0:
+            print(f"从本地wheel仓库安装失败: {output.decode('utf-8', errors='replace')}")
+            return []
+
+        self.package_cache.record(list(packages.values()))
+        self._count("installed", len(packages))
+        installed = list(packages)
+        self._installed_modules(container).update(installed)
+        return installed
+
+    def check_imports(self, container: DockerContainer, code: str, work_dir: Optional[str] = None) -> Optional[str]:
+        """检查代码导入的模块在容器中是否都可导入，缺失时尝试自动安装，仍然缺失时返回错误信息
+
+        检查本身出错（如容器中执行命令失败）时不拦截，交给实际执行
+        """
+        code = DockerContainer._strip_markdown(code)
+        try:
+            try:
+                modules = imported_modules(code)
+            except SyntaxError:
+                # 宿主机无法解析（check_syntax 没有拦截，说明宿主机的Python比容器旧），用容器的解释器检查
+                error = self._container_syntax_error(container, code)
+                return self._syntax_failed(error) if error else None
+            installed = self._installed_modules(container)
+            unknown = [module for module in modules if module not in installed]
+            if not unknown:
+                return None
+
+            workdir = container.container_path(work_dir) if work_dir else None
+            missing = self._find_missing(container, unknown, workdir)
+            if missing and self.auto_install:
+                installed_now = self._install(container, missing)
+                missing = [module for module in missing if module not in installed_now]
+        except Exception as e:
+            print(f"执行前检查导入失败，跳过: {str(e)}")
+            return None
+
+        if not missing:
+            return None
+        self._count("missing_modules", len(missing))
+        self._count("saved_executions")
+        packages = " ".join(MODULE_PACKAGES.get(module, module) for module in missing)
+        return "\n".join(f"ModuleNotFoundError: No module named '{module}'" for module in missing) + \
+            f"\n（执行前检查发现，代码未执行。请先用shell执行 pip install {packages} 安装后再执行）"
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._stats)
@@ -0,0 +1,403 @@
+import os
+import asyncio
+import hashlib
+import threading
+import time
+import uuid
+import docker
+from contextlib import contextmanager
+from docker.utils import parse_repository_tag
+from typing import Dict, List, Optional
+from docker_container import DockerContainer
+
+# 提交快照前清理的文件：Xvfb的锁文件留在快照中会导致新容器的Xvfb无法启动，
+# 就绪文件留在快照中会让新容器在启动完成之前就被当作已就绪
+SNAPSHOT_CLEANUP = "rm -rf /tmp/.X99-lock /tmp/.X11-unix/X99 /tmp/executor-ready /root/.cache/pip"
+
+
+class ContainerPool:
+    """预热的执行容器池
+
+    每个容器只挂载一个用户的目录（base_work_dir/用户ID），用户之间看不到彼此的文件。
+    挂载只能在创建容器时指定，因此空闲容器按用户预热：用户租用容器后，在后台为该用户补充
+    min_idle 个已经启动完成的空闲容器，该用户之后的任务直接租用，不再临时执行 containers.run
+    以及启动脚本中的启动流程。用户的第一个容器需要冷启动。
+
+    - 租约按 用户ID(/任务ID) 区分，同一个键重复租用得到同一个容器。isolation 为 "task" 时
+      每个任务租用独立的容器（沙箱），同一用户的多个任务不共享安装的包和内核状态，可以并行执行；
+      同一用户的任务目录都在挂载的用户目录中
+    - 租约和用户的空闲容器空闲超过 idle_timeout 秒后由后台线程回收，正在执行（using）的租约不回收
+    - 空闲容器与已租出容器的总数不超过 max_size
+    - 归还的容器直接停止销毁，不会再租给其他用户或任务，避免状态泄露
+
+    提供 snapshot_commands 时，先用基础镜像启动一个容器执行这些命令（预先导入常用库、
+    生成字体缓存等），再提交为快照镜像，之后池中的容器都从快照创建。快照与基础镜像共享
+    镜像层，新容器只多一层写时复制层，每个任务一个容器的额外开销很小。
+    """
+
+    def __init__(
+            self,
+            image: str = "python_code_executor:3.11",
+            base_work_dir: str = "",
+            container_dir: str = "",
+            min_idle: int = 2,
+            max_size: int = 10,
+            idle_timeout: float = 600,
+            name_prefix: str = "llamaindex-executor",
+            isolation: str = "user",
+            snapshot_commands: Optional[List[str]] = None,
+            **container_options
+    ):
+        self.image = image
+        self.base_work_dir = base_work_dir
+        self.container_dir = container_dir
+        self.min_idle = min_idle
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.name_prefix = name_prefix
+        # 租约隔离粒度："user" 同一用户的任务共用一个容器，"task" 每个任务一个容器
+        self.isolation = isolation
+        # 构建快照镜像时执行的命令，None表示直接使用基础镜像
+        self.snapshot_commands = snapshot_commands
+        self.snapshot_image: Optional[str] = None
+        self._snapshot_lock = threading.Lock()
+        # 透传给DockerContainer的其他参数，如headless、use_kernel
+        self.container_options = container_options
+
+        # 用户ID -> 该用户的空闲容器，以及该用户最近一次租用的时间
+        self._idle: Dict[str, List[DockerContainer]] = {}
+        self._idle_used: Dict[str, float] = {}
+        self._leases: Dict[str, DockerContainer] = {}
+        self._last_used: Dict[str, float] = {}
+        # 租约键 -> 正在进行的执行数，大于0的租约不会被空闲回收
+        self._in_use: Dict[str, int] = {}
+        self._starting = 0
+        # 用户ID -> 正在为该用户预热的容器数
+        self._warming: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        self._reaper: Optional[threading.Thread] = None
+
+    def lease_key(self, user_id: str, task_id: str = "") -> str:
+        """生成租约键，按任务隔离时为 用户ID/任务ID，否则为用户ID"""
+        if self.isolation == "task" and task_id:
+            return f"{user_id}/{task_id}"
+        return user_id
+
+    @staticmethod
+    def _check_name(name: str, kind: str):
+        """用户ID和任务ID用作目录名，只能是单级目录名，避免挂载到其他用户的目录"""
+        if name in ("", ".", "..") or "/" in name or "\\" in name:
+            raise ValueError(f"无效的{kind}: {name!r}")
+
+    def _user_dir(self, user_id: str) -> str:
+        """用户在宿主机上的目录，即该用户的容器挂载的目录"""
+        self._check_name(user_id, "用户ID")
+        return os.path.join(self.base_work_dir, user_id)
+
+    def _lease_work_dir(self, user_id: str, task_id: str = "") -> str:
+        """租约在宿主机上的工作目录"""
+        if self.isolation == "task" and task_id:
+            self._check_name(task_id, "任务ID")
+            return os.path.join(self._user_dir(user_id), task_id)
+        return self._user_dir(user_id)
+
+    def _idle_count(self) -> int:
+        return sum(len(containers) for containers in self._idle.values())
+
+    def _total(self) -> int:
+        return self._idle_count() + len(self._leases) + self._starting
+
+    def _create_container(self, user_id: str, **overrides) -> DockerContainer:
+        """为用户创建并启动一个新的池容器，只挂载该用户的目录
+
+        Args:
+            overrides: 覆盖 container_options 中的参数，如资源限制
+        """
+        container = DockerContainer(
+            image=self.get_image(),
+            container_name=f"{self.name_prefix}-pool-{str(uuid.uuid4())[:8]}",
+            base_work_dir=self.base_work_dir,
+            container_dir=self.container_dir,
+            mount_dir=self._user_dir(user_id),
+            vnc_port=None,
+            **{**self.container_options, **overrides}
+        )
+        return container.start()
+
+    def get_image(self) -> str:
+        """新容器使用的镜像，需要快照时第一次调用构建快照，构建失败时使用基础镜像"""
+        if self.snapshot_commands is None:
+            return self.image
+
+        with self._snapshot_lock:
+            if self.snapshot_image is None:
+                try:
+                    self.snapshot_image = self._build_snapshot()
+                except Exception as e:
+                    print(f"构建快照镜像失败，使用基础镜像: {str(e)}")
+                    self.snapshot_image = self.image
+            return self.snapshot_image
+
+    def _build_snapshot(self) -> str:
+        """构建快照镜像，基础镜像和快照命令都没有变化时复用已有的快照"""
+        client = docker.from_env()
+        repository, _ = parse_repository_tag(self.image)
+        # 基础镜像重新构建后ID改变，快照随之重建
+        fingerprint = "\n".join([client.images.get(self.image).id, *self.snapshot_commands])
+        tag = f"snapshot-{hashlib.sha256(fingerprint.encode('utf-8')).hexdigest()[:12]}"
+        try:
+            client.images.get(f"{repository}:{tag}")
+            return f"{repository}:{tag}"
+        except docker.errors.ImageNotFound:
+            pass
+
+        container = DockerContainer(
+            image=self.image,
+            container_name=f"{self.name_prefix}-snapshot-{str(uuid.uuid4())[:8]}",
+            base_work_dir=self.base_work_dir,
+            container_dir=self.container_dir,
+            vnc_port=None,
+            **self.container_options
+        ).start()
+        try:
+            for command in [*self.snapshot_commands, SNAPSHOT_CLEANUP]:
+                exit_code, output = container.container.exec_run(["sh", "-c", command])
+                if exit_code != 0:
+                    raise RuntimeError(f"快照命令执行失败（退出码 {exit_code}）: {command}\n"
+                                       f"{output.decode('utf-8', errors='replace')}")
+            print(f"提交快照镜像 {repository}:{tag}")
+            return container.commit(repository, tag)
+        finally:
+            container.stop()
+
+    def _warm_one(self, user_id: str):
+        """后台为用户启动一个空闲容器"""
+        try:
+            container = self._create_container(user_id)
+        except Exception as e:
+            print(f"预热容器失败: {str(e)}")
+            with self._lock:
+                self._starting -= 1
+                self._warming[user_id] -= 1
+            return
+
+        with self._lock:
+            self._starting -= 1
+            self._warming[user_id] -= 1
+            # 预热期间用户已被释放时不再保留
+            if self._closed.is_set() or user_id not in self._idle_used:
+                container.stop()
+                return
+            self._idle.setdefault(user_id, []).append(container)
+
+    def _refill(self, user_id: str):
+        """补充用户的空闲容器到 min_idle 个，不超过 max_size"""
+        with self._lock:
+            if self._closed.is_set() or user_id not in self._idle_used:
+                return
+            needed = min(
+                self.min_idle - len(self._idle.get(user_id, [])) - self._warming.get(user_id, 0),
+                self.max_size - self._total()
+            )
+            needed = max(needed, 0)
+            self._starting += needed
+            self._warming[user_id] = self._warming.get(user_id, 0) + needed
+
+        for _ in range(needed):
+            threading.Thread(target=self._warm_one, args=(user_id,), daemon=True).start()
+
+    def warm_up(self):
+        """提前构建快照镜像，并启动空闲租约回收线程
+
+        空闲容器按用户预热，用户第一次租用后才开始。
+        """
+        if self.snapshot_commands is not None and self.snapshot_image is None:
+            threading.Thread(target=self.get_image, daemon=True).start()
+        if self._reaper is None:
+            self._reaper = threading.Thread(target=self._reap_loop, daemon=True)
+            self._reaper.start()
+
+    def lease(self, user_id: str, task_id: str = "", **limits) -> DockerContainer:
+        """租用容器，同一租约键（用户，按任务隔离时为用户和任务）重复租用返回同一个容器
+
+        Args:
+            user_id: 用户ID
+            task_id: 任务ID
+            limits: 资源限制 cpus / mem_limit / pids_limit，为None的项使用池的默认值。
+                CPU和内存限制直接调整到租用的容器上；pids_limit与池的默认值不同时新建容器
+
+        Returns:
+            DockerContainer: 已启动的容器
+        """
+        key = self.lease_key(user_id, task_id)
+        limits = {name: value for name, value in limits.items() if value is not None}
+
+        with self._lock:
+            container = self._leases.get(key)
+            if container is not None:
+                self._last_used[key] = time.time()
+        if container is not None:
+            if limits:
+                container.update_limits(**limits)
+            return container
+
+        self.reap_idle()
+
+        # 进程数限制只能在创建时设置，与预热容器不同时只能冷启动
+        fresh = limits.get("pids_limit", self.container_options.get("pids_limit")) != \
+            self.container_options.get("pids_limit")
+
+        # 检查用户ID和任务ID，避免挂载或进入其他用户的目录
+        self._lease_work_dir(user_id, task_id)
+        with self._lock:
+            self._idle_used[user_id] = time.time()
+            idle = self._idle.get(user_id)
+            if idle and not fresh:
+                container = idle.pop(0)
+            elif self._total() < self.max_size:
+                container = None
+                self._starting += 1
+            else:
+                raise RuntimeError(f"容器池已满（最多 {self.max_size} 个容器）")
+
+        if container is None:
+            try:
+                container = self._create_container(user_id, **limits)
+            finally:
+                with self._lock:
+                    self._starting -= 1
+        elif limits:
+            container.update_limits(**limits)
+
+        with self._lock:
+            existing = self._leases.get(key)
+            if existing is None:
+                container.exec_workdir = container.container_path(self._lease_work_dir(user_id, task_id))
+                self._leases[key] = container
+                self._last_used[key] = time.time()
+            elif not fresh:
+                # 同一个键被并发租用（如规划模式下并行的子任务），多取的容器放回空闲队列
+                self._idle.setdefault(user_id, []).append(container)
+                container = None
+        if existing is not None:
+            if container is not None:
+                container.stop()
+            return existing
+
+        # 被租走一个后在后台为该用户补充空闲容器
+        self._refill(user_id)
+        return container
+
+    async def alease(self, user_id: str, task_id: str = "", **limits) -> DockerContainer:
+        """异步租用容器，已有租约时直接返回，其余情况（可能需要冷启动或调整资源限制）在线程中执行"""
+        key = self.lease_key(user_id, task_id)
+        if not any(value is not None for value in limits.values()):
+            with self._lock:
+                if key in self._leases:
+                    self._last_used[key] = time.time()
+                    return self._leases[key]
+
+        return await asyncio.to_thread(self.lease, user_id, task_id, **limits)
+
+    @contextmanager
+    def using(self, user_id: str, task_id: str = ""):
+        """标记租约正在执行，期间不会被空闲回收，结束时重新开始计算空闲时间
+
+        执行可能超过 idle_timeout（如长时间的浏览器任务），只按租用时间计算会在执行中途停止容器。
+        """
+        key = self.lease_key(user_id, task_id)
+        with self._lock:
+            self._in_use[key] = self._in_use.get(key, 0) + 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._in_use[key] -= 1
+                if not self._in_use[key]:
+                    del self._in_use[key]
+                if key in self._leases:
+                    self._last_used[key] = time.time()
+
+    def get(self, user_id: str, task_id: str = "") -> Optional[DockerContainer]:
+        """获取已租出的容器，不存在时返回None，不会新建租约"""
+        with self._lock:
+            return self._leases.get(self.lease_key(user_id, task_id))
+
+    def release(self, user_id: str, task_id: str = ""):
+        """归还租约，容器停止销毁后补充新的空闲容器
+
+        按任务隔离时不提供 task_id 则归还该用户所有任务的租约，同时停止该用户的空闲容器。
+        """
+        with self._lock:
+            if task_id or self.isolation != "task":
+                keys = [self.lease_key(user_id, task_id)]
+            else:
+                keys = [key for key in self._leases if key.startswith(f"{user_id}/")]
+            containers = [self._leases.pop(key) for key in keys if key in self._leases]
+            for key in keys:
+                self._last_used.pop(key, None)
+            released_user = not task_id or self.isolation != "task"
+            if released_user:
+                containers += self._idle.pop(user_id, [])
+                self._idle_used.pop(user_id, None)
+
+        for container in containers:
+            container.stop()
+        if containers and not released_user:
+            self._refill(user_id)
+
+    def reap_idle(self):
+        """回收空闲超时且没有正在执行的租约，以及一段时间没有租用的用户的空闲容器"""
+        now = time.time()
+        with self._lock:
+            expired = [key for key, last_used in self._last_used.items()
+                       if now - last_used > self.idle_timeout and key not in self._in_use]
+            containers = [self._leases.pop(key) for key in expired]
+            for key in expired:
+                self._last_used.pop(key, None)
+
+            leased_users = {key.split("/", 1)[0] for key in self._leases}
+            idle_users = [user_id for user_id, last_used in self._idle_used.items()
+                          if now - last_used > self.idle_timeout and user_id not in leased_users]
+            for user_id in idle_users:
+                containers += self._idle.pop(user_id, [])
+                self._idle_used.pop(user_id, None)
+
+        for container in containers:
+            print(f"回收空闲容器 {container.container_name}")
+            container.stop()
+
+    def _reap_loop(self):
+        interval = max(1.0, min(self.idle_timeout / 2, 60))
+        while not self._closed.wait(interval):
+            try:
+                self.reap_idle()
+            except Exception as e:
+                print(f"回收容器失败: {str(e)}")
+
+    def stats(self) -> Dict[str, int]:
+        """容器池状态"""
+        with self._lock:
+            return {
+                "idle": self._idle_count(),
+                "leased": len(self._leases),
+                "starting": self._starting,
+                "max_size": self.max_size
+            }
+
+    def close(self):
+        """停止池中所有容器"""
+        self._closed.set()
+        with self._lock:
+            containers = [container for idle in self._idle.values() for container in idle] + list(self._leases.values())
+            self._idle = {}
+            self._idle_used = {}
+            self._leases = {}
+            self._last_used = {}
+
+        for container in containers:
+            try:
+                container.stop()
+            except Exception as e:
+                print(f"停止容器 {container.container_name} 失败: {str(e)}")
@@ -0,0 +1,172 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from typing import Dict, Mapping, Optional
+
+
+class CrawlCache:
+    """网页采集的磁盘缓存，所有用户和任务共享
+
+    每个URL一个目录，保存原始响应体(body)、ETag/Last-Modified等元信息(meta.json)
+    以及提取后的正文(text.txt)。
+
+    - 距上次下载不超过 max_age 秒的条目直接使用，不发请求
+    - 超过 max_age 后带 If-None-Match/If-Modified-Since 重新验证，服务器返回304时直接复用正文，
+      不再下载和解析
+    - 缓存总大小超过 max_bytes 时淘汰最久未使用的条目
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int = 512 * 1024 * 1024, max_age: float = 600):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.stats: Dict[str, int] = {"fresh_hits": 0, "revalidated": 0, "misses": 0, "evictions": 0}
+
+        self._lock = threading.Lock()
+        # 键 -> (大小, 最近使用时间)，首次使用时从磁盘加载
+        self._index: Optional[Dict[str, list]] = None
+
+    @staticmethod
+    def make_key(url: str) -> str:
+        return hashlib.sha256(url.encode("utf-8")).hexdigest()
+
+    def _entry_dir(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], key)
+
+    def _load_index(self) -> Dict[str, list]:
+        """扫描磁盘建立索引，需持有锁"""
+        if self._index is None:
+            self._index = {}
+            if os.path.isdir(self.cache_dir):
+                for prefix in os.listdir(self.cache_dir):
+                    prefix_dir = os.path.join(self.cache_dir, prefix)
+                    if not os.path.isdir(prefix_dir):
+                        continue
+                    for key in os.listdir(prefix_dir):
+                        meta_path = os.path.join(prefix_dir, key, "meta.json")
+                        try:
+                            with open(meta_path, "r", encoding="utf-8") as f:
+                                meta = json.load(f)
+                            self._index[key] = [meta.get("size", 0), os.path.getmtime(meta_path)]
+                        except (OSError, ValueError):
+                            shutil.rmtree(os.path.join(prefix_dir, key), ignore_errors=True)
+        return self._index
+
+    def lookup(self, url: str) -> Optional[Dict]:
+        """查找URL的缓存条目，返回元信息，不存在返回None"""
+        key = self.make_key(url)
+        meta_path = os.path.join(self._entry_dir(key), "meta.json")
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if meta.get("url") != url:
+            return None
+        meta["key"] = key
+        return meta
+
+    def is_fresh(self, entry: Dict) -> bool:
+        return time.time() - entry.get("fetched_at", 0) <= self.max_age
+
+    @staticmethod
+    def conditional_headers(entry: Optional[Dict]) -> Dict[str, str]:
+        """生成重新验证用的条件请求头"""
+        headers = {}
+        if entry:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def read_text(self, entry: Dict) -> str:
+        """读取缓存的正文，并刷新条目的使用时间"""
+        entry_dir = self._entry_dir(entry["key"])
+        with open(os.path.join(entry_dir, "text.txt"), "r", encoding="utf-8") as f:
+            text = f.read()
+
+        now = time.time()
+        try:
+            os.utime(os.path.join(entry_dir, "meta.json"), (now, now))
+        except OSError:
+            pass
+        with self._lock:
+            index = self._load_index()
+            if entry["key"] in index:
+                index[entry["key"]][1] = now
+        return text
+
+    def mark_revalidated(self, entry: Dict):
+        """服务器返回304后更新下载时间，在 max_age 内不再验证"""
+        entry["fetched_at"] = time.time()
+        self._write_meta(entry)
+        self.stats["revalidated"] += 1
+
+    @staticmethod
+    def _write_file(path: str, data: bytes):
+        """先写临时文件再替换，并发读取的一方只会读到替换前或替换后的完整文件"""
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(temp_path, "wb") as f:
+                f.write(data)
+            os.replace(temp_path, path)
+        except OSError:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            raise
+
+    def _write_meta(self, entry: Dict):
+        meta = {k: v for k, v in entry.items() if k != "key"}
+        self._write_file(os.path.join(self._entry_dir(entry["key"]), "meta.json"),
+                         json.dumps(meta, ensure_ascii=False).encode("utf-8"))
+
+    def store(self, url: str, body: bytes, encoding: Optional[str], headers: Mapping[str, str], text: str) -> Dict:
+        """保存一次完整下载的结果"""
+        key = self.make_key(url)
+        entry_dir = self._entry_dir(key)
+        os.makedirs(entry_dir, exist_ok=True)
+
+        # 正文先于元信息写入，读到新元信息时正文已经是新的
+        text_bytes = text.encode("utf-8")
+        self._write_file(os.path.join(entry_dir, "body"), body)
+        self._write_file(os.path.join(entry_dir, "text.txt"), text_bytes)
+
+        entry = {
+            "key": key,
+            "url": url,
+            "etag": headers.get("ETag"),
+            "last_modified": headers.get("Last-Modified"),
+            "encoding": encoding,
+            "fetched_at": time.time(),
+            "size": len(body) + len(text_bytes)
+        }
+        self._write_meta(entry)
+
+        with self._lock:
+            self._load_index()[key] = [entry["size"], time.time()]
+        self._evict()
+        return entry
+
+    def _evict(self):
+        """总大小超过 max_bytes 时按最近使用时间淘汰"""
+        with self._lock:
+            index = self._load_index()
+            total = sum(size for size, _ in index.values())
+            if total <= self.max_bytes:
+                return
+            victims = []
+            for key, (size, _) in sorted(index.items(), key=lambda item: item[1][1]):
+                if total <= self.max_bytes:
+                    break
+                victims.append(key)
+                total -= size
+            for key in victims:
+                del index[key]
+
+        for key in victims:
+            shutil.rmtree(self._entry_dir(key), ignore_errors=True)
+        self.stats["evictions"] += len(victims)
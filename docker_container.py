@@ -1,11 +1,72 @@
 import os
-import tempfile
+import posixpath
+import asyncio
 import docker
 import uuid
-from typing import Dict, Optional
+from docker.utils.socket import frames_iter
+from typing import Callable, Dict, List, Optional
 import time
 import requests
-from selenium import webdriver
+from docker_kernel import PythonKernel
+from output_buffer import OUTPUT_HEAD_BYTES, OUTPUT_TAIL_BYTES, DemuxedOutput
+from path_mapper import PathMapper
+
+# 代码不落盘：容器内的加载程序先从stdin读取指定长度的代码，再把stdin换成/dev/null后执行，
+# 不需要关闭写端就能知道代码已经读完
+STDIN_LOADER = r'''
+import os, subprocess, sys
+size, language = int(sys.argv[1]), sys.argv[2]
+data = b""
+while len(data) < size:
+    chunk = os.read(0, size - len(data))
+    if not chunk:
+        break
+    data += chunk
+os.dup2(os.open(os.devnull, os.O_RDONLY), 0)
+if language == "python":
+    sys.argv = ["<stdin>"]
+    exec(compile(data.decode("utf-8"), "<stdin>", "exec"), {"__name__": "__main__", "__builtins__": __builtins__})
+else:
+    sys.exit(subprocess.run(["sh", "-s"], input=data).returncode)
+'''
+
+# 结束命令行中带有指定标记的进程所在的整个进程组，用于取消正在执行的命令
+KILL_SOURCE = r'''
+import os, signal, sys
+token = sys.argv[1].encode()
+for pid in os.listdir("/proc"):
+    if not pid.isdigit() or int(pid) == os.getpid():
+        continue
+    try:
+        with open(f"/proc/{pid}/cmdline", "rb") as f:
+            if token in f.read().split(b"\0"):
+                os.killpg(os.getpgid(int(pid)), signal.SIGKILL)
+    except (OSError, ProcessLookupError):
+        pass
+'''
+
+# timeout 以KILL信号结束命令时的退出码（128 + 9），内存超限被内核杀死时也是这个退出码
+KILLED_EXIT_CODE = 137
+
+
+# 镜像标签（见 docker_image/Dockerfile）：镜像变体 python/browser，以及容器启动完成后创建的就绪文件
+VARIANT_LABEL = "executor.variant"
+READY_FILE_LABEL = "executor.ready_file"
+
+
+# 全局变量 - aiodocker客户端，异步执行时共享
+_async_docker = None
+
+
+def get_async_docker():
+    """获取共享的aiodocker客户端，需在事件循环中调用"""
+    global _async_docker
+
+    if _async_docker is None:
+        import aiodocker
+        _async_docker = aiodocker.Docker()
+
+    return _async_docker
 
 
 class DockerContainer:
@@ -17,7 +78,20 @@ class DockerContainer:
             container_name: str = "llamaindex-executor",
             base_work_dir: str = "",
             container_dir: str = "",
-            auto_remove: bool = True
+            auto_remove: bool = True,
+            vnc_port: Optional[int] = 3000,
+            headless: bool = False,
+            shared_viewer: bool = True,
+            use_kernel: bool = True,
+            output_head: int = OUTPUT_HEAD_BYTES,
+            output_tail: int = OUTPUT_TAIL_BYTES,
+            timeout: Optional[float] = None,
+            cpus: Optional[float] = None,
+            mem_limit: Optional[str] = None,
+            pids_limit: Optional[int] = None,
+            volumes: Optional[Dict[str, Dict[str, str]]] = None,
+            environment: Optional[Dict[str, str]] = None,
+            mount_dir: Optional[str] = None
     ):
         self.image = image
         self.container_name = container_name
@@ -26,6 +100,40 @@ class DockerContainer:
         self.container = None
         self.current_work_dir = base_work_dir
         self.container_dir = container_dir
+        # 宿主机工作目录与容器挂载目录之间的路径转换
+        self.paths = PathMapper(base_work_dir, container_dir) if base_work_dir and container_dir else None
+        # 实际挂载到容器中的宿主机目录，需在 base_work_dir 内（如只挂载某个用户的目录），
+        # 挂载位置按 paths 换算，容器内看不到 base_work_dir 下的其他目录。None表示挂载整个 base_work_dir
+        self.mount_dir = mount_dir
+        # noVNC映射到宿主机的端口，None表示由Docker随机分配（容器池中多个容器同时运行时使用）
+        self.vnc_port = vnc_port
+        # 容器内执行命令的工作目录，None表示使用容器默认的工作目录
+        self.exec_workdir: Optional[str] = None
+        # headless模式下不等待noVNC服务也不打开浏览器查看容器屏幕
+        self.headless = headless
+        # 共享查看器：第一次执行时打开浏览器，之后的执行复用，容器停止时关闭
+        self.shared_viewer = shared_viewer
+        self.driver = None
+        self._service_ready = False
+        # Python代码在常驻内核中执行，按工作目录（即任务）区分
+        self.use_kernel = use_kernel
+        self.kernels: Dict[str, PythonKernel] = {}
+        # 同一任务的多个并发执行（如并行的子任务）只启动一个内核
+        self._kernel_alock = asyncio.Lock()
+        # 每次执行的stdout/stderr各自最多保留开头 output_head 和结尾 output_tail 字节，中间省略
+        self.output_head = output_head
+        self.output_tail = output_tail
+        # 每次执行的默认超时时间（秒），None表示不限制
+        self.timeout = timeout
+        # cgroup资源限制：CPU核数、内存上限（如"2g"，同时禁止使用swap）、最大进程/线程数
+        self.cpus = cpus
+        self.mem_limit = mem_limit
+        self.pids_limit = pids_limit
+        # 工作目录之外额外挂载的卷（如共享的pip缓存）和容器的环境变量
+        self.volumes = volumes or {}
+        self.environment = environment or {}
+        # 镜像变体，由镜像标签决定，旧镜像没有标签时为None
+        self.variant: Optional[str] = None
 
     def start(self):
         """启动Docker容器"""
@@ -45,15 +153,101 @@ class DockerContainer:
                     working_dir=self.container_dir,
                     name=self.container_name,
                     auto_remove=self.auto_remove,
-                    volumes={self.base_work_dir: {'bind': self.container_dir, 'mode': 'rw'}},
-                    ports={"6080": 3000}
+                    volumes={**self._work_dir_volume(), **self.volumes},
+                    environment=self.environment,
+                    ports={"6080": self.vnc_port},
+                    **self._resource_options()
                 )
                 print(f"创建新容器 {self.container_name}")
+
+            # 随机分配端口时读取实际映射的宿主机端口
+            if self.vnc_port is None:
+                self.container.reload()
+                bindings = self.container.ports.get("6080/tcp") or []
+                if bindings:
+                    self.vnc_port = int(bindings[0]["HostPort"])
+
+            # python变体没有虚拟显示和noVNC，不打开查看器
+            self.variant = self.container.labels.get(VARIANT_LABEL)
+            if self.variant == "python":
+                self.headless = True
         except Exception as e:
             raise RuntimeError(f"启动Docker容器失败: {str(e)}")
 
+        if not self.wait_ready():
+            raise RuntimeError(f"容器 {self.container_name} 启动超时")
         return self
 
+    def _work_dir_volume(self) -> Dict[str, Dict[str, str]]:
+        """工作目录的挂载配置"""
+        if self.mount_dir is None or self.paths is None:
+            return {self.base_work_dir: {'bind': self.container_dir, 'mode': 'rw'}}
+        # 不在 base_work_dir 内时抛出ValueError，不会挂载其他目录
+        bind = self.paths.to_container(self.mount_dir)
+        os.makedirs(self.mount_dir, exist_ok=True)
+        return {self.mount_dir: {'bind': bind, 'mode': 'rw'}}
+
+    def wait_ready(self, timeout: float = 60, interval: float = 0.1) -> bool:
+        """等待容器启动完成，即镜像标签声明的就绪文件出现
+
+        就绪只表示可以执行代码，不等待VNC；没有声明就绪文件的旧镜像直接返回True。
+        """
+        ready_file = self.container.labels.get(READY_FILE_LABEL)
+        if not ready_file:
+            return True
+
+        start_time = time.time()
+        while time.time() - start_time < timeout:
+            exit_code, _ = self.container.exec_run(["test", "-f", ready_file])
+            if exit_code == 0:
+                return True
+            time.sleep(interval)
+        return False
+
+    def _resource_options(self) -> Dict:
+        """创建容器时的cgroup资源限制参数"""
+        options = {}
+        if self.cpus:
+            options["nano_cpus"] = int(self.cpus * 1e9)
+        if self.mem_limit:
+            options["mem_limit"] = self.mem_limit
+            options["memswap_limit"] = self.mem_limit
+        if self.pids_limit:
+            options["pids_limit"] = self.pids_limit
+        return options
+
+    def update_limits(self, cpus: Optional[float] = None, mem_limit: Optional[str] = None,
+                      pids_limit: Optional[int] = None):
+        """调整运行中容器的CPU和内存限制，参数为None的项保持不变
+
+        pids_limit 只能在创建容器时设置，与当前值不同时忽略并给出提示。
+        """
+        changes = {}
+        if cpus and cpus != self.cpus:
+            self.cpus = cpus
+            changes.update(cpu_period=100000, cpu_quota=int(cpus * 100000))
+        if mem_limit and mem_limit != self.mem_limit:
+            self.mem_limit = mem_limit
+            changes.update(mem_limit=mem_limit, memswap_limit=mem_limit)
+        if pids_limit and pids_limit != self.pids_limit:
+            print(f"容器 {self.container_name} 已创建，pids_limit 无法修改")
+
+        if changes and self.container:
+            self.container.update(**changes)
+
+    def commit(self, repository: str, tag: str) -> str:
+        """把容器当前的文件系统提交为镜像，用作新容器的快照
+
+        基于快照创建的容器通过写时复制共享镜像层，不需要重新安装依赖或复制文件。
+
+        Returns:
+            str: 镜像名称 repository:tag
+        """
+        if not self.container:
+            raise RuntimeError(f"容器 {self.container_name} 未启动")
+        self.container.commit(repository=repository, tag=tag)
+        return f"{repository}:{tag}"
+
     def set_work_dir(self, work_dir: str) -> None:
         """设置当前工作目录
 
@@ -61,26 +255,103 @@ class DockerContainer:
             work_dir: 新的工作目录
         """
         self.current_work_dir = work_dir
-        # 确保工作目录存在
+        # 确保工作目录存在，工作目录通过绑定挂载同步到容器中，无需在容器内再创建
         os.makedirs(work_dir, exist_ok=True)
-        # 在容器中也创建目录
-        if self.container:
-            self.container.exec_run(f"mkdir -p {self.container_dir}")
 
     def stop(self):
         """停止Docker容器"""
+        self.close_browser()
+        self.close_kernels()
         if self.container and self.auto_remove:
             print(f"停止容器 {self.container_name}")
             self.container.stop()
             self.container = None
 
-    def execute(self, code: str, language: str = "python", work_dir: Optional[str] = None) -> Dict[str, str]:
+    @staticmethod
+    def _strip_markdown(code: str) -> str:
+        # 取出多余的md符号，比如```python,或者```shell，或者```bash，或者```sh，或者```
+        return code.replace("```python", "").replace("```shell", "").replace("```bash", "").replace("```sh", "").replace("```", "")
+
+    @staticmethod
+    def _stdin_command(code: str, language: str, timeout: Optional[float] = None):
+        """生成通过stdin传入代码的执行命令
+
+        命令由 timeout 启动：超时后以KILL信号结束整个进程组（包括代码启动的子进程），
+        timeout 为0时不限制时间。命令行末尾带有本次执行的标记，取消时据此结束进程。
+
+        Returns:
+            (容器内的执行命令, 写入stdin的数据, 进程标记)
+        """
+        data = code.encode("utf-8")
+        language = "python" if language == "python" else "sh"
+        token = f"exec-{uuid.uuid4().hex}"
+        cmd = ["timeout", "-s", "KILL", str(timeout or 0),
+               "python", "-c", STDIN_LOADER, str(len(data)), language, token]
+        return cmd, data, token
+
+    def kill_exec(self, token: str):
+        """结束带有指定标记的执行"""
+        if self.container:
+            self.container.exec_run(["python", "-c", KILL_SOURCE, token])
+
+    def container_path(self, host_dir: str) -> Optional[str]:
+        """宿主机目录在容器中的路径，不在挂载目录内时使用 exec_workdir"""
+        if self.paths is not None:
+            try:
+                path = self.paths.to_container(host_dir)
+                if self.mount_dir is None:
+                    return path
+                # 只挂载了 mount_dir 时，base_work_dir 中的其他目录在容器中不存在
+                mounted = self.paths.to_container(self.mount_dir)
+                if posixpath.commonpath([path, mounted]) == mounted:
+                    return path
+            except ValueError:
+                pass
+        return self.exec_workdir
+
+    @staticmethod
+    def _to_result(exit_code: int, output: DemuxedOutput, timeout: Optional[float] = None,
+                   elapsed: float = 0) -> Dict[str, str]:
+        stdout = output.stdout.getvalue()
+        stderr = output.stderr.getvalue()
+        # 截断前的原始字节数，输出过长保存到文件时给出
+        sizes = {"output_bytes": output.stdout.total, "error_bytes": output.stderr.total}
+
+        if exit_code == KILLED_EXIT_CODE:
+            if timeout and elapsed >= timeout:
+                reason = f"执行超时（超过 {timeout} 秒），进程已被终止"
+            else:
+                reason = "进程被强制终止，可能超出了内存限制"
+            return {"output": stdout, "error": f"{stderr}\n{reason}" if stderr else reason, **sizes}
+        if exit_code != 0:
+            return {"output": stdout, "error": stderr or f"执行失败，退出码 {exit_code}", **sizes}
+        # 执行成功时stderr中一般是警告信息，附在输出后面
+        if stderr:
+            stdout = f"{stdout}\n[stderr]\n{stderr}" if stdout else stderr
+        return {"output": stdout or "代码执行成功", "error": "",
+                "output_bytes": output.stdout.total + output.stderr.total, "error_bytes": 0}
+
+    def _new_output(self, on_output: Optional[Callable[[str, str], None]]) -> DemuxedOutput:
+        return DemuxedOutput(self.output_head, self.output_tail, on_output)
+
+    def execute(
+            self,
+            code: str,
+            language: str = "python",
+            work_dir: Optional[str] = None,
+            on_output: Optional[Callable[[str, str], None]] = None,
+            timeout: Optional[float] = None
+    ) -> Dict[str, str]:
         """在Docker容器中执行代码
 
         Args:
             code: 要执行的代码
             language: 代码语言，支持 "python", "sh", "bash"
             work_dir: 执行代码的工作目录，如果不提供则使用当前工作目录
+            on_output: 执行过程中每收到一段输出时调用 on_output("stdout"|"stderr", 文本)，
+                Python内核执行时在结束后调用一次
+            timeout: 本次执行的超时时间（秒），不提供则使用创建容器时的 timeout。
+                超时后容器内的进程被结束；Python内核先被中断，无法中断时重启
 
         Returns:
             Dict包含output和error字段
@@ -88,76 +359,288 @@ class DockerContainer:
         if not self.container:
             self.start()
 
-        if self.wait_for_service():
-            self.open_browser()
-        else:
-            raise RuntimeError("服务启动失败")
+        if not self.headless:
+            self.attach_viewer()
 
         # 使用指定工作目录或当前工作目录
         execution_dir = work_dir if work_dir else self.current_work_dir
+        timeout = timeout or self.timeout
 
         result = {"output": "", "error": ""}
-        temp_file = None
 
         try:
-            # 根据语言选择文件后缀和执行命令
-            file_suffix = ".py" if language == "python" else ".sh"
+            code = self._strip_markdown(code)
 
-            # 取出多余的md符号，比如```python,或者```shell，或者```bash，或者```sh，或者```
-            code = code.replace("```python", "").replace("```shell", "").replace("```bash", "").replace("```sh", "").replace("```", "")
+            # Python代码交给任务的常驻内核执行，变量在多次执行之间保留
+            if language == "python" and self.use_kernel:
+                result = self.get_kernel(execution_dir).execute(code, timeout=timeout)
+                return self._kernel_result(result, on_output)
 
-            # 将代码写入临时文件
-            with tempfile.NamedTemporaryFile(mode='w', suffix=file_suffix, dir=execution_dir, delete=False, encoding='utf-8') as f:
-                f.write(code)
-                temp_file = f.name
+            # 在容器中执行代码，代码通过stdin传入，不在挂载目录中写临时文件；输出边执行边接收
+            execute_cmd, data, _ = self._stdin_command(code, language, timeout)
+            output = self._new_output(on_output)
+            start_time = time.time()
+            exit_code = self.exec_stdin(execute_cmd, data, output, workdir=self.container_path(execution_dir))
+            result = self._to_result(exit_code, output, timeout, time.time() - start_time)
 
-            if language == "python":
-                temp_file = "./" + temp_file.split("\\")[-2] + '/' + temp_file.split("\\")[-1]
-                execute_cmd = f"python {temp_file}"
-            else:
-                # 为shell脚本添加执行权限
-                os.chmod(temp_file, 0o755)
-                temp_file = "./" + temp_file.split("\\")[-2] + '/' + temp_file.split("\\")[-1]
-                execute_cmd = f"sh {temp_file}"
+        except Exception as e:
+            result["error"] = str(e)
 
-            # 在容器中执行代码
-            exit_code, output = self.container.exec_run(
-                execute_cmd
-            )
+        finally:
+            if not self.shared_viewer:
+                self.close_browser()
+        return result
 
-            output_str = output.decode('utf-8')
+    @staticmethod
+    def _kernel_result(result: Dict[str, str], on_output: Optional[Callable[[str, str], None]]) -> Dict[str, str]:
+        if on_output is not None:
+            if result["output"]:
+                on_output("stdout", result["output"])
+            if result["error"]:
+                on_output("stderr", result["error"])
+        if not result["error"] and not result["output"]:
+            result["output"] = "代码执行成功"
+        return result
 
-            if exit_code != 0:
-                result["error"] = output_str
-            else:
-                if output_str:
-                    result["output"] = output_str
-                else:
-                    result["output"] = "代码执行成功"
+    async def aexecute(
+            self,
+            code: str,
+            language: str = "python",
+            work_dir: Optional[str] = None,
+            on_output: Optional[Callable[[str, str], None]] = None,
+            timeout: Optional[float] = None
+    ) -> Dict[str, str]:
+        """异步在Docker容器中执行代码，通过aiodocker与容器通信，不阻塞事件循环
+
+        调用方取消（如Agent任务被取消）时，结束容器内正在执行的进程或中断Python内核。
+
+        Args:
+            code: 要执行的代码
+            language: 代码语言，支持 "python", "sh", "bash"
+            work_dir: 执行代码的工作目录，如果不提供则使用当前工作目录
+            on_output: 同 execute
+            timeout: 同 execute
+
+        Returns:
+            Dict包含output和error字段
+        """
+        if not self.container:
+            await asyncio.to_thread(self.start)
+
+        # selenium只有同步接口，共享查看器模式下只在第一次执行时打开
+        if not self.headless and self.driver is None:
+            await asyncio.to_thread(self.attach_viewer)
+
+        execution_dir = work_dir if work_dir else self.current_work_dir
+        timeout = timeout or self.timeout
+
+        result = {"output": "", "error": ""}
+
+        try:
+            code = self._strip_markdown(code)
+
+            if language == "python" and self.use_kernel:
+                kernel = await self.aget_kernel(execution_dir)
+                result = await kernel.aexecute(code, timeout=timeout)
+                return self._kernel_result(result, on_output)
+
+            execute_cmd, data, token = self._stdin_command(code, language, timeout)
+            output = self._new_output(on_output)
+            start_time = time.time()
+            try:
+                exit_code = await self.aexec_run(execute_cmd, output, stdin=data,
+                                                 workdir=self.container_path(execution_dir))
+            except asyncio.CancelledError:
+                # 断开连接不会结束容器内的进程，需要主动结束
+                asyncio.get_running_loop().run_in_executor(None, self.kill_exec, token)
+                raise
+            result = self._to_result(exit_code, output, timeout, time.time() - start_time)
 
         except Exception as e:
             result["error"] = str(e)
 
         finally:
-            # 清理临时文件
-            if temp_file and os.path.exists(temp_file):
-                os.unlink(temp_file)
-            self.close_browser()
+            if not self.shared_viewer:
+                await asyncio.to_thread(self.close_browser)
         return result
 
+    def exec_stdin(self, cmd: List[str], data: bytes, output: DemuxedOutput, workdir: Optional[str] = None) -> int:
+        """在容器中执行命令，并把 data 写入命令的stdin
+
+        Args:
+            output: 接收输出，stdout和stderr按docker的多路复用头分开，边执行边写入
+
+        Returns:
+            int: 退出码
+        """
+        api = self.container.client.api
+        exec_id = api.exec_create(
+            self.container.id,
+            cmd,
+            stdin=True,
+            stdout=True,
+            stderr=True,
+            tty=False,
+            workdir=workdir or self.exec_workdir
+        )["Id"]
+        sock = api.exec_start(exec_id, socket=True)
+        try:
+            getattr(sock, "_sock", sock).sendall(data)
+            for stream, chunk in frames_iter(sock, tty=False):
+                output.feed(stream, chunk)
+        finally:
+            sock.close()
+
+        return api.exec_inspect(exec_id)["ExitCode"]
+
+    async def aexec_run(
+            self,
+            cmd: List[str],
+            output: DemuxedOutput,
+            stdin: Optional[bytes] = None,
+            workdir: Optional[str] = None
+    ) -> int:
+        """通过aiodocker在容器中执行命令，输出边执行边写入 output
+
+        Args:
+            stdin: 写入命令stdin的数据
+            workdir: 容器内的工作目录，不提供则使用 exec_workdir
+
+        Returns:
+            int: 退出码
+        """
+        container = get_async_docker().containers.container(self.container.id)
+        exec_ = await container.exec(cmd, stdin=stdin is not None, stdout=True, stderr=True,
+                                     workdir=workdir or self.exec_workdir)
+
+        async with exec_.start(detach=False) as stream:
+            if stdin is not None:
+                await stream.write_in(stdin)
+            while True:
+                message = await stream.read_out()
+                if message is None:
+                    break
+                output.feed(message.stream, message.data)
+
+        inspect = await exec_.inspect()
+        return inspect["ExitCode"]
+
+    def get_kernel(self, key: str) -> PythonKernel:
+        """获取或启动指定任务的Python内核
+
+        Args:
+            key: 内核标识，为任务在宿主机上的工作目录，内核在容器中对应的目录下运行
+        """
+        kernel = self.kernels.get(key)
+        if kernel is not None and kernel.alive and kernel.is_async:
+            # 已有的异步内核的连接属于事件循环，无法在这里使用，结束后重新以同步方式启动
+            self.close_kernel(key)
+            kernel = None
+        if kernel is None:
+            kernel = PythonKernel(self.container, workdir=self.container_path(key),
+                                  output_head=self.output_head, output_tail=self.output_tail)
+            self.kernels[key] = kernel
+        if not kernel.alive:
+            kernel.start()
+        return kernel
+
+    async def aget_kernel(self, key: str) -> PythonKernel:
+        """获取或异步启动指定任务的Python内核"""
+        async with self._kernel_alock:
+            kernel = self.kernels.get(key)
+            if kernel is not None and kernel.alive and not kernel.is_async:
+                # 已有的同步内核无法在事件循环中使用，重新以异步方式启动
+                kernel.close()
+            if kernel is None:
+                kernel = PythonKernel(self.container, workdir=self.container_path(key),
+                                      output_head=self.output_head, output_tail=self.output_tail)
+                self.kernels[key] = kernel
+            if not kernel.alive:
+                await kernel.astart(get_async_docker())
+            return kernel
+
+    def interrupt_kernel(self, key: str):
+        """中断指定任务内核中正在执行的代码"""
+        if key in self.kernels:
+            self.kernels[key].interrupt()
+
+    def reset_kernel(self, key: str):
+        """清空指定任务内核中的变量
+
+        异步启动的内核的连接属于事件循环，不能在这里发送请求：直接结束内核进程，下次执行时重新启动，
+        效果与清空变量相同。在事件循环中请使用 areset_kernel
+        """
+        kernel = self.kernels.get(key)
+        if kernel is None or not kernel.alive:
+            return
+        if kernel.is_async:
+            self.close_kernel(key)
+        else:
+            kernel.reset()
+
+    async def areset_kernel(self, key: str):
+        """reset_kernel 的异步版本，异步启动的内核通过已有连接清空变量"""
+        kernel = self.kernels.get(key)
+        if kernel is None or not kernel.alive:
+            return
+        if kernel.is_async:
+            await kernel.areset()
+        else:
+            await asyncio.to_thread(kernel.reset)
+
+    def close_kernel(self, key: str):
+        """关闭指定任务的内核"""
+        kernel = self.kernels.pop(key, None)
+        if kernel and kernel.is_async:
+            # 异步内核的连接属于事件循环，这里直接结束容器内的内核进程
+            if kernel.pid and self.container:
+                self.container.exec_run(["kill", str(kernel.pid)])
+        elif kernel:
+            kernel.close()
+
+    def close_kernels(self):
+        """关闭所有内核"""
+        for key in list(self.kernels.keys()):
+            self.close_kernel(key)
+
+    def attach_viewer(self):
+        """打开noVNC查看器，共享模式下已打开的查看器直接复用"""
+        if self.driver is not None:
+            return
+
+        if not self._service_ready:
+            if not self.wait_for_service():
+                raise RuntimeError("服务启动失败")
+            self._service_ready = True
+
+        self.open_browser()
+
+    @property
+    def vnc_url(self) -> str:
+        """noVNC页面地址"""
+        return f"http://localhost:{self.vnc_port}/vnc.html"
+
     def open_browser(self):
+        # 只有需要查看器时才加载selenium
+        from selenium import webdriver
+
         self.driver = webdriver.Chrome()
-        self.driver.get('http://localhost:3000/vnc.html?autoconnect=true')
+        self.driver.get(f"{self.vnc_url}?autoconnect=true")
 
     def close_browser(self):
         if self.driver:
-            self.driver.close()
+            try:
+                self.driver.quit()
+            except Exception as e:
+                print(f"关闭查看器失败: {str(e)}")
+            self.driver = None
 
-    def wait_for_service(self, url="http://localhost:3000/vnc.html", timeout=60):
+    def wait_for_service(self, url=None, timeout=60):
+        url = url or self.vnc_url
         start_time = time.time()
         while time.time() - start_time < timeout:
             try:
-                response = requests.get(url)
+                response = requests.get(url, timeout=2)
                 if response.status_code == 200:
                     return True
             except requests.exceptions.RequestException:
@@ -1,38 +1,64 @@
-from langchain_openai import ChatOpenAI
-from browser_use import Agent
 from dotenv import load_dotenv
-from browser_use import Agent, Browser, BrowserConfig
-from browser_use.browser.context import BrowserContextConfig
-from pydantic import SecretStr
 import argparse
 import asyncio
 
+# browser_use 和 langchain 导入较慢，只在真正执行任务时导入，解析参数、打印帮助不受影响
+
 # 加载环境变量
 load_dotenv()
 
-# 定义可用的LLM模型
+# 定义可用的LLM模型：名称 -> 模型ID，客户端在第一次使用时创建
 LLM_MODELS = {
-    "gpt-4o-mini": ChatOpenAI(model="gpt-4o-mini"),
-    "moonshot": ChatOpenAI(model='moonshot-v1-32k'),
-    "doubao": ChatOpenAI(model='doubao-1.5-32k'),
+    "gpt-4o-mini": "gpt-4o-mini",
+    "moonshot": "moonshot-v1-32k",
+    "doubao": "doubao-1.5-32k",
 }
 
-# 默认浏览器配置
-browser_config = BrowserConfig(
-)
+# 全局变量 - 已创建的LLM客户端，按模型名称缓存
+_llm_clients = {}
+
+# 全局变量 - 默认浏览器配置
+_browser_config = None
+
+
+def get_llm(model_name):
+    """获取模型客户端，第一次使用时创建"""
+    if model_name not in _llm_clients:
+        from langchain_openai import ChatOpenAI
+        _llm_clients[model_name] = ChatOpenAI(model=LLM_MODELS[model_name])
+    return _llm_clients[model_name]
+
+
+def new_browser():
+    """按默认浏览器配置创建浏览器，Chromium在第一次使用时启动"""
+    global _browser_config
+    from browser_use import Browser, BrowserConfig
+
+    if _browser_config is None:
+        _browser_config = BrowserConfig(
+        )
+    return Browser(config=_browser_config)
+
 
+async def run_browser_agent(task, model_name="gpt4o-mini", use_vision=True, max_failures=2, max_actions=3,
+                            browser=None):
+    """运行浏览器代理执行指定任务
 
-async def run_browser_agent(task, model_name="gpt4o-mini", use_vision=True, max_failures=2, max_actions=3):
-    """运行浏览器代理执行指定任务"""
+    browser 为外部传入的已启动浏览器（如 browser_worker.py 中的浏览器池）时，任务结束后不关闭，
+    代理在其中新建独立的上下文执行；不传入时临时启动浏览器，结束后关闭。
+    """
     # 获取对应的LLM模型
     if model_name not in LLM_MODELS:
         print(f"错误：未找到模型 '{model_name}'。可用模型: {', '.join(LLM_MODELS.keys())}")
         return
 
-    llm = LLM_MODELS[model_name]
+    from browser_use import Agent
+    llm = get_llm(model_name)
 
     # 初始化浏览器
-    browser = Browser(config=browser_config)
+    owns_browser = browser is None
+    if owns_browser:
+        browser = new_browser()
 
     try:
         # 创建代理
@@ -51,8 +77,9 @@ async def run_browser_agent(task, model_name="gpt4o-mini", use_vision=True, max_
         return result.final_result()
 
     finally:
-        # 确保浏览器关闭
-        await browser.close()
+        # 确保临时启动的浏览器关闭
+        if owns_browser:
+            await browser.close()
 
 
 async def main():
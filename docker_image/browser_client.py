@@ -0,0 +1,97 @@
+"""浏览器任务的轻量客户端，把任务交给常驻的 browser_worker.py 执行
+
+只使用标准库，启动时不导入 browser_use 和 langchain。浏览器进程不可用时退回到在当前进程中执行
+（与 agent_browser.py 相同）。参数与 agent_browser.py 一致。
+"""
+import argparse
+import json
+import os
+import socket
+import sys
+import time
+
+SOCKET_PATH = os.getenv("BROWSER_WORKER_SOCKET", "/tmp/browser_worker.sock")
+# 等待浏览器进程启动完成的时间（秒），容器刚启动时浏览器池可能还在启动
+CONNECT_TIMEOUT = float(os.getenv("BROWSER_WORKER_CONNECT_TIMEOUT", "60"))
+
+
+def connect(timeout: float) -> socket.socket:
+    deadline = time.time() + timeout
+    while True:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(SOCKET_PATH)
+            return sock
+        except (FileNotFoundError, ConnectionRefusedError):
+            sock.close()
+            if time.time() >= deadline:
+                raise
+            time.sleep(0.2)
+
+
+def submit(sock: socket.socket, request: dict) -> dict:
+    """把任务交给浏览器进程并等待结果，连接保持到结果返回，断开即取消任务"""
+    with sock:
+        sock.sendall(json.dumps(request, ensure_ascii=False).encode("utf-8") + b"\n")
+        data = b""
+        while not data.endswith(b"\n"):
+            chunk = sock.recv(65536)
+            if not chunk:
+                raise ConnectionError("浏览器进程提前断开了连接")
+            data += chunk
+    return json.loads(data)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='浏览器自动化代理')
+    parser.add_argument('--task', '-t', type=str, help='要执行的任务描述', required=False,
+                        default="google搜索deepseek，获取第一个链接")
+    parser.add_argument('--model', '-m', type=str, default='gpt-4o-mini', help='使用的LLM模型')
+    parser.add_argument('--no-vision', action='store_false', dest='vision',
+                        help='禁用视觉功能')
+    parser.add_argument('--max-failures', type=int, default=2,
+                        help='最大失败次数')
+    parser.add_argument('--max-actions', type=int, default=3,
+                        help='每个步骤的最大操作数')
+    args = parser.parse_args()
+
+    print(f"\n执行任务: '{args.task}'", flush=True)
+    request = {
+        "task": args.task,
+        "model": args.model,
+        "vision": args.vision,
+        "max_failures": args.max_failures,
+        "max_actions": args.max_actions
+    }
+
+    # 只有连接不上时才退回到当前进程中执行。任务发出后浏览器进程可能已经执行了一部分操作，
+    # 这时断开不能再重新执行一遍，直接报错
+    try:
+        sock = connect(CONNECT_TIMEOUT)
+    except OSError as e:
+        print(f"浏览器进程不可用（{str(e)}），在当前进程中执行", flush=True)
+        import asyncio
+        from agent_browser import run_browser_agent
+        asyncio.run(run_browser_agent(
+            task=args.task,
+            model_name=args.model,
+            use_vision=args.vision,
+            max_failures=args.max_failures,
+            max_actions=args.max_actions
+        ))
+        return
+
+    try:
+        response = submit(sock, request)
+    except (OSError, ValueError) as e:
+        print(f"浏览器任务执行中断: {str(e)}", file=sys.stderr)
+        sys.exit(1)
+
+    if response["error"]:
+        print(response["error"], file=sys.stderr)
+        sys.exit(1)
+    print(f"\n任务结果:\n{response['result']}\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""常驻的浏览器任务进程
+
+启动时预先启动 BROWSER_POOL_SIZE 个Chromium，之后通过Unix套接字接收任务
+（见 browser_client.py）。每个任务从池中借用一个已启动的浏览器，在新建的上下文中执行，结束后关闭上下文、
+归还浏览器，不再为每个任务重新启动解释器、导入依赖和启动浏览器。
+
+协议：客户端发送一行JSON任务 {"task", "model", "vision", "max_failures", "max_actions"}，
+进程返回一行JSON {"result", "error"}。任务完成前客户端断开连接（如执行超时被结束）时取消任务。
+"""
+import asyncio
+import contextlib
+import json
+import os
+
+from agent_browser import LLM_MODELS, get_llm, new_browser, run_browser_agent
+
+SOCKET_PATH = os.getenv("BROWSER_WORKER_SOCKET", "/tmp/browser_worker.sock")
+POOL_SIZE = int(os.getenv("BROWSER_POOL_SIZE", "2"))
+# 启动时提前创建的模型客户端，其他模型在第一次使用时创建
+DEFAULT_MODEL = "gpt-4o-mini"
+
+
+class BrowserPool:
+    """已启动的浏览器池，借出的浏览器断开连接后重新启动一个补充
+
+    启动失败时放回占位（None），下次借出时再启动，池中的位置不会因为启动失败而减少。
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self._idle: asyncio.Queue = asyncio.Queue()
+
+    @staticmethod
+    async def _launch():
+        browser = new_browser()
+        # 提前启动Chromium，否则第一次创建上下文时才启动
+        await browser.get_playwright_browser()
+        return browser
+
+    @staticmethod
+    def _connected(browser) -> bool:
+        playwright_browser = getattr(browser, "playwright_browser", None)
+        return playwright_browser is not None and playwright_browser.is_connected()
+
+    async def start(self):
+        results = await asyncio.gather(*(self._launch() for _ in range(self.size)), return_exceptions=True)
+        for browser in results:
+            if isinstance(browser, BaseException):
+                print(f"启动浏览器失败，第一次使用时重试: {str(browser)}", flush=True)
+                browser = None
+            self._idle.put_nowait(browser)
+
+    @staticmethod
+    async def _close(browser):
+        if browser is not None:
+            with contextlib.suppress(Exception):
+                await browser.close()
+
+    @contextlib.asynccontextmanager
+    async def acquire(self):
+        browser = await self._idle.get()
+        if not self._connected(browser):
+            await self._close(browser)
+            try:
+                browser = await self._launch()
+            except BaseException:
+                self._idle.put_nowait(None)
+                raise
+        try:
+            yield browser
+        finally:
+            # 断开的浏览器留到下次借出时再启动，这里不会抛出异常
+            if not self._connected(browser):
+                await self._close(browser)
+                browser = None
+            self._idle.put_nowait(browser)
+
+    async def close(self):
+        while not self._idle.empty():
+            await self._close(self._idle.get_nowait())
+
+
+async def run_task(pool: BrowserPool, request: dict) -> dict:
+    model = request.get("model", "gpt-4o-mini")
+    if model not in LLM_MODELS:
+        return {"result": "", "error": f"未找到模型 '{model}'。可用模型: {', '.join(LLM_MODELS.keys())}"}
+
+    async with pool.acquire() as browser:
+        result = await run_browser_agent(
+            task=request["task"],
+            model_name=model,
+            use_vision=request.get("vision", True),
+            max_failures=request.get("max_failures", 2),
+            max_actions=request.get("max_actions", 3),
+            browser=browser
+        )
+    return {"result": result or "", "error": ""}
+
+
+async def handle_client(pool: BrowserPool, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    try:
+        request = json.loads(await reader.readline())
+        print(f"\n执行任务: '{request.get('task')}'", flush=True)
+
+        # 客户端只发送一行请求，之后读到EOF说明客户端已经断开
+        task = asyncio.create_task(run_task(pool, request))
+        disconnected = asyncio.create_task(reader.read())
+        done, _ = await asyncio.wait([task, disconnected], return_when=asyncio.FIRST_COMPLETED)
+        if task not in done:
+            print("客户端已断开，取消任务", flush=True)
+            task.cancel()
+            with contextlib.suppress(asyncio.CancelledError, Exception):
+                await task
+            return
+        disconnected.cancel()
+
+        try:
+            response = task.result()
+        except Exception as e:
+            response = {"result": "", "error": str(e)}
+        writer.write(json.dumps(response, ensure_ascii=False).encode("utf-8") + b"\n")
+        await writer.drain()
+    except Exception as e:
+        print(f"处理任务失败: {str(e)}", flush=True)
+    finally:
+        writer.close()
+
+
+async def main():
+    try:
+        get_llm(DEFAULT_MODEL)
+    except Exception as e:
+        print(f"创建模型客户端失败: {str(e)}", flush=True)
+
+    pool = BrowserPool(POOL_SIZE)
+    await pool.start()
+
+    if os.path.exists(SOCKET_PATH):
+        os.unlink(SOCKET_PATH)
+    # 浏览器池启动完成后才创建套接字，客户端能连接即说明已就绪
+    server = await asyncio.start_unix_server(lambda r, w: handle_client(pool, r, w), path=SOCKET_PATH)
+    print(f"浏览器进程已就绪: {SOCKET_PATH}，浏览器数量 {POOL_SIZE}", flush=True)
+
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await pool.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -5,6 +5,7 @@
 IMAGE_NAME="python_code_executor"
 TAG="3.11"
 DOCKERFILE="./Dockerfile"
+VARIANT="all"
 OPENAI_API_KEY=""
 OPENAI_API_BASE=""
 
@@ -16,6 +17,8 @@ show_help() {
   echo "  -n, --name NAME          指定镜像名称 (默认: $IMAGE_NAME)"
   echo "  -t, --tag TAG            指定镜像标签 (默认: $TAG)"
   echo "  -f, --file FILE          指定Dockerfile路径 (默认: $DOCKERFILE)"
+  echo "  --variant VARIANT        镜像变体: python（只执行代码）、browser（含浏览器）或 all (默认: $VARIANT)"
+  echo "                           python变体的镜像为 NAME:TAG，browser变体为 NAME:TAG-browser"
   echo "  --openai-api-key KEY     指定OpenAI API密钥"
   echo "  --openai-api-base URL    指定OpenAI API基础URL"
   echo "  --no-cache               构建时不使用缓存"
@@ -60,6 +63,15 @@ while (( "$#" )); do
         exit 1
       fi
       ;;
+    --variant)
+      if [ -n "$2" ] && [ ${2:0:1} != "-" ]; then
+        VARIANT=$2
+        shift 2
+      else
+        echo "错误: 参数 $1 需要一个值" >&2
+        exit 1
+      fi
+      ;;
     --openai-api-key)
       if [ -n "$2" ] && [ ${2:0:1} != "-" ]; then
         OPENAI_API_KEY=$2
@@ -111,32 +123,51 @@ if [ ! -f "$DOCKERFILE" ]; then
   exit 1
 fi
 
+case "$VARIANT" in
+  python) TARGETS="python" ;;
+  browser) TARGETS="browser" ;;
+  all) TARGETS="python browser" ;;
+  *)
+    echo "错误: 未知的镜像变体 $VARIANT" >&2
+    exit 1
+    ;;
+esac
+
 # 设置参数
 eval set -- "$PARAMS"
 
-# 显示构建信息
-echo "=========================================="
-echo "开始构建Docker镜像"
-echo "镜像名称: $IMAGE_NAME"
-echo "镜像标签: $TAG"
-echo "Dockerfile: $DOCKERFILE"
-echo "=========================================="
+for TARGET in $TARGETS; do
+  if [ "$TARGET" = "python" ]; then
+    IMAGE="$IMAGE_NAME:$TAG"
+  else
+    IMAGE="$IMAGE_NAME:$TAG-$TARGET"
+  fi
 
-# 使用docker命令直接构建
-docker build -t "$IMAGE_NAME:$TAG" -f "$DOCKERFILE" $NO_CACHE $PULL \
-  --build-arg OPENAI_API_KEY="$OPENAI_API_KEY" \
-  --build-arg OPENAI_API_BASE="$OPENAI_API_BASE" \
-  --build-arg OPENAI_BASE_URL="$OPENAI_API_BASE" .
-
-EXIT_CODE=$?
-
-if [ $EXIT_CODE -eq 0 ]; then
-  echo "=========================================="
-  echo "镜像构建成功: $IMAGE_NAME:$TAG"
-  echo "=========================================="
-else
+  # 显示构建信息
   echo "=========================================="
-  echo "镜像构建失败"
+  echo "开始构建Docker镜像"
+  echo "镜像名称: $IMAGE_NAME"
+  echo "镜像标签: ${IMAGE#*:}"
+  echo "镜像变体: $TARGET"
+  echo "Dockerfile: $DOCKERFILE"
   echo "=========================================="
-  exit $EXIT_CODE
-fi
\ No newline at end of file
+
+  # Dockerfile中使用了 RUN --mount，需要BuildKit
+  DOCKER_BUILDKIT=1 docker build -t "$IMAGE" -f "$DOCKERFILE" --target "$TARGET" $NO_CACHE $PULL \
+    --build-arg OPENAI_API_KEY="$OPENAI_API_KEY" \
+    --build-arg OPENAI_API_BASE="$OPENAI_API_BASE" \
+    --build-arg OPENAI_BASE_URL="$OPENAI_API_BASE" .
+
+  EXIT_CODE=$?
+
+  if [ $EXIT_CODE -eq 0 ]; then
+    echo "=========================================="
+    echo "镜像构建成功: $IMAGE"
+    echo "=========================================="
+  else
+    echo "=========================================="
+    echo "镜像构建失败"
+    echo "=========================================="
+    exit $EXIT_CODE
+  fi
+done
\ No newline at end of file
@@ -0,0 +1,18 @@
+#!/bin/sh
+# browser变体的启动脚本：虚拟显示就绪后即标记就绪，VNC和noVNC在后台启动，不阻塞代码执行
+export DISPLAY=:99
+rm -f /tmp/executor-ready
+Xvfb :99 -screen 0 1024x768x16 &
+while [ ! -e /tmp/.X11-unix/X99 ]; do sleep 0.1; done
+touch /tmp/executor-ready
+
+# 常驻的浏览器任务进程，预先启动浏览器池，browser_client.py 连接后即可执行任务
+(cd /app && python browser_worker.py) > /tmp/browser_worker.log 2>&1 &
+
+(
+  x11vnc -display :99 -forever -shared -noxdamage -rfbport 5900 &
+  while ! nc -z localhost 5900; do sleep 0.5; done
+  cd /app/noVNC && ./utils/novnc_proxy --vnc localhost:5900 --listen 0.0.0.0:6080
+) > /tmp/vnc.log 2>&1 &
+
+exec "$@"
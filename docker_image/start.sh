@@ -1,9 +1,4 @@
-#!/bin/bash
-export DISPLAY=:99
-Xvfb :99 -screen 0 1024x768x16 &
-sleep 1
-x11vnc -display :99 -forever -shared -noxdamage -rfbport 5900 &
-while ! nc -z localhost 5900; do sleep 1; done
-cd /app/noVNC
-./utils/novnc_proxy --vnc localhost:5900 --listen 0.0.0.0:6080
-exec "$@"
\ No newline at end of file
+#!/bin/sh
+# python变体的启动脚本：没有需要等待的服务，直接标记就绪并执行命令
+touch /tmp/executor-ready
+exec "$@"
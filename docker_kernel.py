@@ -0,0 +1,492 @@
+import asyncio
+import json
+import socket
+import struct
+import threading
+import time
+import uuid
+from typing import Dict, Optional
+from output_buffer import OUTPUT_HEAD_BYTES, OUTPUT_TAIL_BYTES, TruncatedOutput
+
+# 超时后发送中断，等待内核响应中断的时间（秒），超过后强制结束内核进程
+KERNEL_INTERRUPT_GRACE = 5
+
+# 内核协议消息的前缀，用来和代码中直接写到文件描述符1的输出（如子进程输出）区分开
+KERNEL_MARK = "\x1e__KERNEL__"
+
+# 在容器内运行的内核程序，通过stdin接收JSON请求，通过stdout返回JSON结果
+KERNEL_SOURCE = r'''
+import ast
+import contextlib
+import io
+import json
+import os
+import sys
+import traceback
+
+MARK = "\x1e__KERNEL__"
+proto_in = os.fdopen(os.dup(0), "r", encoding="utf-8")
+proto_out = os.fdopen(os.dup(1), "w", encoding="utf-8")
+sys.stdin = open(os.devnull, "r")
+
+
+def send(msg):
+    proto_out.write(MARK + json.dumps(msg, ensure_ascii=False) + "\n")
+    proto_out.flush()
+
+
+def new_namespace():
+    return {"__name__": "__main__", "__builtins__": __builtins__}
+
+
+namespace = new_namespace()
+
+
+class Capture(io.TextIOBase):
+    """只保留开头和结尾部分的输出，避免巨大的输出占满内存和协议消息"""
+    encoding = "utf-8"
+
+    def __init__(self, head, tail):
+        self.head_limit, self.tail_limit = head, tail
+        self.head, self.head_size, self.tail, self.total = io.StringIO(), 0, "", 0
+
+    def writable(self):
+        return True
+
+    def write(self, s):
+        size = len(s)
+        self.total += size
+        room = self.head_limit - self.head_size
+        if room > 0:
+            self.head.write(s[:room])
+            self.head_size += len(s[:room])
+            s = s[room:]
+        if s and self.tail_limit > 0:
+            self.tail = (self.tail + s)[-self.tail_limit:]
+        return size
+
+    def getvalue(self):
+        omitted = self.total - self.head_size - len(self.tail)
+        if omitted <= 0:
+            return self.head.getvalue() + self.tail
+        return f"{self.head.getvalue()}\n...[输出过长，省略了 {omitted} 个字符]...\n{self.tail}"
+
+
+def run(code, head, tail):
+    out, err = Capture(head, tail), Capture(head, tail)
+    ok = True
+    with contextlib.redirect_stdout(out), contextlib.redirect_stderr(err):
+        try:
+            tree = ast.parse(code, "<cell>", "exec")
+            exec(compile(tree, "<cell>", "exec"), namespace)
+        except KeyboardInterrupt:
+            ok = False
+            err.write("KeyboardInterrupt: 执行被中断\n")
+        except SystemExit as e:
+            ok = e.code in (None, 0)
+            if not ok:
+                err.write(f"SystemExit: {e.code}\n")
+        except BaseException:
+            ok = False
+            traceback.print_exc(file=err)
+    return ok, out.getvalue(), err.getvalue()
+
+
+send({"type": "ready", "pid": os.getpid()})
+while True:
+    try:
+        line = proto_in.readline()
+    except KeyboardInterrupt:
+        continue
+    if not line:
+        break
+    try:
+        request = json.loads(line)
+    except ValueError:
+        continue
+
+    op = request.get("op")
+    if op == "execute":
+        ok, output, error = run(request.get("code", ""), request.get("head", 8192), request.get("tail", 4096))
+        send({"type": "result", "id": request.get("id"), "ok": ok, "output": output, "error": error})
+    elif op == "reset":
+        namespace = new_namespace()
+        send({"type": "result", "id": request.get("id"), "ok": True, "output": "", "error": ""})
+    elif op == "shutdown":
+        break
+'''
+
+
+class PythonKernel:
+    """容器内的常驻Python解释器
+
+    每个任务一个内核，变量、导入的模块以及读入的DataFrame在多次执行之间保留，
+    避免每一步都重新导入pandas/numpy并重新读取数据。
+
+    内核可以通过docker SDK同步启动(start/execute)，也可以通过aiodocker异步启动
+    (astart/aexecute)，同一个内核只使用启动时的那一种方式通信。
+    """
+
+    def __init__(
+            self,
+            container,
+            workdir: Optional[str] = None,
+            output_head: int = OUTPUT_HEAD_BYTES,
+            output_tail: int = OUTPUT_TAIL_BYTES
+    ):
+        """
+        Args:
+            container: docker SDK 的 Container 对象
+            workdir: 内核在容器中的工作目录
+            output_head: 每次执行的stdout/stderr最多保留的开头字符数
+            output_tail: 每次执行的stdout/stderr最多保留的结尾字符数
+        """
+        self.container = container
+        self.workdir = workdir
+        self.output_head = output_head
+        self.output_tail = output_tail
+        self.pid: Optional[int] = None
+        self._sock = None
+        self._stream = None
+        self._stdout = b""
+        self._frames = b""
+        self._stray = self._new_stray()
+        self._lock = threading.Lock()
+        self._alock = asyncio.Lock()
+
+    @property
+    def alive(self) -> bool:
+        return self._sock is not None or self._stream is not None
+
+    @property
+    def is_async(self) -> bool:
+        return self._stream is not None
+
+    @property
+    def command(self):
+        return ["python", "-u", "-c", KERNEL_SOURCE]
+
+    def start(self):
+        """在容器中启动内核进程并等待就绪"""
+        api = self.container.client.api
+        exec_id = api.exec_create(
+            self.container.id,
+            self.command,
+            stdin=True,
+            stdout=True,
+            stderr=True,
+            tty=False,
+            workdir=self.workdir
+        )["Id"]
+        self._sock = api.exec_start(exec_id, socket=True)
+
+        ready = self._read_message()
+        self.pid = ready["pid"]
+        return self
+
+    async def astart(self, docker):
+        """通过aiodocker在容器中启动内核进程并等待就绪
+
+        Args:
+            docker: aiodocker.Docker 客户端
+        """
+        container = docker.containers.container(self.container.id)
+        exec_ = await container.exec(
+            self.command,
+            stdin=True,
+            stdout=True,
+            stderr=True,
+            tty=False,
+            workdir=self.workdir
+        )
+        self._stream = exec_.start(detach=False)
+
+        ready = await self._aread_message()
+        self.pid = ready["pid"]
+        return self
+
+    def _raw_sock(self):
+        return getattr(self._sock, "_sock", self._sock)
+
+    def _read_frame(self, deadline: Optional[float] = None):
+        """读取一帧容器输出，超过 deadline 时抛出 socket.timeout
+
+        非tty模式下docker的输出带8字节头：流类型 + 3字节填充 + 4字节长度。
+        已收到但不完整的数据保留在 _frames 中，超时后继续读取不会打乱帧边界。
+        """
+        sock = self._raw_sock()
+        while True:
+            if len(self._frames) >= 8:
+                stream, size = struct.unpack(">BxxxL", self._frames[:8])
+                if len(self._frames) >= 8 + size:
+                    payload = self._frames[8:8 + size]
+                    self._frames = self._frames[8 + size:]
+                    return stream, payload
+
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise socket.timeout()
+                sock.settimeout(remaining)
+            try:
+                chunk = sock.recv(65536)
+            finally:
+                if deadline is not None:
+                    sock.settimeout(None)
+            if not chunk:
+                raise EOFError("内核连接已断开")
+            self._frames += chunk
+
+    def _new_stray(self) -> TruncatedOutput:
+        return TruncatedOutput(self.output_head, self.output_tail)
+
+    def _feed(self, stream: int, payload: bytes):
+        """接收一段容器输出，stdout进入协议缓冲区，stderr记录为普通输出"""
+        if stream == 2:
+            self._stray.write(payload)
+        else:
+            self._stdout += payload
+
+    def _pop_message(self) -> Optional[Dict]:
+        """从缓冲区取出下一条协议消息，其间的非协议输出记录到 _stray"""
+        while b"\n" in self._stdout:
+            line, self._stdout = self._stdout.split(b"\n", 1)
+            text = line.decode("utf-8", errors="replace")
+            if text.startswith(KERNEL_MARK):
+                return json.loads(text[len(KERNEL_MARK):])
+            self._stray.write(line + b"\n")
+        return None
+
+    def _read_message(self, deadline: Optional[float] = None) -> Optional[Dict]:
+        """读取下一条协议消息，超过 deadline 时返回None"""
+        while True:
+            message = self._pop_message()
+            if message is not None:
+                return message
+
+            try:
+                stream, payload = self._read_frame(deadline)
+            except socket.timeout:
+                return None
+            self._feed(stream, payload)
+
+    async def _aread_message(self) -> Dict:
+        while True:
+            message = self._pop_message()
+            if message is not None:
+                return message
+
+            chunk = await self._stream.read_out()
+            if chunk is None:
+                raise EOFError("内核连接已断开")
+            self._feed(chunk.stream, chunk.data)
+
+    @staticmethod
+    def _encode(op: str, **kwargs):
+        request_id = str(uuid.uuid4())[:8]
+        message = json.dumps({"op": op, "id": request_id, **kwargs}, ensure_ascii=False) + "\n"
+        return request_id, message.encode("utf-8")
+
+    def _send(self, op: str, **kwargs) -> str:
+        """发送请求，返回请求ID"""
+        if self.is_async:
+            raise RuntimeError("内核以异步方式启动，请使用aexecute")
+        if not self.alive:
+            self.start()
+
+        request_id, data = self._encode(op, **kwargs)
+        try:
+            self._raw_sock().sendall(data)
+        except OSError as e:
+            self.close()
+            raise RuntimeError(f"Python内核已退出: {str(e)}")
+        return request_id
+
+    def _wait(self, request_id: str, timeout: Optional[float] = None) -> Optional[Dict]:
+        """等待指定请求的结果，超时返回None，其他请求（如已被取消的执行）的结果直接丢弃"""
+        deadline = time.monotonic() + timeout if timeout else None
+        try:
+            while True:
+                response = self._read_message(deadline)
+                if response is None or response.get("id") == request_id:
+                    return response
+        except (OSError, EOFError) as e:
+            # 内核进程退出（如代码调用了os._exit或崩溃），下次执行时重新启动
+            self.close()
+            raise RuntimeError(f"Python内核已退出: {str(e)}")
+
+    def _request(self, op: str, **kwargs) -> Dict:
+        return self._wait(self._send(op, **kwargs))
+
+    async def _asend(self, op: str, **kwargs) -> str:
+        if not self.is_async:
+            raise RuntimeError("内核未以异步方式启动，请先调用astart")
+
+        request_id, data = self._encode(op, **kwargs)
+        try:
+            await self._stream.write_in(data)
+        except (OSError, EOFError) as e:
+            await self.aclose()
+            raise RuntimeError(f"Python内核已退出: {str(e)}")
+        return request_id
+
+    async def _await(self, request_id: str) -> Dict:
+        try:
+            while True:
+                response = await self._aread_message()
+                if response.get("id") == request_id:
+                    return response
+        except (OSError, EOFError) as e:
+            await self.aclose()
+            raise RuntimeError(f"Python内核已退出: {str(e)}")
+
+    async def _arequest(self, op: str, **kwargs) -> Dict:
+        return await self._await(await self._asend(op, **kwargs))
+
+    def _to_result(self, response: Dict) -> Dict[str, str]:
+        output = self._stray.getvalue() + response.get("output", "")
+        if response.get("ok"):
+            return {"output": output, "error": ""}
+        return {"output": output, "error": response.get("error") or "代码执行失败"}
+
+    def _timeout_result(self, timeout: float, response: Optional[Dict]) -> Dict[str, str]:
+        if response is None:
+            return {
+                "output": self._stray.getvalue(),
+                "error": f"执行超时（超过 {timeout} 秒），内核没有响应中断，已强制结束，之前定义的变量需要重新创建"
+            }
+        result = self._to_result(response)
+        result["error"] = f"执行超时（超过 {timeout} 秒），已中断执行\n{result['error']}"
+        return result
+
+    def execute(self, code: str, timeout: Optional[float] = None) -> Dict[str, str]:
+        """在内核中执行代码
+
+        Args:
+            timeout: 超时时间（秒），超时后先中断执行，内核在 KERNEL_INTERRUPT_GRACE 秒内
+                没有响应则强制结束内核进程，None表示不限制
+
+        Returns:
+            Dict包含output和error字段
+        """
+        with self._lock:
+            self._stray = self._new_stray()
+            try:
+                request_id = self._send("execute", code=code, head=self.output_head, tail=self.output_tail)
+                response = self._wait(request_id, timeout)
+                if response is None:
+                    self.interrupt()
+                    response = self._wait(request_id, KERNEL_INTERRUPT_GRACE)
+                    if response is None:
+                        self.kill()
+                    return self._timeout_result(timeout, response)
+            except RuntimeError as e:
+                return {"output": self._stray.getvalue(), "error": str(e)}
+            return self._to_result(response)
+
+    async def aexecute(self, code: str, timeout: Optional[float] = None) -> Dict[str, str]:
+        """异步在内核中执行代码，内核需已通过astart启动
+
+        调用方取消时向内核发送中断，正在执行的代码停止，其结果在下一次请求时被丢弃。
+
+        Args:
+            timeout: 同 execute
+
+        Returns:
+            Dict包含output和error字段
+        """
+        async with self._alock:
+            self._stray = self._new_stray()
+            try:
+                request_id = await self._asend("execute", code=code, head=self.output_head, tail=self.output_tail)
+                try:
+                    return self._to_result(await asyncio.wait_for(self._await(request_id), timeout))
+                except asyncio.TimeoutError:
+                    pass
+                except asyncio.CancelledError:
+                    asyncio.get_running_loop().run_in_executor(None, self.interrupt)
+                    raise
+
+                await asyncio.to_thread(self.interrupt)
+                try:
+                    response = await asyncio.wait_for(self._await(request_id), KERNEL_INTERRUPT_GRACE)
+                except asyncio.TimeoutError:
+                    response = None
+                    await self.akill()
+                return self._timeout_result(timeout, response)
+            except RuntimeError as e:
+                return {"output": self._stray.getvalue(), "error": str(e)}
+
+    def interrupt(self):
+        """向内核发送SIGINT，中断正在执行的代码"""
+        if self.alive and self.pid:
+            self.container.exec_run(f"kill -INT {self.pid}")
+
+    def reset(self):
+        """清空内核中的变量"""
+        with self._lock:
+            self._request("reset")
+
+    async def areset(self):
+        """异步清空内核中的变量"""
+        async with self._alock:
+            await self._arequest("reset")
+
+    def _kill_process(self):
+        if self.pid and self.container:
+            try:
+                self.container.exec_run(["kill", "-9", str(self.pid)])
+            except Exception as e:
+                print(f"结束内核进程失败: {str(e)}")
+
+    def kill(self):
+        """强制结束内核进程，内核中的变量全部丢失，下次执行时重新启动"""
+        self._kill_process()
+        if self._sock is not None:
+            try:
+                self._sock.close()
+            except OSError:
+                pass
+        self._sock = None
+        self.pid = None
+        self._stdout = b""
+        self._frames = b""
+
+    async def akill(self):
+        """kill 的异步版本，用于异步启动的内核"""
+        await asyncio.to_thread(self._kill_process)
+        stream, self._stream = self._stream, None
+        if stream is not None:
+            try:
+                await stream.close()
+            except (OSError, EOFError):
+                pass
+        self.pid = None
+        self._stdout = b""
+
+    def close(self):
+        """关闭内核进程"""
+        if self._sock is None:
+            return
+        try:
+            self._raw_sock().sendall(b'{"op": "shutdown"}\n')
+            self._sock.close()
+        except OSError:
+            pass
+        self._sock = None
+        self.pid = None
+        self._stdout = b""
+        self._frames = b""
+
+    async def aclose(self):
+        """关闭异步启动的内核进程"""
+        if self._stream is None:
+            return
+        stream, self._stream = self._stream, None
+        try:
+            await stream.write_in(b'{"op": "shutdown"}\n')
+            await stream.close()
+        except (OSError, EOFError):
+            pass
+        self.pid = None
+        self._stdout = b""
@@ -0,0 +1,332 @@
+import codecs
+import os
+import re
+from typing import Callable, Dict, List, Optional
+
+# 正文提取后端，可选 lxml / bs4，auto 时优先使用 lxml，未安装则退回 BeautifulSoup。
+# 两者对格式良好的页面结果相同；对不规范的HTML（段落中嵌套块级元素、未闭合的<p>等）
+# lxml按浏览器的方式自动结束段落，提取的<p>文本与 bs4 不同，因此默认仍使用 bs4
+HTML_EXTRACTOR = os.getenv("HTML_EXTRACTOR", "bs4")
+
+# 非核心内容标签
+REMOVE_TAGS = ('script', 'style', 'noscript', 'iframe', 'head',
+               'header', 'footer', 'nav', 'sidebar', 'comments',
+               'aside', 'advertisement')
+
+# 文章主体的CSS选择器，按优先级排列
+MAIN_SELECTORS = ('article', 'main', '[role="main"]', '.main-content', '#content')
+
+# 与 MAIN_SELECTORS 一一对应的XPath，取文档中第一个匹配的元素
+MAIN_XPATHS = (
+    '(//article)[1]',
+    '(//main)[1]',
+    '(//*[@role="main"])[1]',
+    '(//*[contains(concat(" ", normalize-space(@class), " "), " main-content ")])[1]',
+    '(//*[@id="content"])[1]',
+)
+
+# 需要删除的控制字符，等价于正则 [\x00-\x08\x0b\x0c\x0e-\x1f\x7f]
+_CONTROL_CHARS = dict.fromkeys([*range(0x00, 0x09), 0x0b, 0x0c, *range(0x0e, 0x20), 0x7f])
+
+# 允许解析的内容类型，其它类型（图片、压缩包、PDF等）直接拒绝
+TEXT_CONTENT_TYPES = ('text/', 'application/xhtml+xml', 'application/xml')
+
+# 检测编码时查看的字节数
+ENCODING_SNIFF_BYTES = 4096
+# 头部和<meta>都没有声明编码时，用于推测编码的样本大小
+ENCODING_SAMPLE_BYTES = 64 * 1024
+
+# 按WHATWG编码标准，网页中声明的这些编码实际应按其超集解码
+_ENCODING_SUPERSETS = {
+    'gb2312': 'gb18030',
+    'gbk': 'gb18030',
+    'iso-8859-1': 'cp1252',
+    'latin-1': 'cp1252',
+    'ascii': 'cp1252',
+}
+
+_CHARSET_PARAM = re.compile(r'charset\s*=\s*["\']?\s*([\w.:-]+)', re.I)
+_META_CHARSET = re.compile(rb'<meta[^>]+?charset\s*=\s*["\']?\s*([\w.:-]+)', re.I)
+
+_lxml_xpaths = None
+
+
+def clean_text(text: str) -> str:
+    """整理提取出的文本，一次遍历完成
+
+    按行切分，每行再按连续两个空格切分，丢弃不超过20个字符的片段，并删除控制字符。
+    片段中不含换行，原先合并空行的正则不会产生效果，这里省去。
+    """
+    chunks = []
+    for line in text.splitlines():
+        for phrase in line.strip().split("  "):
+            phrase = phrase.strip()
+            if len(phrase) > 20:
+                chunks.append(phrase.translate(_CONTROL_CHARS))
+    return '\n'.join(chunks)
+
+
+def extract_text_bs4(html: str) -> str:
+    """使用BeautifulSoup(html.parser)提取正文，纯Python实现，较慢"""
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html, 'html.parser')
+
+    # 1. 移除非核心内容标签
+    for element in soup(list(REMOVE_TAGS)):
+        element.decompose()
+
+    # 2. 尝试提取文章主体内容
+    main_content = None
+    for selector in MAIN_SELECTORS:
+        main_content = soup.select_one(selector)
+        if main_content:
+            break
+
+    # 3. 提取文本，找不到主体内容标签时提取所有<p>标签内容
+    if main_content:
+        text = main_content.get_text()
+    else:
+        text = '\n'.join(p.get_text() for p in soup.find_all('p'))
+
+    # 4. 整理文本格式
+    return clean_text(text)
+
+
+def _lxml_xpath_list():
+    global _lxml_xpaths
+    from lxml import etree
+
+    if _lxml_xpaths is None:
+        _lxml_xpaths = [etree.XPath(xpath) for xpath in MAIN_XPATHS]
+    return _lxml_xpaths
+
+
+def _extract_lxml_root(root) -> str:
+    """从lxml解析出的文档树中提取正文"""
+    from lxml import etree
+
+    # 1. 移除非核心内容标签，保留其后的文本
+    etree.strip_elements(root, *REMOVE_TAGS, with_tail=False)
+
+    # 2. 尝试提取文章主体内容
+    main_content = None
+    for xpath in _lxml_xpath_list():
+        found = xpath(root)
+        if found:
+            main_content = found[0]
+            break
+
+    # 3. 提取文本，找不到主体内容标签时提取所有<p>标签内容
+    if main_content is not None:
+        text = main_content.text_content()
+    else:
+        text = '\n'.join(p.text_content() for p in root.iter('p'))
+
+    # 4. 整理文本格式
+    return clean_text(text)
+
+
+def extract_text_lxml(html: str) -> str:
+    """使用lxml提取正文，解析和查找都在C扩展中完成
+
+    格式良好的页面结果与 extract_text_bs4 相同；不规范的HTML可能不同，见 HTML_EXTRACTOR
+    """
+    from lxml import etree
+    import lxml.html
+
+    if not html or not html.strip():
+        return ""
+
+    try:
+        root = lxml.html.document_fromstring(html)
+    except (ValueError, etree.ParserError):
+        # 带编码声明的XML文档等lxml无法直接解析的内容，交给BeautifulSoup处理
+        return extract_text_bs4(html)
+
+    return _extract_lxml_root(root)
+
+
+EXTRACTORS: Dict[str, Callable[[str], str]] = {
+    "lxml": extract_text_lxml,
+    "bs4": extract_text_bs4,
+}
+
+
+def get_extractor(name: Optional[str] = None) -> Callable[[str], str]:
+    """获取正文提取函数
+
+    Args:
+        name: 后端名称 lxml / bs4 / auto，不提供则使用 HTML_EXTRACTOR
+    """
+    return EXTRACTORS[_resolve_backend(name)]
+
+
+def _resolve_backend(name: Optional[str]) -> str:
+    name = name or HTML_EXTRACTOR
+    if name == "auto":
+        try:
+            import lxml.html  # noqa: F401
+            name = "lxml"
+        except ImportError:
+            name = "bs4"
+    if name not in EXTRACTORS:
+        raise ValueError(f"未知的正文提取后端: {name}，可选 {', '.join(EXTRACTORS)}")
+    return name
+
+
+def _normalize_encoding(name) -> Optional[str]:
+    """返回Python可用的编码名，无法识别返回None"""
+    if not name:
+        return None
+    if isinstance(name, bytes):
+        name = name.decode('ascii', errors='ignore')
+    try:
+        name = codecs.lookup(name.strip().lower()).name
+    except LookupError:
+        return None
+    return _ENCODING_SUPERSETS.get(name, name)
+
+
+def _guess_encoding(sample: bytes) -> Optional[str]:
+    """根据内容推测编码，只使用样本，不扫描整个响应体"""
+    try:
+        from charset_normalizer import from_bytes
+        best = from_bytes(sample).best()
+        return best.encoding if best else None
+    except ImportError:
+        pass
+    try:
+        import chardet
+        return chardet.detect(sample).get('encoding')
+    except ImportError:
+        return None
+
+
+def detect_encoding(content_type: str, head: bytes) -> str:
+    """检测网页编码：BOM > Content-Type头 > <meta>声明 > 按样本推测 > utf-8
+
+    Args:
+        content_type: 响应头中的 Content-Type
+        head: 响应体开头的一段字节
+    """
+    for bom, encoding in ((codecs.BOM_UTF8, 'utf-8'),
+                          (codecs.BOM_UTF16_LE, 'utf-16'),
+                          (codecs.BOM_UTF16_BE, 'utf-16')):
+        if head.startswith(bom):
+            return encoding
+
+    match = _CHARSET_PARAM.search(content_type or '')
+    encoding = _normalize_encoding(match.group(1)) if match else None
+    if encoding:
+        return encoding
+
+    match = _META_CHARSET.search(head[:ENCODING_SNIFF_BYTES])
+    encoding = _normalize_encoding(match.group(1)) if match else None
+    if encoding:
+        return encoding
+
+    return _normalize_encoding(_guess_encoding(head[:ENCODING_SAMPLE_BYTES])) or 'utf-8'
+
+
+class StreamingExtractor:
+    """边下载边解析的正文提取器
+
+    - 按 Content-Type 拒绝非文本内容，开头出现NUL字节的响应按二进制内容拒绝
+    - 收到足够的开头字节后检测编码，之后逐块增量解码
+    - lxml后端把解码后的内容直接交给增量解析器，不在内存中拼接完整的HTML字符串
+    - 累计超过 max_bytes 后不再接收数据，只解析已收到的部分
+
+    用法:
+        extractor = StreamingExtractor(content_type, max_bytes)
+        for chunk in chunks:
+            if not extractor.feed(chunk):
+                break
+        text = extractor.close()
+    """
+
+    def __init__(self, content_type: str = "", max_bytes: int = 5 * 1024 * 1024, backend: Optional[str] = None):
+        media_type = (content_type or "").split(";")[0].strip().lower()
+        if media_type and not media_type.startswith(TEXT_CONTENT_TYPES):
+            raise ValueError(f"不支持的内容类型: {media_type}")
+
+        self.content_type = content_type
+        self.max_bytes = max_bytes
+        self.backend = _resolve_backend(backend)
+        self.encoding: Optional[str] = None
+        self.size = 0
+        self.truncated = False
+
+        self._chunks: List[bytes] = []
+        self._pending = 0  # 检测编码前缓冲的字节数
+        self._decoder = None
+        self._parser = None
+        self._pieces: List[str] = []
+
+    @property
+    def body(self) -> bytes:
+        """已接收的原始响应体，用于写入缓存"""
+        return b"".join(self._chunks)
+
+    def feed(self, chunk: bytes) -> bool:
+        """接收一块数据，返回False表示已达到大小上限，不需要继续下载"""
+        if self.truncated:
+            return False
+        if not chunk:
+            return True
+
+        remaining = self.max_bytes - self.size
+        if len(chunk) >= remaining:
+            chunk = chunk[:remaining]
+            self.truncated = True
+        self.size += len(chunk)
+        self._chunks.append(chunk)
+
+        if self._decoder is None:
+            self._pending += len(chunk)
+            if self._pending < ENCODING_SNIFF_BYTES and not self.truncated:
+                return True
+            self._start(self.body)
+        else:
+            self._feed_text(self._decoder.decode(chunk))
+
+        return not self.truncated
+
+    def _start(self, head: bytes):
+        """检测编码，创建增量解码器和解析器，并处理已缓冲的数据"""
+        self.encoding = detect_encoding(self.content_type, head)
+        if b"\x00" in head[:ENCODING_SNIFF_BYTES] and not self.encoding.startswith('utf-16'):
+            raise ValueError("响应内容疑似二进制文件")
+
+        self._decoder = codecs.getincrementaldecoder(self.encoding)(errors='replace')
+        if self.backend == "lxml":
+            import lxml.html
+            self._parser = lxml.html.HTMLParser()
+        self._feed_text(self._decoder.decode(head))
+
+    def _feed_text(self, text: str):
+        if not text:
+            return
+        if self._parser is not None:
+            self._parser.feed(text)
+        else:
+            self._pieces.append(text)
+
+    def close(self) -> str:
+        """结束解析并返回提取的正文"""
+        if self._decoder is None:
+            self._start(self.body)
+        self._feed_text(self._decoder.decode(b"", final=True))
+
+        if self._parser is None:
+            return get_extractor(self.backend)("".join(self._pieces))
+
+        from lxml import etree
+        try:
+            root = self._parser.close()
+        except etree.XMLSyntaxError:
+            # 内容为空
+            return ""
+        if root is None:
+            return ""
+        return _extract_lxml_root(root)
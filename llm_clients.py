@@ -0,0 +1,153 @@
+import os
+import threading
+from typing import Any, Dict, Optional, Sequence
+import httpx
+from langchain_openai import ChatOpenAI
+from llama_index.core.base.llms.types import (
+    ChatMessage,
+    ChatResponse,
+    ChatResponseAsyncGen,
+    CompletionResponse,
+    CompletionResponseAsyncGen,
+    MessageRole,
+)
+from llama_index.core.llms.callbacks import llm_chat_callback, llm_completion_callback
+from llama_index.llms.langchain import LangChainLLM
+from llama_index.llms.langchain.utils import from_lc_messages, to_lc_messages
+
+# 模型服务配置，优先读取环境变量
+api_key = os.getenv("LLM_API_KEY", "本地模型 API")
+base_url = os.getenv("LLM_BASE_URL", "API 链接")
+DEFAULT_MODEL = os.getenv("LLM_MODEL", "模型名XXX")
+
+# 连接池配置
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "20"))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "60"))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "120"))
+
+# 全局变量 - 进程内共享的HTTP连接池与模型客户端（按模型名组织）
+_http_client: Optional[httpx.Client] = None
+_async_http_client: Optional[httpx.AsyncClient] = None
+_chat_models: Dict[str, ChatOpenAI] = {}
+_llms: Dict[str, "PooledLangChainLLM"] = {}
+_lock = threading.Lock()
+
+
+class PooledLangChainLLM(LangChainLLM):
+    """异步接口真正走异步HTTP的LangChainLLM
+
+    LangChainLLM 的 achat/acomplete/astream_* 内部直接调用同步方法，会阻塞事件循环，
+    这里改为调用 ChatOpenAI 的 ainvoke/astream，使用共享的异步连接池。
+    """
+
+    @llm_chat_callback()
+    async def achat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> ChatResponse:
+        lc_message = await self._llm.ainvoke(to_lc_messages(messages), **kwargs)
+        message = from_lc_messages([lc_message])[0]
+        return ChatResponse(message=message)
+
+    @llm_completion_callback()
+    async def acomplete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        lc_message = await self._llm.ainvoke(prompt, **kwargs)
+        return CompletionResponse(text=lc_message.content)
+
+    @llm_chat_callback()
+    async def astream_chat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> ChatResponseAsyncGen:
+        lc_messages = to_lc_messages(messages)
+
+        async def gen() -> ChatResponseAsyncGen:
+            content = ""
+            async for chunk in self._llm.astream(lc_messages, **kwargs):
+                delta = chunk.content or ""
+                content += delta
+                yield ChatResponse(
+                    message=ChatMessage(role=MessageRole.ASSISTANT, content=content),
+                    delta=delta
+                )
+
+        return gen()
+
+    @llm_completion_callback()
+    async def astream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponseAsyncGen:
+        async def gen() -> CompletionResponseAsyncGen:
+            text = ""
+            async for chunk in self._llm.astream(prompt, **kwargs):
+                delta = chunk.content or ""
+                text += delta
+                yield CompletionResponse(text=text, delta=delta)
+
+        return gen()
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=LLM_MAX_CONNECTIONS,
+        max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=LLM_KEEPALIVE_EXPIRY
+    )
+
+
+def get_http_clients():
+    """获取共享的同步/异步HTTP客户端，保持长连接，限制最大连接数"""
+    global _http_client, _async_http_client
+
+    with _lock:
+        if _http_client is None:
+            _http_client = httpx.Client(limits=_limits(), timeout=LLM_TIMEOUT)
+        if _async_http_client is None:
+            _async_http_client = httpx.AsyncClient(limits=_limits(), timeout=LLM_TIMEOUT)
+
+    return _http_client, _async_http_client
+
+
+def get_chat_model(model_name: Optional[str] = None) -> ChatOpenAI:
+    """获取共享的ChatOpenAI客户端，同一模型只创建一次
+
+    Args:
+        model_name: 模型名，不提供则使用 DEFAULT_MODEL
+    """
+    model_name = model_name or DEFAULT_MODEL
+    http_client, async_http_client = get_http_clients()
+
+    with _lock:
+        if model_name not in _chat_models:
+            _chat_models[model_name] = ChatOpenAI(
+                model=model_name,
+                openai_api_key=api_key,
+                openai_api_base=base_url,
+                http_client=http_client,
+                http_async_client=async_http_client
+            )
+        return _chat_models[model_name]
+
+
+def get_llm(model_name: Optional[str] = None) -> PooledLangChainLLM:
+    """获取共享的LlamaIndex LLM，Agent和各工具共用
+
+    Args:
+        model_name: 模型名，不提供则使用 DEFAULT_MODEL
+    """
+    model_name = model_name or DEFAULT_MODEL
+    chat_model = get_chat_model(model_name)
+
+    with _lock:
+        if model_name not in _llms:
+            _llms[model_name] = PooledLangChainLLM(llm=chat_model)
+        return _llms[model_name]
+
+
+async def aclose_llm_clients():
+    """关闭共享的HTTP连接池"""
+    global _http_client, _async_http_client
+
+    with _lock:
+        http_client, async_http_client = _http_client, _async_http_client
+        _http_client, _async_http_client = None, None
+        _chat_models.clear()
+        _llms.clear()
+
+    if http_client is not None:
+        http_client.close()
+    if async_http_client is not None:
+        await async_http_client.aclose()
@@ -0,0 +1,162 @@
+import os
+import threading
+import uuid
+from typing import Dict, List, Optional, Tuple
+from llama_index.core.llms import ChatMessage, MessageRole
+from llama_index.core.utils import get_tokenizer
+from prompts import MEMORY_SUMMARY_PROMPT
+
+# 对话记忆的token预算：超过 MEMORY_TOKEN_BUDGET 时压缩，只保留最近约 MEMORY_KEEP_TOKENS 的完整消息，
+# 更早的消息总结为一条摘要（总结失败时直接丢弃）
+MEMORY_TOKEN_BUDGET = 8000
+MEMORY_KEEP_TOKENS = 3000
+MEMORY_SUMMARY_MAX_TOKENS = 800
+
+# 工具输出超过该字符数时保存到任务目录下的文件，交给模型的只有开头部分和文件路径
+TOOL_OUTPUT_MAX_CHARS = 4000
+TOOL_OUTPUT_PREVIEW_CHARS = 1500
+TOOL_OUTPUT_DIR = "tool_outputs"
+
+# 摘要消息的前缀
+SUMMARY_PREFIX = "[历史对话摘要]\n"
+
+
+def count_tokens(text: str) -> int:
+    return len(get_tokenizer()(text))
+
+
+def message_tokens(message: ChatMessage) -> int:
+    return count_tokens(str(message.content or ""))
+
+
+def spill_tool_output(output: str, task_dir: str, tool_name: str,
+                      max_chars: int = TOOL_OUTPUT_MAX_CHARS, original_bytes: Optional[int] = None) -> str:
+    """工具输出过长时保存到任务目录的 tool_outputs 下，返回开头部分加文件路径的提示
+
+    文件路径相对任务工作目录给出，后续步骤中的代码在同一目录执行，可以直接读取。
+    执行输出在收集时已按缓冲区预算截断，保存的是截断后的内容，不是完整输出。
+
+    Args:
+        original_bytes: 截断前的原始输出字节数，已知时在提示中给出
+    """
+    if len(output) <= max_chars or not task_dir:
+        return output
+
+    filename = f"{tool_name}_{uuid.uuid4().hex[:8]}.txt"
+    relative_path = f"{TOOL_OUTPUT_DIR}/{filename}"
+    try:
+        os.makedirs(os.path.join(task_dir, TOOL_OUTPUT_DIR), exist_ok=True)
+        with open(os.path.join(task_dir, TOOL_OUTPUT_DIR, filename), "w", encoding="utf-8") as f:
+            f.write(output)
+    except OSError as e:
+        print(f"保存工具输出失败: {str(e)}")
+        return output
+
+    saved = f"{len(output)} 字符"
+    if original_bytes is not None and original_bytes > len(output.encode("utf-8")):
+        saved = f"{saved}（原始输出 {original_bytes} 字节，中间部分在执行时已省略）"
+    return (f"{output[:TOOL_OUTPUT_PREVIEW_CHARS]}\n"
+            f"...[以上为开头部分，返回的 {saved} 已保存到工作目录下的 {relative_path}，需要时用代码读取]")
+
+
+class MemoryManager:
+    """按token预算压缩Agent的对话记忆
+
+    每个任务结束后检查记忆的token数，超过 token_budget 时从最早的消息开始，
+    把超出 keep_tokens 的部分交给模型总结为一条摘要，摘要之后保留最近的完整对话。
+    保留部分从用户消息开始，不会把一轮问答拆开。
+    """
+
+    def __init__(
+            self,
+            token_budget: int = MEMORY_TOKEN_BUDGET,
+            keep_tokens: int = MEMORY_KEEP_TOKENS,
+            summarize: bool = True
+    ):
+        self.token_budget = token_budget
+        self.keep_tokens = keep_tokens
+        self.summarize = summarize
+        self._stats: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def _split(self, messages: List[ChatMessage], counts: List[int]) -> Tuple[List[ChatMessage], List[ChatMessage]]:
+        """分成 (需要压缩的旧消息, 保留的最近消息)"""
+        kept = 0
+        start = len(messages)
+        for index in range(len(messages) - 1, -1, -1):
+            if kept + counts[index] > self.keep_tokens:
+                break
+            kept += counts[index]
+            start = index
+
+        # 保留部分从用户消息开始
+        while start < len(messages) and messages[start].role != MessageRole.USER:
+            start += 1
+        return messages[:start], messages[start:]
+
+    async def _summarize(self, messages: List[ChatMessage], llm) -> Optional[ChatMessage]:
+        # 之前的摘要带有 SUMMARY_PREFIX，与其他旧消息一起重新总结。摘要是更早对话的唯一记录，始终完整保留
+        previous, raw = [], []
+        for message in messages:
+            if message.content:
+                text = f"{message.role.value}: {message.content}"
+                (previous if str(message.content).startswith(SUMMARY_PREFIX) else raw).append(text)
+        previous, raw = "\n\n".join(previous), "\n\n".join(raw)
+        # 旧消息本身可能很长，只取末尾能放进一次请求的部分
+        limit = max(self.token_budget * 4 - len(previous), 0)
+        if len(raw) > limit:
+            raw = raw[-limit:] if limit else ""
+        transcript = "\n\n".join(part for part in (previous, raw) if part)
+
+        prompt = MEMORY_SUMMARY_PROMPT.format(transcript=transcript, max_tokens=MEMORY_SUMMARY_MAX_TOKENS)
+        try:
+            response = await llm.achat([ChatMessage(role=MessageRole.USER, content=prompt)])
+        except Exception as e:
+            print(f"总结历史对话失败，直接丢弃: {str(e)}")
+            return None
+        return ChatMessage(role=MessageRole.SYSTEM, content=f"{SUMMARY_PREFIX}{response.message.content}")
+
+    async def acompact(self, key: str, memory, llm=None) -> bool:
+        """检查并压缩记忆
+
+        Args:
+            key: 记忆所属的用户ID，用于统计
+            memory: Agent的记忆，需支持 get_all / set
+            llm: 用于总结的模型，为None时直接丢弃旧消息
+
+        Returns:
+            bool: 是否进行了压缩
+        """
+        messages = memory.get_all()
+        counts = [message_tokens(message) for message in messages]
+        tokens = sum(counts)
+
+        with self._lock:
+            stats = self._stats.setdefault(key, {"tokens": 0, "compactions": 0, "summarized": 0, "evicted": 0})
+            stats["tokens"] = tokens
+        if tokens <= self.token_budget:
+            return False
+
+        old, recent = self._split(messages, counts)
+        if not old:
+            return False
+
+        summary = await self._summarize(old, llm) if self.summarize and llm is not None else None
+        # 总结期间新加入的消息接在后面
+        added = memory.get_all()[len(messages):]
+        memory.set(([summary] if summary else []) + recent + added)
+
+        with self._lock:
+            stats["tokens"] = sum(counts[len(old):]) + (message_tokens(summary) if summary else 0)
+            stats["compactions"] += 1
+            stats["summarized" if summary else "evicted"] += len(old)
+        print(f"压缩 {key} 的对话记忆: {tokens} -> {stats['tokens']} tokens")
+        return True
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        with self._lock:
+            return {key: dict(value) for key, value in self._stats.items()}
+
+    def forget(self, key: str):
+        with self._lock:
+            self._stats.pop(key, None)
@@ -0,0 +1,87 @@
+import codecs
+from typing import Callable, Optional, Union
+
+# 执行输出默认保留的开头和结尾字节数，中间部分省略
+OUTPUT_HEAD_BYTES = 8 * 1024
+OUTPUT_TAIL_BYTES = 4 * 1024
+
+
+class TruncatedOutput:
+    """只保留开头 head 字节和结尾 tail 字节的输出缓冲区
+
+    执行输出可能非常大（如打印整个DataFrame），全部保留既占内存，又会在下一次调用模型时
+    占满上下文。写入时即按预算丢弃中间部分，内存占用不超过 head + tail。
+    """
+
+    def __init__(self, head: int = OUTPUT_HEAD_BYTES, tail: int = OUTPUT_TAIL_BYTES):
+        self.head = head
+        self.tail = tail
+        self.total = 0
+        self._head = bytearray()
+        self._tail = bytearray()
+
+    def write(self, data: Union[bytes, str]):
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        self.total += len(data)
+
+        room = self.head - len(self._head)
+        if room > 0:
+            self._head += data[:room]
+            data = data[room:]
+        if data and self.tail > 0:
+            self._tail += data
+            if len(self._tail) > self.tail:
+                del self._tail[:len(self._tail) - self.tail]
+
+    @property
+    def omitted(self) -> int:
+        """被省略的字节数"""
+        return self.total - len(self._head) - len(self._tail)
+
+    def getvalue(self) -> str:
+        if not self.omitted:
+            return (self._head + self._tail).decode("utf-8", errors="replace")
+        # 截断处可能切开多字节字符，丢弃不完整的部分
+        head = self._head.decode("utf-8", errors="ignore")
+        tail = self._tail.decode("utf-8", errors="ignore")
+        return f"{head}\n...[输出过长，省略了 {self.omitted} 字节]...\n{tail}"
+
+    def __bool__(self) -> bool:
+        return self.total > 0
+
+
+class DemuxedOutput:
+    """分别收集一次执行的stdout和stderr，各自按预算截断，并可实时转发
+
+    Args:
+        on_output: 每收到一段输出时调用 on_output(流名称, 文本)，流名称为 "stdout" 或 "stderr"
+    """
+
+    def __init__(
+            self,
+            head: int = OUTPUT_HEAD_BYTES,
+            tail: int = OUTPUT_TAIL_BYTES,
+            on_output: Optional[Callable[[str, str], None]] = None
+    ):
+        self.stdout = TruncatedOutput(head, tail)
+        self.stderr = TruncatedOutput(head, tail)
+        self.on_output = on_output
+        # 数据块可能切开多字节字符，转发时增量解码
+        self._decoders = {
+            "stdout": codecs.getincrementaldecoder("utf-8")(errors="replace"),
+            "stderr": codecs.getincrementaldecoder("utf-8")(errors="replace"),
+        }
+
+    def feed(self, stream: int, data: bytes):
+        """接收一段输出
+
+        Args:
+            stream: docker多路复用头中的流类型，2为stderr，其余按stdout处理
+        """
+        name = "stderr" if stream == 2 else "stdout"
+        (self.stderr if stream == 2 else self.stdout).write(data)
+        if self.on_output is not None:
+            text = self._decoders[name].decode(data)
+            if text:
+                self.on_output(name, text)
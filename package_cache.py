@@ -0,0 +1,236 @@
+import argparse
+import json
+import os
+import re
+import shlex
+import shutil
+import tempfile
+import threading
+import time
+from typing import Dict, List, Optional
+
+# 容器内挂载宿主机pip目录的位置：cache 为pip的HTTP和wheel缓存，wheelhouse 为本地wheel仓库
+CONTAINER_PIP_DIR = "/opt/pip"
+CONTAINER_WHEELHOUSE = f"{CONTAINER_PIP_DIR}/wheelhouse"
+
+# 生成派生镜像时使用的Dockerfile，位于 docker_image 目录下
+PACKAGES_DOCKERFILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "docker_image", "Dockerfile.packages")
+
+# pip install 中带参数值的选项，解析包名时跳过选项的值
+_PIP_OPTIONS_WITH_VALUE = {
+    "-r", "--requirement", "-c", "--constraint", "-e", "--editable", "-t", "--target",
+    "-i", "--index-url", "--extra-index-url", "-f", "--find-links", "--prefix", "--root",
+    "--platform", "--python-version", "--implementation", "--abi", "--src", "--upgrade-strategy",
+    "--cache-dir", "--trusted-host", "--proxy", "--timeout", "--retries", "--progress-bar",
+}
+
+_PIP_INSTALL = re.compile(r"(?:^|[;&|]\s*|\s)(?:python3?\s+-m\s+)?pip3?\s+install\s+([^;&|\n]+)")
+_REQUIREMENT_NAME = re.compile(r"^[A-Za-z0-9][A-Za-z0-9._-]*")
+
+
+def canonical_name(name: str) -> str:
+    """包名规范化（PEP 503），如 Scikit_Learn -> scikit-learn"""
+    return re.sub(r"[-_.]+", "-", name).lower()
+
+
+def parse_pip_installs(code: str) -> List[str]:
+    """从shell代码中解析 pip install 安装的包（保留版本约束），跳过选项、本地路径和URL"""
+    requirements = []
+    for match in _PIP_INSTALL.finditer(code):
+        try:
+            args = shlex.split(match.group(1))
+        except ValueError:
+            args = match.group(1).split()
+
+        skip_value = False
+        for arg in args:
+            if skip_value:
+                skip_value = False
+            elif arg in _PIP_OPTIONS_WITH_VALUE:
+                skip_value = True
+            elif arg.startswith("-") or "/" in arg or "\\" in arg or arg.startswith("."):
+                continue
+            elif _REQUIREMENT_NAME.match(arg):
+                requirements.append(arg)
+    return requirements
+
+
+def pip_environment(offline: bool = False) -> Dict[str, str]:
+    """执行容器中pip使用的环境变量：优先使用本地wheel仓库，离线时不访问索引
+
+    执行容器中的pip缓存在容器内，不与其他容器共享。
+    PIP_NO_INDEX 总是显式设置，基于快照创建的容器不会继承快照构建时的离线设置。
+    """
+    return {
+        "PIP_FIND_LINKS": CONTAINER_WHEELHOUSE,
+        "PIP_NO_INDEX": "1" if offline else "0",
+        "PIP_DISABLE_PIP_VERSION_CHECK": "1",
+    }
+
+
+class PackageCache:
+    """宿主机上的pip缓存目录
+
+    - cache/：pip的下载和构建缓存，同一个包不再重复下载、编译
+    - wheelhouse/：安装成功的包及其依赖的wheel，离线模式下pip只从这里安装
+    - installs.json：运行时安装过的包及次数，常用的包可以打进派生镜像（见 build_image）
+
+    执行容器中运行的是不受信任的代码，只以只读方式挂载 wheelhouse，否则一个用户放入的wheel
+    会被其他用户安装。wheel只由 build_wheels 启动的一次性构建容器写入，构建容器不执行用户代码。
+    """
+
+    def __init__(self, host_dir: str):
+        self.host_dir = host_dir
+        self.wheelhouse = os.path.join(host_dir, "wheelhouse")
+        self._records_path = os.path.join(host_dir, "installs.json")
+        self._lock = threading.Lock()
+
+    def ensure_dirs(self):
+        for name in ("cache", "wheelhouse"):
+            os.makedirs(os.path.join(self.host_dir, name), exist_ok=True)
+
+    def volume(self) -> Dict[str, Dict[str, str]]:
+        """挂载到执行容器的卷配置，wheelhouse只读"""
+        self.ensure_dirs()
+        return {self.wheelhouse: {"bind": CONTAINER_WHEELHOUSE, "mode": "ro"}}
+
+    def load_records(self) -> Dict[str, Dict]:
+        try:
+            with open(self._records_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def record(self, requirements: List[str]):
+        """记录运行时安装的包，按规范化的包名累计次数，保留最近一次的版本约束"""
+        if not requirements:
+            return
+
+        with self._lock:
+            records = self.load_records()
+            for requirement in requirements:
+                name = canonical_name(_REQUIREMENT_NAME.match(requirement).group(0))
+                entry = records.setdefault(name, {"count": 0})
+                entry["count"] += 1
+                entry["requirement"] = requirement
+                entry["last_installed"] = time.time()
+
+            try:
+                os.makedirs(self.host_dir, exist_ok=True)
+                # 先写临时文件再替换，避免并发读到写了一半的文件
+                temp_path = f"{self._records_path}.{os.getpid()}.tmp"
+                with open(temp_path, "w", encoding="utf-8") as f:
+                    json.dump(records, f, ensure_ascii=False, indent=2)
+                os.replace(temp_path, self._records_path)
+            except OSError as e:
+                print(f"记录安装的包失败: {str(e)}")
+
+    def common_requirements(self, min_count: int = 2) -> List[str]:
+        """安装次数不少于 min_count 的包，按次数从多到少排列"""
+        records = self.load_records()
+        names = sorted((name for name, entry in records.items() if entry["count"] >= min_count),
+                       key=lambda name: -records[name]["count"])
+        return [records[name].get("requirement", name) for name in names]
+
+    def has_wheel(self, name: str) -> bool:
+        """本地wheel仓库中是否有该包的wheel"""
+        try:
+            filenames = os.listdir(self.wheelhouse)
+        except OSError:
+            return False
+        name = canonical_name(name)
+        # wheel文件名为 {包名}-{版本}-...whl，包名中的 - 写作 _
+        return any(filename.endswith(".whl") and canonical_name(filename.split("-", 1)[0]) == name
+                   for filename in filenames)
+
+    @staticmethod
+    def wheel_command(requirements: List[str]) -> List[str]:
+        """在容器中把包及其依赖构建为wheel放入wheelhouse的命令，下载和编译都命中pip缓存"""
+        return ["pip", "wheel", "--quiet", "--wheel-dir", CONTAINER_WHEELHOUSE, *requirements]
+
+    def build_wheels(self, image: str, requirements: List[str], offline: bool = False) -> bool:
+        """启动一次性的构建容器，把包及其依赖构建为wheel放入wheelhouse
+
+        构建容器读写挂载整个pip目录，只执行 pip wheel，不挂载任务目录，结束后删除。
+
+        Args:
+            image: 构建容器使用的镜像，与执行容器的Python版本一致
+            requirements: 包名（可带版本约束），作为参数传给pip，不经过shell
+
+        Returns:
+            bool: 是否构建成功
+        """
+        import docker
+
+        self.ensure_dirs()
+        try:
+            docker.from_env().containers.run(
+                image,
+                entrypoint=self.wheel_command(requirements),
+                volumes={self.host_dir: {"bind": CONTAINER_PIP_DIR, "mode": "rw"}},
+                environment={**pip_environment(offline), "PIP_CACHE_DIR": f"{CONTAINER_PIP_DIR}/cache"},
+                remove=True
+            )
+        except Exception as e:
+            print(f"缓存wheel失败: {str(e)}")
+            return False
+        return True
+
+    def build_image(
+            self,
+            base_image: str,
+            tag: str,
+            min_count: int = 2,
+            offline: bool = False,
+            dockerfile: str = PACKAGES_DOCKERFILE
+    ) -> Optional[str]:
+        """以 base_image（docker_image/Dockerfile 构建的执行镜像）为基础，构建预装常用包的派生镜像
+
+        Returns:
+            str: 镜像名称，没有达到次数的包时返回None
+        """
+        import docker
+
+        requirements = self.common_requirements(min_count)
+        if not requirements:
+            print(f"没有安装次数不少于 {min_count} 的包")
+            return None
+
+        with tempfile.TemporaryDirectory() as context:
+            shutil.copy(dockerfile, os.path.join(context, "Dockerfile"))
+            with open(os.path.join(context, "requirements-runtime.txt"), "w", encoding="utf-8") as f:
+                f.write("\n".join(requirements) + "\n")
+            # 构建上下文中只能访问上下文目录，把wheel仓库复制进去
+            wheelhouse = os.path.join(context, "wheelhouse")
+            if os.path.isdir(self.wheelhouse):
+                shutil.copytree(self.wheelhouse, wheelhouse)
+            else:
+                os.makedirs(wheelhouse)
+
+            print(f"构建镜像 {tag}，预装: {', '.join(requirements)}")
+            docker.from_env().images.build(
+                path=context,
+                tag=tag,
+                buildargs={"BASE_IMAGE": base_image, "PIP_NO_INDEX": "1" if offline else "0"},
+                rm=True
+            )
+        return tag
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="查看运行时安装过的包，或把常用的包打进派生镜像")
+    parser.add_argument("host_dir", help="宿主机pip缓存目录，即 tool_code_executor.PIP_CACHE_DIR")
+    parser.add_argument("--build", metavar="TAG", help="构建派生镜像，如 python_code_executor:3.11-packages")
+    parser.add_argument("--base-image", default="python_code_executor:3.11")
+    parser.add_argument("--min-count", type=int, default=2, help="安装次数不少于该值的包才打进镜像")
+    parser.add_argument("--offline", action="store_true", help="构建时只从wheelhouse安装，不访问索引")
+    args = parser.parse_args()
+
+    package_cache = PackageCache(args.host_dir)
+    if args.build:
+        image = package_cache.build_image(args.base_image, args.build, args.min_count, args.offline)
+        if image:
+            print(f"构建完成，把 tool_code_executor.EXECUTOR_IMAGE 改为 {image} 即可使用")
+    else:
+        for name, entry in sorted(package_cache.load_records().items(), key=lambda item: -item[1]["count"]):
+            print(f"{entry['count']:>5}  {entry.get('requirement', name)}")
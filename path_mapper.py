@@ -0,0 +1,46 @@
+import ntpath
+import posixpath
+import re
+
+
+class PathMapper:
+    """宿主机工作目录与容器内挂载目录之间的路径转换
+
+    宿主机可以是Windows（C:\\...）也可以是Linux/macOS，容器内始终是POSIX路径。
+    只转换挂载目录内的路径，目录外的路径抛出ValueError。
+    """
+
+    def __init__(self, host_root: str, container_root: str):
+        self._host = ntpath if self.is_windows_path(host_root) else posixpath
+        self.host_root = self._host.normpath(host_root)
+        self.container_root = posixpath.normpath(container_root)
+
+    @staticmethod
+    def is_windows_path(path: str) -> bool:
+        return bool(re.match(r"^[A-Za-z]:[\\/]", path)) or "\\" in path
+
+    @staticmethod
+    def _relative_parts(path_module, path: str, root: str):
+        """返回 path 相对 root 的各级目录名，不在 root 内时抛出ValueError"""
+        relative = path_module.relpath(path, root)
+        if relative == path_module.curdir:
+            return []
+        parts = relative.split(path_module.sep)
+        if parts[0] == path_module.pardir:
+            raise ValueError(f"{path} 不在挂载目录 {root} 内")
+        return parts
+
+    def to_container(self, host_path: str) -> str:
+        """宿主机路径 -> 容器内路径"""
+        try:
+            parts = self._relative_parts(self._host, self._host.normpath(host_path), self.host_root)
+        except ValueError as e:
+            # ntpath.relpath 在盘符不同时也会抛出ValueError
+            raise ValueError(f"{host_path} 不在挂载目录 {self.host_root} 内") from e
+        return posixpath.join(self.container_root, *parts)
+
+    def to_host(self, container_path: str) -> str:
+        """容器内路径 -> 宿主机路径，相对路径按挂载目录解析"""
+        path = posixpath.normpath(posixpath.join(self.container_root, container_path))
+        parts = self._relative_parts(posixpath, path, self.container_root)
+        return self._host.join(self.host_root, *parts)
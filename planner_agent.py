@@ -0,0 +1,85 @@
+import asyncio
+from typing import Any, Dict, List, Optional, Union
+from llama_index.core.agent import StructuredPlannerAgent
+from llama_index.core.chat_engine.types import AgentChatResponse, ChatResponseMode
+from llama_index.core.llms import ChatMessage
+
+# 同时执行的子任务数上限
+PLANNER_MAX_CONCURRENCY = 4
+# 所有子任务完成后最多修订计划的次数，避免模型不断追加子任务
+PLANNER_MAX_REFINES = 2
+
+
+class ParallelPlannerAgent(StructuredPlannerAgent):
+    """按依赖关系并行执行子任务的规划Agent
+
+    StructuredPlannerAgent 按"层"执行：一层的子任务全部完成后才修订计划、开始下一层，
+    一层中最慢的子任务会拖住所有后续子任务。这里把计划看作依赖图，某个子任务的依赖全部完成后
+    立即开始执行，同时执行的子任务不超过 max_concurrency 个，总耗时接近关键路径的耗时。
+
+    所有子任务共用Agent的记忆，后完成的子任务可以看到先完成的子任务的结果；
+    子任务全部完成后再修订计划，修订出新的子任务时继续执行。
+    """
+
+    def __init__(self, *args: Any, max_concurrency: int = PLANNER_MAX_CONCURRENCY,
+                 max_refines: int = PLANNER_MAX_REFINES, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        self.max_concurrency = max_concurrency
+        self.max_refines = max_refines
+
+    async def _arun_sub_task(self, name: str, semaphore: asyncio.Semaphore, tool_choice: Union[str, dict]):
+        async with semaphore:
+            if self.verbose:
+                print(f"=== 开始子任务 {name} ===")
+            # 子任务的中间结果不需要流式输出，统一等待完成
+            return await self.arun_task(name, mode=ChatResponseMode.WAIT, tool_choice=tool_choice)
+
+    async def _achat(
+            self,
+            message: str,
+            chat_history: Optional[List[ChatMessage]] = None,
+            tool_choice: Union[str, dict] = "auto",
+            mode: ChatResponseMode = ChatResponseMode.WAIT,
+    ) -> AgentChatResponse:
+        if chat_history is not None:
+            self.memory.set(chat_history)
+
+        plan_id = await self.acreate_plan(message)
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        running: Dict[str, asyncio.Task] = {}
+        results: Dict[str, AgentChatResponse] = {}
+        refines = 0
+
+        try:
+            while True:
+                # 依赖已满足、尚未开始的子任务立即开始
+                for name in self.get_next_tasks(plan_id):
+                    if name not in running:
+                        running[name] = asyncio.create_task(self._arun_sub_task(name, semaphore, tool_choice))
+
+                pending = [task for name, task in running.items() if name not in results]
+                if not pending:
+                    # 没有可执行的子任务：修订计划，没有新的子任务（或达到修订次数上限）时结束
+                    if refines >= self.max_refines:
+                        break
+                    refines += 1
+                    await self.arefine_plan(message, plan_id)
+                    if not any(name not in running for name in self.get_next_tasks(plan_id)):
+                        break
+                    continue
+
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for name, task in running.items():
+                    if task in done and name not in results:
+                        results[name] = task.result()
+                        self.mark_task_complete(plan_id, name)
+        finally:
+            # 出错或被取消时结束其他仍在执行的子任务
+            for task in running.values():
+                task.cancel()
+
+        if not results:
+            return AgentChatResponse(response="")
+        # 计划的最后一个子任务负责完成整个任务，它的结果即最终回答
+        final = self.state.plan_dict[plan_id].sub_tasks[-1].name
+        return results.get(final) or list(results.values())[-1]
@@ -17,7 +17,8 @@ REACT_AGENT_CONTEXT = """
 - 尽量让每一步的任务简单，你可以分成多步来更好的完成任务
 - 确保输入工具正确的代码语言,Python使用language='python',Shell使用language='bash'
 - 如果工具返回缺失python包, 请使用pip install命令脚本安装
-- 注意代码生成和执行是分开的两个步骤
+- 需要生成并执行Python代码时优先使用code_runner，一次调用完成生成和执行，出错时会自动修正；需要先检查或修改代码再执行时，才分别使用code_generator和docker_code_executor
+- 同一任务中的Python代码在常驻解释器中执行，前面步骤定义的变量和读入的数据可以直接复用，无需重复导入和读取
 - 请确保在一次任务过程中使用唯一的task_id来保持上下文
 - 请给予generate_python_code必要的额外上下文信息,以便生成更准确的代码，但不要假设信息
 - 注意评估每一步是否已经完成目标任务，并决定下一步的行动
@@ -30,9 +31,21 @@ REACT_AGENT_CONTEXT = """
 - 数据分析任务：先学习数据的基本信息，再进行数据分析，不要假设数据的格式与字段
 - 文件处理任务：先获得文件的基本信息，再进行文件处理，不要假设文件的类型与名称
 - 网络访问任务: 优先考虑使用python代码完成, 比如爬虫、API请求, 而不是浏览器
+- 需要采集多个网页时，使用webpage_batch_crawler一次提交所有链接，而不是逐个调用webpage_crawler
 - 图片处理任务：优先考虑借助多模态大模型来完成
 """
 
+MEMORY_SUMMARY_PROMPT = """\
+下面是用户与助手之前的对话记录（可能包含更早的摘要）。请把它总结为一段简洁的摘要，供之后的对话参考，不超过{max_tokens}个token。
+必须保留：用户的偏好和要求、已完成任务的结论、生成的文件名与路径、用到的task_id、尚未解决的问题。
+可以省略：寒暄、中间推理过程、代码和执行输出的细节。
+
+对话记录：
+{transcript}
+
+摘要：
+"""
+
 DEFAULT_INITIAL_PLAN_PROMPT = """\
 逐步思考。给定任务和一组工具，创建一个全面的端到端计划来完成任务。
 请记住，如果任务足够简单，并非每个任务都需要分解为多个子任务。
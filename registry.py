@@ -0,0 +1,162 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Iterator, List, Optional, Tuple
+
+_MISSING = object()
+
+
+class LRURegistry:
+    """带容量上限和过期时间的注册表
+
+    - 超过 max_size 时淘汰最久未访问的条目
+    - 超过 ttl 秒未访问的条目在下一次访问注册表或调用 evict_expired 时淘汰
+    - 条目被淘汰（而不是被 pop 主动移除）时调用 on_evict(key, value) 释放资源
+    - is_busy(key) 为True的条目（如正在执行任务的用户）暂不淘汰，空闲后再按规则淘汰
+
+    用法与dict类似，读取(get/[])会刷新条目的访问时间。
+    """
+
+    def __init__(
+            self,
+            max_size: Optional[int] = None,
+            ttl: Optional[float] = None,
+            on_evict: Optional[Callable[[Hashable, Any], None]] = None,
+            is_busy: Optional[Callable[[Hashable], bool]] = None
+    ):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.on_evict = on_evict
+        self.is_busy = is_busy
+        self.evictions = 0
+
+        self._items: "OrderedDict[Hashable, Tuple[Any, float]]" = OrderedDict()
+        self._lock = threading.RLock()
+
+    def _collect_expired(self, now: float) -> List[Tuple[Hashable, Any]]:
+        """取出过期和超出容量的条目，需持有锁"""
+        evicted = []
+        if self.ttl is not None:
+            # 条目按访问时间排序，遇到未过期的即可停止
+            for key, (value, last_used) in list(self._items.items()):
+                if now - last_used <= self.ttl:
+                    break
+                if self._busy(key):
+                    continue
+                del self._items[key]
+                evicted.append((key, value))
+
+        if self.max_size is not None:
+            # 全部条目都忙时允许暂时超出容量
+            excess = len(self._items) - self.max_size
+            for key, (value, _) in list(self._items.items()):
+                if excess <= 0:
+                    break
+                if self._busy(key):
+                    continue
+                del self._items[key]
+                evicted.append((key, value))
+                excess -= 1
+
+        return evicted
+
+    def _busy(self, key: Hashable) -> bool:
+        if self.is_busy is None:
+            return False
+        try:
+            return self.is_busy(key)
+        except Exception:
+            return False
+
+    def _notify(self, evicted: List[Tuple[Hashable, Any]]):
+        """在锁外调用淘汰回调"""
+        self.evictions += len(evicted)
+        if self.on_evict is None:
+            return
+        for key, value in evicted:
+            try:
+                self.on_evict(key, value)
+            except Exception as e:
+                print(f"释放 {key} 的资源失败: {str(e)}")
+
+    def evict_expired(self) -> int:
+        """淘汰过期条目
+
+        Returns:
+            int: 淘汰的条目数
+        """
+        with self._lock:
+            evicted = self._collect_expired(time.time())
+        self._notify(evicted)
+        return len(evicted)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        now = time.time()
+        with self._lock:
+            evicted = self._collect_expired(now)
+            item = self._items.get(key)
+            if item is not None:
+                self._items[key] = (item[0], now)
+                self._items.move_to_end(key)
+        self._notify(evicted)
+        return item[0] if item is not None else default
+
+    def __getitem__(self, key: Hashable) -> Any:
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key: Hashable, value: Any):
+        now = time.time()
+        with self._lock:
+            self._items[key] = (value, now)
+            self._items.move_to_end(key)
+            evicted = self._collect_expired(now)
+        self._notify(evicted)
+
+    def __delitem__(self, key: Hashable):
+        with self._lock:
+            del self._items[key]
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        """主动移除条目，不触发 on_evict"""
+        with self._lock:
+            item = self._items.pop(key, None)
+        return item[0] if item is not None else default
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            return key in self._items
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._items)
+
+    def __iter__(self) -> Iterator[Hashable]:
+        return iter(self.keys())
+
+    def keys(self) -> List[Hashable]:
+        with self._lock:
+            return list(self._items.keys())
+
+    def values(self) -> List[Any]:
+        with self._lock:
+            return [value for value, _ in self._items.values()]
+
+    def items(self) -> List[Tuple[Hashable, Any]]:
+        with self._lock:
+            return [(key, value) for key, (value, _) in self._items.items()]
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "size": len(self._items),
+                "max_size": self.max_size,
+                "ttl": self.ttl,
+                "evictions": self.evictions
+            }
@@ -2,66 +2,224 @@ import re
 import os
 import tempfile
 import asyncio
+import subprocess
 import docker
 import uuid
 import time
 import json
+import shlex
+import threading
 from typing import List, Optional, Dict, Any
 from dataclasses import dataclass
 from llama_index.core.tools import BaseTool, ToolOutput, AsyncBaseTool
 from llama_index.core.tools.types import ToolMetadata
 from llama_index.core.tools import FunctionTool
 from docker_container import DockerContainer
+from container_pool import ContainerPool
+from output_buffer import TruncatedOutput
+from package_cache import PackageCache, parse_pip_installs, pip_environment
+from code_preflight import CodePreflight
+from memory_manager import spill_tool_output
+from registry import LRURegistry
 
-# 全局变量 - Docker容器映射表（按用户ID组织）
-_docker_containers: Dict[str, DockerContainer] = {}
+# 任务目录记录的上限：最多记录的用户数、每个用户最多记录的任务数，以及空闲过期时间（秒）
+TASK_DIR_MAX_USERS = 1000
+TASK_DIR_MAX_PER_USER = 100
+TASK_DIR_TTL = 3600
 
-# 任务目录映射（按用户ID和任务ID组织）
-_task_directories: Dict[str, Dict[str, str]] = {}
+# 任务目录映射（按用户ID和任务ID组织），淘汰只删除记录，不删除磁盘上的目录
+_task_directories: LRURegistry = LRURegistry(max_size=TASK_DIR_MAX_USERS, ttl=TASK_DIR_TTL)
 
 # 基本工作目录
 BASE_WORK_DIR = "C:\\Users\\XXX\\agent-manus\\workspace\\tasks"
 CONTAINER_DIR = "/Users/pingcy/workspace/tasks"
 
+# 宿主机上的pip缓存目录，其中的wheel仓库只读挂载到所有执行容器中，容器销毁后下载和构建的wheel仍然保留
+PIP_CACHE_DIR = "C:\\Users\\XXX\\agent-manus\\workspace\\pip"
+# 离线模式：容器中的pip只从本地wheel仓库安装，不访问索引
+EXECUTOR_PIP_OFFLINE = False
+
+# 容器池配置，执行代码使用只包含Python环境的镜像变体（见 docker_image/build.sh）
+EXECUTOR_IMAGE = "python_code_executor:3.11"
+POOL_MIN_IDLE = 1  # 为每个活跃用户预热的空闲容器数量（容器只挂载该用户的目录，不能在用户之间共用）
+POOL_MAX_SIZE = 10  # 容器总数上限
+POOL_IDLE_TIMEOUT = 600  # 租约空闲超时（秒）
+# 每个任务在独立的容器（沙箱）中执行，同一用户的任务之间不共享安装的包和内核状态；
+# 改为 "user" 则同一用户的所有任务共用一个容器
+EXECUTOR_ISOLATION = "task"
+# 构建快照镜像时执行的命令：预先导入常用库（生成.pyc和matplotlib字体缓存），池中的容器都从快照创建。
+# 设为None则直接使用 EXECUTOR_IMAGE
+EXECUTOR_SNAPSHOT_COMMANDS = [
+    "python -c 'import numpy, pandas, scipy, matplotlib.pyplot, seaborn, openpyxl'"
+]
+
+# 浏览器任务使用含Chromium和虚拟显示的镜像变体，单独的容器池。
+# 容器按用户租用，同一用户的后续任务复用容器中已经启动的浏览器进程和Chromium，空闲超过 POOL_IDLE_TIMEOUT 后归还；
+# 每个用户只有一个浏览器容器，不预热空闲容器（容器只挂载该用户的目录，不能租给其他用户）
+BROWSER_IMAGE = "python_code_executor:3.11-browser"
+BROWSER_ISOLATION = "user"
+BROWSER_POOL_MIN_IDLE = 0
+BROWSER_POOL_MAX_SIZE = 4
+
+# 查看器配置（只对浏览器变体有效，python变体的容器没有noVNC）
+EXECUTOR_HEADLESS = False  # True时执行代码不再打开noVNC查看器
+EXECUTOR_SHARED_VIEWER = True  # 查看器只打开一次并在多次执行之间共享
+
+# Python代码在每个任务的常驻内核中执行，变量和已加载的数据在多次执行之间保留
+EXECUTOR_USE_KERNEL = True
+
+# 执行输出预算：stdout/stderr各自只保留开头和结尾的字节数，避免巨大输出进入模型上下文
+EXECUTOR_OUTPUT_HEAD = 8 * 1024
+EXECUTOR_OUTPUT_TAIL = 4 * 1024
+# 执行过程中把容器输出实时打印到控制台
+EXECUTOR_ECHO_OUTPUT = True
+
+# 执行Python代码前检查语法和导入的模块，有语法错误或缺少模块时直接返回错误，不执行代码
+EXECUTOR_PREFLIGHT = True
+# 缺少的模块在本地wheel仓库中有对应的包时，执行前自动安装（不访问网络）
+EXECUTOR_PREFLIGHT_INSTALL = True
+
+# 每次执行的超时时间（秒），超时后结束容器内的进程；浏览器任务耗时较长，单独设置
+EXECUTOR_TIMEOUT = 300
+BROWSER_TASK_TIMEOUT = 1800
+
+# 每个容器的cgroup资源限制，None表示不限制
+EXECUTOR_CPUS = 2.0  # CPU核数
+EXECUTOR_MEM_LIMIT = "4g"  # 内存上限，同时禁止使用swap
+EXECUTOR_PIDS_LIMIT = 1024  # 最大进程/线程数，浏览器的线程较多，不宜过小
+
+# 全局变量 - 执行容器池
+_container_pool: Optional[ContainerPool] = None
+
+# 全局变量 - 浏览器任务容器池
+_browser_pool: Optional[ContainerPool] = None
+
+# 全局变量 - 宿主机pip缓存
+_package_cache: Optional[PackageCache] = None
+
+# 全局变量 - 执行前检查
+_code_preflight: Optional[CodePreflight] = None
+
+
+def get_package_cache() -> PackageCache:
+    """获取全局pip缓存"""
+    global _package_cache
+
+    if _package_cache is None:
+        _package_cache = PackageCache(PIP_CACHE_DIR)
+
+    return _package_cache
+
+
+def get_code_preflight() -> CodePreflight:
+    """获取全局的执行前检查"""
+    global _code_preflight
+
+    if _code_preflight is None:
+        _code_preflight = CodePreflight(get_package_cache(), auto_install=EXECUTOR_PREFLIGHT_INSTALL)
+
+    return _code_preflight
+
+
+def get_container_pool() -> ContainerPool:
+    """获取全局容器池，首次调用时创建并开始预热"""
+    global _container_pool
+
+    if _container_pool is None:
+        _container_pool = ContainerPool(
+            image=EXECUTOR_IMAGE,
+            base_work_dir=BASE_WORK_DIR,
+            container_dir=CONTAINER_DIR,
+            min_idle=POOL_MIN_IDLE,
+            max_size=POOL_MAX_SIZE,
+            idle_timeout=POOL_IDLE_TIMEOUT,
+            isolation=EXECUTOR_ISOLATION,
+            snapshot_commands=EXECUTOR_SNAPSHOT_COMMANDS,
+            headless=EXECUTOR_HEADLESS,
+            shared_viewer=EXECUTOR_SHARED_VIEWER,
+            use_kernel=EXECUTOR_USE_KERNEL,
+            output_head=EXECUTOR_OUTPUT_HEAD,
+            output_tail=EXECUTOR_OUTPUT_TAIL,
+            timeout=EXECUTOR_TIMEOUT,
+            cpus=EXECUTOR_CPUS,
+            mem_limit=EXECUTOR_MEM_LIMIT,
+            pids_limit=EXECUTOR_PIDS_LIMIT,
+            volumes=get_package_cache().volume(),
+            environment=pip_environment(EXECUTOR_PIP_OFFLINE)
+        )
+        _container_pool.warm_up()
+
+    return _container_pool
+
+
+def get_browser_pool() -> ContainerPool:
+    """获取浏览器任务的容器池，首次调用时创建"""
+    global _browser_pool
+
+    if _browser_pool is None:
+        _browser_pool = ContainerPool(
+            image=BROWSER_IMAGE,
+            base_work_dir=BASE_WORK_DIR,
+            container_dir=CONTAINER_DIR,
+            min_idle=BROWSER_POOL_MIN_IDLE,
+            max_size=BROWSER_POOL_MAX_SIZE,
+            idle_timeout=POOL_IDLE_TIMEOUT,
+            name_prefix="llamaindex-browser",
+            isolation=BROWSER_ISOLATION,
+            headless=EXECUTOR_HEADLESS,
+            shared_viewer=EXECUTOR_SHARED_VIEWER,
+            use_kernel=False,
+            output_head=EXECUTOR_OUTPUT_HEAD,
+            output_tail=EXECUTOR_OUTPUT_TAIL,
+            timeout=BROWSER_TASK_TIMEOUT,
+            cpus=EXECUTOR_CPUS,
+            mem_limit=EXECUTOR_MEM_LIMIT,
+            pids_limit=EXECUTOR_PIDS_LIMIT
+        )
+        _browser_pool.warm_up()
+
+    return _browser_pool
+
 
 def get_docker_container(
         user_id: str = "default",
         task_id: str = "",
-        image: str = "python_code_executor:3.11",
-        container_name: Optional[str] = None,
+        cpus: Optional[float] = None,
+        mem_limit: Optional[str] = None,
+        pids_limit: Optional[int] = None
 ) -> DockerContainer:
-    """获取或创建特定用户的Docker容器
+    """从容器池租用特定用户的Docker容器，按任务隔离时每个任务租用独立的容器
 
     Args:
         user_id: 用户ID，用于区分不同用户
         task_id: 任务ID，用于区分不同任务
-        image: Docker镜像名称
-        container_name: 容器名称，如不提供则根据用户ID生成
+        cpus: CPU核数限制，不提供则使用 EXECUTOR_CPUS
+        mem_limit: 内存上限，如"2g"，不提供则使用 EXECUTOR_MEM_LIMIT
+        pids_limit: 最大进程/线程数，不提供则使用 EXECUTOR_PIDS_LIMIT
 
     Returns:
         DockerContainer: 用户专属的容器实例
     """
-    global _docker_containers
-
-    # 如果不提供容器名称则根据用户ID生成
-    if container_name is None:
-        container_name = f"llamaindex-executor-{user_id}"
-
-    # 为用户创建专属容器
-    if user_id not in _docker_containers or _docker_containers[user_id] is None:
-        _docker_containers[user_id] = DockerContainer(
-            image=image,
-            container_name=container_name,
-            base_work_dir=os.path.join(BASE_WORK_DIR, user_id),
-            container_dir=CONTAINER_DIR + "/" + user_id + '/' + task_id
-        )
-        _docker_containers[user_id].start()
+    # 确保用户基本工作目录存在
+    user_work_dir = os.path.join(BASE_WORK_DIR, user_id)
+    os.makedirs(user_work_dir, exist_ok=True)
 
-        # 确保用户基本工作目录存在
-        user_work_dir = os.path.join(BASE_WORK_DIR, user_id)
-        os.makedirs(user_work_dir, exist_ok=True)
+    return get_container_pool().lease(user_id, task_id, cpus=cpus, mem_limit=mem_limit, pids_limit=pids_limit)
 
-    return _docker_containers[user_id]
+
+async def aget_docker_container(
+        user_id: str = "default",
+        task_id: str = "",
+        cpus: Optional[float] = None,
+        mem_limit: Optional[str] = None,
+        pids_limit: Optional[int] = None
+) -> DockerContainer:
+    """get_docker_container 的异步版本，池中没有空闲容器需要冷启动时不阻塞事件循环"""
+    user_work_dir = os.path.join(BASE_WORK_DIR, user_id)
+    os.makedirs(user_work_dir, exist_ok=True)
+
+    return await get_container_pool().alease(user_id, task_id, cpus=cpus, mem_limit=mem_limit,
+                                              pids_limit=pids_limit)
 
 
 def create_task_workspace(user_id: str, task_id: str) -> str:
@@ -78,7 +236,7 @@ def create_task_workspace(user_id: str, task_id: str) -> str:
 
     # 确保用户任务映射表存在
     if user_id not in _task_directories:
-        _task_directories[user_id] = {}
+        _task_directories[user_id] = LRURegistry(max_size=TASK_DIR_MAX_PER_USER)
 
     # 创建用户特定的任务工作目录
     user_task_dir = os.path.join(BASE_WORK_DIR, user_id, task_id)
@@ -90,6 +248,134 @@ def create_task_workspace(user_id: str, task_id: str) -> str:
     return user_task_dir
 
 
+def _get_task_dir(user_id: str, task_id: str) -> str:
+    """获取任务工作目录，不存在（或记录已被淘汰）时创建"""
+    task_dir = _task_directories.get(user_id, {}).get(task_id)
+    if task_dir is None:
+        task_dir = create_task_workspace(user_id, task_id)
+
+    return task_dir
+
+
+def _echo_output(stream: str, text: str):
+    """实时打印容器中的执行输出"""
+    print(text, end="", flush=True)
+
+
+def _on_output():
+    return _echo_output if EXECUTOR_ECHO_OUTPUT else None
+
+
+def _cache_wheels(requirements: List[str]):
+    """在构建容器中构建wheel，成功后再记录，执行容器中的输出不能决定wheelhouse的内容"""
+    if get_package_cache().build_wheels(EXECUTOR_IMAGE, requirements):
+        get_package_cache().record(requirements)
+
+
+def _record_pip_installs(code: str, language: str, result: Dict[str, str]):
+    """shell代码中的 pip install 成功后，在后台把包及其依赖构建为wheel放入本地仓库并记录
+
+    执行容器只读挂载wheelhouse，wheel由单独的构建容器从索引下载构建，不使用执行容器中的文件。
+    离线模式下只能从wheelhouse安装，其中已有对应的wheel，直接记录。
+    """
+    if language == "python" or result["error"]:
+        return
+    requirements = parse_pip_installs(code)
+    if not requirements:
+        return
+
+    if EXECUTOR_PIP_OFFLINE:
+        get_package_cache().record(requirements)
+    else:
+        threading.Thread(target=_cache_wheels, args=(requirements,), daemon=True).start()
+
+
+def _preflight_syntax(code: str, language: str) -> Optional[str]:
+    if language != "python" or not EXECUTOR_PREFLIGHT:
+        return None
+    return get_code_preflight().check_syntax(code)
+
+
+def _preflight_imports(container: DockerContainer, code: str, language: str, task_dir: str) -> Optional[str]:
+    if language != "python" or not EXECUTOR_PREFLIGHT:
+        return None
+    return get_code_preflight().check_imports(container, code, task_dir)
+
+
+def _format_result(user_id: str, task_id: str, result: Dict[str, str], task_dir: str,
+                   tool_name: str = "docker_code_executor") -> str:
+    """将执行结果整理为结构化JSON，出错时也保留出错前的输出
+
+    过长的输出和错误信息保存到任务目录下的文件，结果中只保留开头部分和文件路径，避免占满模型上下文。
+    """
+    result_data = {
+        "user_id": user_id,
+        "task_id": task_id,
+        "success": not result["error"],
+        "output": spill_tool_output(result["output"], task_dir, tool_name,
+                                    original_bytes=result.get("output_bytes")),
+        "error": spill_tool_output(result["error"], task_dir, f"{tool_name}_error",
+                                   original_bytes=result.get("error_bytes")) if result["error"] else "",
+        "working_directory": task_dir
+    }
+
+    return json.dumps(result_data)
+
+
+def _prepare_local_command(code: str, language: str, task_dir: str):
+    """将代码写入任务目录下的临时文件并生成执行命令
+
+    Returns:
+        (临时文件路径, 执行命令)，语言不支持时执行命令为None
+    """
+    # 创建临时文件保存代码
+    file_extension = ".py" if language == "python" else ".sh"
+    with tempfile.NamedTemporaryFile(suffix=file_extension, dir=task_dir, delete=False) as temp_file:
+        temp_file_path = temp_file.name
+        temp_file.write(code.encode('utf-8'))
+
+    # 设置执行命令
+    if language == "python":
+        command = f"python {temp_file_path}"
+    elif language in ["bash", "sh"]:
+        # 确保shell脚本有执行权限
+        os.chmod(temp_file_path, 0o755)
+        command = f"bash {temp_file_path}"
+    else:
+        command = None
+
+    return temp_file_path, command
+
+
+def _truncate(data: bytes) -> str:
+    output = TruncatedOutput(EXECUTOR_OUTPUT_HEAD, EXECUTOR_OUTPUT_TAIL)
+    output.write(data)
+    return output.getvalue()
+
+
+def _local_result(user_id: str, task_id: str, task_dir: str, returncode: int, stdout: bytes, stderr: bytes) -> str:
+    return json.dumps({
+        "user_id": user_id,
+        "task_id": task_id,
+        "success": returncode == 0,
+        "output": spill_tool_output(_truncate(stdout), task_dir, "local_code_executor", original_bytes=len(stdout)),
+        "error": spill_tool_output(_truncate(stderr), task_dir, "local_code_executor_error",
+                                   original_bytes=len(stderr)),
+        "working_directory": task_dir
+    })
+
+
+def _local_error(user_id: str, task_id: str, task_dir: str, error: str) -> str:
+    return json.dumps({
+        "user_id": user_id,
+        "task_id": task_id,
+        "success": False,
+        "output": "",
+        "error": error,
+        "working_directory": task_dir
+    })
+
+
 def execute_code_local(
         code: str,
         language: str,
@@ -108,93 +394,56 @@ def execute_code_local(
     Returns:
         字符串结果，包含输出或错误信息
     """
-    # 确保用户任务映射表存在
-    if user_id not in _task_directories:
-        _task_directories[user_id] = {}
+    task_dir = _get_task_dir(user_id, task_id)
+    temp_file_path, command = _prepare_local_command(code, language, task_dir)
 
-    # 确保有任务ID和对应的工作目录
-    if task_id not in _task_directories.get(user_id, {}):
-        user_task_dir = create_task_workspace(user_id, task_id)
+    try:
+        if command is None:
+            return _local_error(user_id, task_id, task_dir, f"不支持的语言: {language}")
 
-    task_dir = _task_directories[user_id][task_id]
+        # 在任务目录中执行代码，不修改进程的当前目录
+        process = subprocess.run(command, shell=True, cwd=task_dir, capture_output=True)
+        return _local_result(user_id, task_id, task_dir, process.returncode, process.stdout, process.stderr)
 
-    # 创建临时文件保存代码
-    file_extension = ".py" if language == "python" else ".sh"
-    with tempfile.NamedTemporaryFile(suffix=file_extension, dir=task_dir, delete=False) as temp_file:
-        temp_file_path = temp_file.name
-        temp_file.write(code.encode('utf-8'))
+    except Exception as e:
+        return _local_error(user_id, task_id, task_dir, f"执行时发生错误: {str(e)}")
+
+    finally:
+        # 清理临时文件
+        if os.path.exists(temp_file_path):
+            os.unlink(temp_file_path)
+
+
+async def aexecute_code_local(
+        code: str,
+        language: str,
+        user_id: str,
+        task_id: str
+) -> str:
+    """execute_code_local 的异步版本，在当前事件循环中等待子进程"""
+    task_dir = _get_task_dir(user_id, task_id)
+    temp_file_path, command = _prepare_local_command(code, language, task_dir)
 
-    # 设置执行命令
-    if language == "python":
-        command = f"python {temp_file_path}"
-    elif language in ["bash", "sh"]:
-        # 确保shell脚本有执行权限
-        os.chmod(temp_file_path, 0o755)
-        command = f"bash {temp_file_path}"
-    else:
-        return json.dumps({
-            "user_id": user_id,
-            "task_id": task_id,
-            "success": False,
-            "output": "",
-            "error": f"不支持的语言: {language}",
-            "working_directory": task_dir
-        })
-
-    # 执行命令
     try:
-        # 切换到任务目录
-        original_dir = os.getcwd()
-        os.chdir(task_dir)
+        if command is None:
+            return _local_error(user_id, task_id, task_dir, f"不支持的语言: {language}")
 
-        # 执行代码
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        process = loop.run_until_complete(asyncio.create_subprocess_shell(
+        process = await asyncio.create_subprocess_shell(
             command,
+            cwd=task_dir,
             stdout=asyncio.subprocess.PIPE,
             stderr=asyncio.subprocess.PIPE
-        ))
-        stdout, stderr = loop.run_until_complete(process.communicate())
-        loop.close()
-
-        # 还原工作目录
-        os.chdir(original_dir)
-
-        # 清理临时文件
-        os.unlink(temp_file_path)
-
-        # 返回结果
-        output = stdout.decode('utf-8')
-        error = stderr.decode('utf-8')
-        success = process.returncode == 0
-
-        return json.dumps({
-            "user_id": user_id,
-            "task_id": task_id,
-            "success": success,
-            "output": output,
-            "error": error,
-            "working_directory": task_dir
-        })
+        )
+        stdout, stderr = await process.communicate()
+        return _local_result(user_id, task_id, task_dir, process.returncode, stdout, stderr)
 
     except Exception as e:
-        # 还原工作目录
-        os.chdir(original_dir)
+        return _local_error(user_id, task_id, task_dir, f"执行时发生错误: {str(e)}")
 
-        # 清理临时文件
+    finally:
         if os.path.exists(temp_file_path):
             os.unlink(temp_file_path)
 
-        return json.dumps({
-            "user_id": user_id,
-            "task_id": task_id,
-            "success": False,
-            "output": "",
-            "error": f"执行时发生错误: {str(e)}",
-            "working_directory": task_dir
-        })
-
 
 def execute_code_docker(
         code: str,
@@ -214,37 +463,89 @@ def execute_code_docker(
     Returns:
         字符串结果，包含输出或错误信息
     """
-    # 确保用户任务映射表存在
-    if user_id not in _task_directories:
-        _task_directories[user_id] = {}
+    task_dir = _get_task_dir(user_id, task_id)
 
-    # 确保有任务ID和对应的工作目录
-    if task_id not in _task_directories.get(user_id, {}):
-        user_task_dir = create_task_workspace(user_id, task_id)
+    # 有语法错误时直接返回，不需要租用容器
+    error = _preflight_syntax(code, language)
+    if error:
+        return _format_result(user_id, task_id, {"output": "", "error": error}, task_dir)
 
-    task_dir = _task_directories[user_id][task_id]
+    # 执行期间标记租约正在使用，不会被空闲回收
+    with get_container_pool().using(user_id, task_id):
+        # 获取用户专属的Docker容器
+        container = get_docker_container(user_id=user_id, task_id=task_id)
 
-    # 获取用户专属的Docker容器
-    container = get_docker_container(user_id=user_id, task_id=task_id)
+        # 设置工作目录为当前任务目录
+        print(f"user_id: {user_id}, task_id: {task_id}, task_dir: {task_dir}")
+        container.set_work_dir(task_dir)
 
-    # 设置工作目录为当前任务目录
-    print(f"user_id: {user_id}, task_id: {task_id}, task_dir: {task_dir}")
-    container.set_work_dir(task_dir)
+        error = _preflight_imports(container, code, language, task_dir)
+        if error:
+            return _format_result(user_id, task_id, {"output": "", "error": error}, task_dir)
 
-    # 执行代码
-    result = container.execute(code, language)
+        # 执行代码
+        result = container.execute(code, language, on_output=_on_output())
+        _record_pip_installs(code, language, result)
 
     # 返回输出或错误 - 使用结构化JSON格式
-    result_data = {
-        "user_id": user_id,
-        "task_id": task_id,
-        "success": not result["error"],
-        "output": result["output"] if not result["error"] else "",
-        "error": result["error"] if result["error"] else "",
-        "working_directory": task_dir
-    }
+    return _format_result(user_id, task_id, result, task_dir)
 
-    return json.dumps(result_data)
+
+async def aexecute_code_docker(
+        code: str,
+        language: str,
+        user_id: str,
+        task_id: str
+) -> str:
+    """execute_code_docker 的异步版本，容器通信基于aiodocker，不阻塞事件循环"""
+    task_dir = _get_task_dir(user_id, task_id)
+    error = _preflight_syntax(code, language)
+    if error:
+        return _format_result(user_id, task_id, {"output": "", "error": error}, task_dir)
+
+    with get_container_pool().using(user_id, task_id):
+        container = await aget_docker_container(user_id=user_id, task_id=task_id)
+
+        print(f"user_id: {user_id}, task_id: {task_id}, task_dir: {task_dir}")
+        container.set_work_dir(task_dir)
+
+        # 检查导入需要在容器中执行命令，在线程中进行
+        error = await asyncio.to_thread(_preflight_imports, container, code, language, task_dir)
+        if error:
+            return _format_result(user_id, task_id, {"output": "", "error": error}, task_dir)
+
+        result = await container.aexecute(code, language, on_output=_on_output())
+        _record_pip_installs(code, language, result)
+    return _format_result(user_id, task_id, result, task_dir)
+
+
+def interrupt_python_kernel(user_id: str, task_id: str):
+    """中断任务内核中正在执行的Python代码"""
+    container = get_container_pool().get(user_id, task_id)
+    task_dir = _task_directories.get(user_id, {}).get(task_id)
+    if container and task_dir:
+        container.interrupt_kernel(task_dir)
+
+
+def reset_python_kernel(user_id: str, task_id: str):
+    """清空任务内核中的变量，下一次执行从干净的环境开始"""
+    container = get_container_pool().get(user_id, task_id)
+    task_dir = _task_directories.get(user_id, {}).get(task_id)
+    if container and task_dir:
+        container.reset_kernel(task_dir)
+
+
+async def areset_python_kernel(user_id: str, task_id: str):
+    """reset_python_kernel 的异步版本，Agent的异步执行路径启动的内核需要在事件循环中清空"""
+    container = get_container_pool().get(user_id, task_id)
+    task_dir = _task_directories.get(user_id, {}).get(task_id)
+    if container and task_dir:
+        await container.areset_kernel(task_dir)
+
+
+def _browser_shell_code(task_description: str) -> str:
+    # 任务交给容器中常驻的浏览器进程执行，复用已经启动的浏览器
+    return f'python /app/browser_client.py -t {shlex.quote(task_description)}'
 
 
 def execute_browser_task(
@@ -263,34 +564,33 @@ def execute_browser_task(
     Returns:
         str: JSON格式的任务执行结果
     """
-    shell_code = f'python /app/agent_browser.py -t "{task_description}"'
+    shell_code = _browser_shell_code(task_description)
+    task_dir = _get_task_dir(user_id, task_id)
 
-    # 确保用户任务映射表存在
-    if user_id not in _task_directories:
-        _task_directories[user_id] = {}
+    # 从浏览器容器池租用容器并执行命令，执行期间不会被空闲回收
+    with get_browser_pool().using(user_id, task_id):
+        container = get_browser_pool().lease(user_id, task_id)
+        container.set_work_dir(task_dir)
 
-    # 确保有任务ID和对应的工作目录
-    if task_id not in _task_directories.get(user_id, {}):
-        user_task_dir = create_task_workspace(user_id, task_id)
+        result = container.execute(shell_code, "bash", on_output=_on_output(), timeout=BROWSER_TASK_TIMEOUT)
+    return _format_result(user_id, task_id, result, task_dir, "browser_executor")
 
-    task_dir = _task_directories[user_id][task_id]
 
-    # 获取用户专属的Docker容器实例并执行命令
-    container = get_docker_container(user_id=user_id, task_id=task_id)
-    container.set_work_dir(task_dir)
+async def aexecute_browser_task(
+        task_description: str,
+        user_id: str,
+        task_id: str
+) -> str:
+    """execute_browser_task 的异步版本"""
+    shell_code = _browser_shell_code(task_description)
+    task_dir = _get_task_dir(user_id, task_id)
 
-    result = container.execute(shell_code, "bash")
+    with get_browser_pool().using(user_id, task_id):
+        container = await get_browser_pool().alease(user_id, task_id)
+        container.set_work_dir(task_dir)
 
-    result_data = {
-        "user_id": user_id,
-        "task_id": task_id,
-        "success": not result["error"],
-        "output": result["output"] if not result["error"] else "",
-        "error": result["error"] if result["error"] else "",
-        "working_directory": task_dir
-    }
-
-    return json.dumps(result_data)
+        result = await container.aexecute(shell_code, "bash", on_output=_on_output(), timeout=BROWSER_TASK_TIMEOUT)
+    return _format_result(user_id, task_id, result, task_dir, "browser_executor")
 
 
 # 创建LlamaIndex工具
@@ -298,8 +598,9 @@ def create_code_executor_docker_tool():
     """创建docker代码执行工具"""
     return FunctionTool.from_defaults(
         name="docker_code_executor",
-        description="在Docker容器中执行Python代码或Shell脚本。对于Python代码，使用language='python'；对于Shell脚本，使用language='bash'或'sh'。需要提供user_id区分不同用户，可以指定task_id继续在特定任务上下文中执行，不指定则创建新任务。",
+        description="在Docker容器中执行Python代码或Shell脚本。对于Python代码，使用language='python'；对于Shell脚本，使用language='bash'或'sh'。需要提供user_id区分不同用户，可以指定task_id继续在特定任务上下文中执行，不指定则创建新任务。同一任务中的Python代码在常驻解释器中执行，之前定义的变量、导入的模块和读入的数据可以直接使用。",
         fn=execute_code_docker,
+        async_fn=aexecute_code_docker,
     )
 
 
@@ -309,6 +610,7 @@ def create_code_executor_local_tool():
         name="local_code_executor",
         description="在本地环境中执行Python代码或Shell脚本。对于Python代码，使用language='python'；对于Shell脚本，使用language='bash'或'sh'。需要提供user_id区分不同用户，可以指定task_id继续在特定任务上下文中执行，不指定则创建新任务。",
         fn=execute_code_local,
+        async_fn=aexecute_code_local,
     )
 
 
@@ -318,24 +620,51 @@ def create_browser_docker_tool():
         name="browser_executor",
         description="执行浏览器相关任务，如搜索、浏览等。提供任务描述，工具将通过agent_browser.py执行相应操作。需要提供user_id区分不同用户。",
         fn=execute_browser_task,
+        async_fn=aexecute_browser_task,
     )
 
 
-# 关闭特定用户的Docker容器
+def forget_user_tasks(user_id: str):
+    """删除用户的任务目录记录"""
+    _task_directories.pop(user_id)
+
+
+def get_executor_metrics() -> Dict[str, Any]:
+    """执行容器与任务目录记录的运行指标"""
+    containers = _container_pool.stats() if _container_pool is not None else {}
+    browser_containers = _browser_pool.stats() if _browser_pool is not None else {}
+    return {
+        "live_containers": sum(stats.get("idle", 0) + stats.get("leased", 0) + stats.get("starting", 0)
+                               for stats in (containers, browser_containers)),
+        "containers": containers,
+        "browser_containers": browser_containers,
+        "task_directories": _task_directories.stats(),
+        "preflight": _code_preflight.stats() if _code_preflight is not None else {}
+    }
+
+
+# 关闭特定用户的Docker容器（按任务隔离时为该用户所有任务的容器）
 def close_docker_container(user_id: str = "default"):
-    global _docker_containers
-    if user_id in _docker_containers and _docker_containers[user_id]:
-        _docker_containers[user_id].stop()
-        _docker_containers[user_id] = None
+    for pool in (_container_pool, _browser_pool):
+        if pool is not None:
+            pool.release(user_id)
+
+
+def close_task_container(user_id: str, task_id: str):
+    """任务结束后归还任务独占的容器，同一用户的任务共用容器时不做处理"""
+    for pool in (_container_pool, _browser_pool):
+        if pool is not None and pool.isolation == "task":
+            pool.release(user_id, task_id)
 
 
 # 关闭所有Docker容器
 def close_all_docker_containers():
-    global _docker_containers
-    for user_id, container in _docker_containers.items():
-        if container:
-            container.stop()
-    _docker_containers = {}
+    global _container_pool, _browser_pool
+    for pool in (_container_pool, _browser_pool):
+        if pool is not None:
+            pool.close()
+    _container_pool = None
+    _browser_pool = None
 
 
 def test_docker_container():
@@ -359,6 +688,27 @@ print(f"Python version: {sys.version}")
         close_docker_container("test_user")
 
 
+async def test_kernel_sync_after_async():
+    """同一任务先异步执行、再同步执行Python代码，同步执行时重新启动内核，不会报“请使用aexecute”"""
+    user_id, task_id = "test_user", "kernel_order"
+    task_dir = create_task_workspace(user_id, task_id)
+    container = await aget_docker_container(user_id=user_id, task_id=task_id)
+    container.set_work_dir(task_dir)
+
+    try:
+        result = await container.aexecute("x = 1\nprint('async', x)", "python")
+        print(f"异步执行: {result}")
+        assert not result["error"], result["error"]
+
+        # 同步执行在线程中进行，与工具的同步调用方式相同
+        result = await asyncio.to_thread(container.execute, "print('sync')", "python")
+        print(f"同步执行: {result}")
+        assert not result["error"], result["error"]
+        assert not container.kernels[task_dir].is_async
+    finally:
+        close_docker_container(user_id)
+
+
 # 测试代码
 async def test_code_executor():
     tool = create_code_executor_docker_tool()
@@ -1,24 +1,311 @@
-from typing import Dict, Any
+import os
+import json
+from typing import Dict, Any, AsyncIterator, Callable, Iterator, Optional
 from llama_index.core.tools import FunctionTool
-from langchain_openai import ChatOpenAI
-from llama_index.llms.langchain import LangChainLLM
 from llama_index.llms.ollama import Ollama
 from prompts import CODE_GENERATION_PROMPT
+from llm_clients import get_llm, DEFAULT_MODEL
+from tool_code_executor import BASE_WORK_DIR, execute_code_docker, aexecute_code_docker
+from code_cache import CodeCache
 
-api_key = "本地模型 API"
-base_url = "API 链接"
+# 代码缓存配置，设置环境变量 CODE_CACHE_DISABLED=1 可关闭缓存
+CODE_CACHE_ENABLED = os.getenv("CODE_CACHE_DISABLED", "") not in ("1", "true", "True")
+CODE_CACHE_DIR = os.path.normpath(os.path.join(BASE_WORK_DIR, os.pardir, "cache", "code"))
+CODE_CACHE_MAX_ENTRIES = 256
+CODE_CACHE_TTL = 7 * 24 * 3600
+
+# 生成并执行代码的最多尝试次数（包括第一次），执行出错时把错误交给模型重新生成
+CODE_RUNNER_MAX_ATTEMPTS = 3
+# 重新生成时附带的上一次代码的最大字符数
+CODE_RUNNER_PREVIOUS_CODE_CHARS = 4000
+
+# 全局变量 - 生成代码缓存
+_code_cache: Optional[CodeCache] = None
+
+
+def get_code_cache() -> CodeCache:
+    """获取全局代码缓存"""
+    global _code_cache
+
+    if _code_cache is None:
+        _code_cache = CodeCache(
+            cache_dir=CODE_CACHE_DIR,
+            max_entries=CODE_CACHE_MAX_ENTRIES,
+            ttl=CODE_CACHE_TTL,
+            enabled=CODE_CACHE_ENABLED
+        )
+
+    return _code_cache
+
+
+def build_prompt(task_description: str, user_id: str, task_id: str, additional_context: str) -> str:
+    return f"""{CODE_GENERATION_PROMPT}
+
+用户ID: {user_id}
+任务ID: {task_id}
+任务描述：{task_description}
+额外上下文：{additional_context}
+
+请直接返回代码，无需其他解释。
+"""
+
+
+def _cache_key(task_description: str, additional_context: str, model_name: str) -> str:
+    return CodeCache.make_key(CODE_GENERATION_PROMPT, task_description, additional_context, model_name)
+
+
+def generate_python_code(
+        task_description: str,
+        user_id: str = "default",
+        task_id: str = None,
+        additional_context: str = "",
+        model_name: str = DEFAULT_MODEL,
+        use_cache: bool = True,
+        store: bool = True
+) -> str:
+    """
+    根据任务描述生成Python代码
+
+    Args:
+        task_description (str): 任务描述
+        user_id (str): 用户ID
+        task_id (str): 任务ID
+        additional_context (str): 额外的上下文信息
+        model_name (str): 模型名
+        use_cache (bool): 是否使用代码缓存
+        store (bool): 是否把生成的代码写入缓存
+
+    Returns:
+        str: 生成的Python代码
+    """
+    cache = get_code_cache()
+    key = _cache_key(task_description, additional_context, model_name)
+    if use_cache:
+        code = cache.get(key)
+        if code is not None:
+            return code
+
+    # llm = Ollama(model=model_name, base_url="http://localhost:11434")
+    llm = get_llm(model_name)
+
+    prompt = build_prompt(task_description, user_id, task_id, additional_context)
+
+    response = llm.complete(prompt)
+    code = response.text.strip()
+
+    if store:
+        cache.set(key, code, model=model_name)
+    return code
+
+
+async def agenerate_python_code(
+        task_description: str,
+        user_id: str = "default",
+        task_id: str = None,
+        additional_context: str = "",
+        model_name: str = DEFAULT_MODEL,
+        use_cache: bool = True,
+        store: bool = True
+) -> str:
+    """generate_python_code 的异步版本，使用共享的异步连接池"""
+    cache = get_code_cache()
+    key = _cache_key(task_description, additional_context, model_name)
+    if use_cache:
+        code = cache.get(key)
+        if code is not None:
+            return code
+
+    llm = get_llm(model_name)
+
+    prompt = build_prompt(task_description, user_id, task_id, additional_context)
+
+    response = await llm.acomplete(prompt)
+    code = response.text.strip()
+
+    if store:
+        cache.set(key, code, model=model_name)
+    return code
+
+
+def stream_python_code(
+        task_description: str,
+        user_id: str = "default",
+        task_id: str = None,
+        additional_context: str = "",
+        model_name: str = DEFAULT_MODEL,
+        use_cache: bool = True,
+        on_token: Optional[Callable[[str], None]] = None
+) -> Iterator[str]:
+    """流式生成Python代码，逐段返回生成的内容
+
+    缓存命中时一次性返回完整代码；生成结束后完整代码写入缓存。
+
+    Args:
+        on_token: 每收到一段内容时调用的回调
+
+    Yields:
+        str: 新生成的代码片段
+    """
+    cache = get_code_cache()
+    key = _cache_key(task_description, additional_context, model_name)
+    if use_cache:
+        code = cache.get(key)
+        if code is not None:
+            if on_token:
+                on_token(code)
+            yield code
+            return
+
+    llm = get_llm(model_name)
+    prompt = build_prompt(task_description, user_id, task_id, additional_context)
+
+    text = ""
+    for response in llm.stream_complete(prompt):
+        delta = response.delta or ""
+        if not delta:
+            continue
+        text += delta
+        if on_token:
+            on_token(delta)
+        yield delta
+
+    cache.set(key, text.strip(), model=model_name)
+
+
+async def astream_python_code(
+        task_description: str,
+        user_id: str = "default",
+        task_id: str = None,
+        additional_context: str = "",
+        model_name: str = DEFAULT_MODEL,
+        use_cache: bool = True,
+        on_token: Optional[Callable[[str], None]] = None
+) -> AsyncIterator[str]:
+    """stream_python_code 的异步版本"""
+    cache = get_code_cache()
+    key = _cache_key(task_description, additional_context, model_name)
+    if use_cache:
+        code = cache.get(key)
+        if code is not None:
+            if on_token:
+                on_token(code)
+            yield code
+            return
+
+    llm = get_llm(model_name)
+    prompt = build_prompt(task_description, user_id, task_id, additional_context)
+
+    text = ""
+    async for response in await llm.astream_complete(prompt):
+        delta = response.delta or ""
+        if not delta:
+            continue
+        text += delta
+        if on_token:
+            on_token(delta)
+        yield delta
+
+    cache.set(key, text.strip(), model=model_name)
+
+
+def _retry_context(additional_context: str, code: str, error: str) -> str:
+    """重新生成时的额外上下文：原有上下文、上一次的代码及其错误"""
+    if len(code) > CODE_RUNNER_PREVIOUS_CODE_CHARS:
+        code = code[:CODE_RUNNER_PREVIOUS_CODE_CHARS] + "\n# ...（已截断）"
+    return f"""{additional_context}
+
+上一次生成的代码执行出错，请修正后重新生成完整代码。
+上一次的代码：
+{code}
+
+错误信息：
+{error}"""
+
+
+def _runner_result(result: str, code: str, attempt: int) -> str:
+    """在执行结果中附上最后执行的代码和尝试次数"""
+    result_data = json.loads(result)
+    result_data["code"] = code
+    result_data["attempts"] = attempt
+    return json.dumps(result_data)
+
+
+def generate_and_execute_code(
+        task_description: str,
+        user_id: str,
+        task_id: str,
+        additional_context: str = "",
+        model_name: str = DEFAULT_MODEL,
+        max_attempts: int = CODE_RUNNER_MAX_ATTEMPTS
+) -> str:
+    """
+    生成Python代码并在Docker容器中执行，执行出错时把代码和错误交给模型重新生成，最多尝试 max_attempts 次
+
+    第一次生成可以使用缓存，执行出错时删除原请求的缓存；重新生成的代码不读写缓存，执行成功后写入原请求的缓存。
+
+    Returns:
+        str: JSON格式的执行结果，包含最后执行的代码和尝试次数
+    """
+    key = _cache_key(task_description, additional_context, model_name)
+    context = additional_context
+    for attempt in range(1, max_attempts + 1):
+        code = generate_python_code(task_description, user_id, task_id, context,
+                                    model_name=model_name, use_cache=attempt == 1,
+                                    store=attempt == 1)
+        result = execute_code_docker(code, "python", user_id, task_id)
+        error = json.loads(result)["error"]
+        if not error:
+            if attempt > 1:
+                get_code_cache().set(key, code, model=model_name)
+            break
+        print(f"第 {attempt} 次生成的代码执行出错")
+        if attempt == 1:
+            get_code_cache().delete(key)
+        context = _retry_context(additional_context, code, error)
+
+    return _runner_result(result, code, attempt)
+
+
+async def agenerate_and_execute_code(
+        task_description: str,
+        user_id: str,
+        task_id: str,
+        additional_context: str = "",
+        model_name: str = DEFAULT_MODEL,
+        max_attempts: int = CODE_RUNNER_MAX_ATTEMPTS
+) -> str:
+    """generate_and_execute_code 的异步版本"""
+    key = _cache_key(task_description, additional_context, model_name)
+    context = additional_context
+    for attempt in range(1, max_attempts + 1):
+        code = await agenerate_python_code(task_description, user_id, task_id, context,
+                                           model_name=model_name, use_cache=attempt == 1,
+                                           store=attempt == 1)
+        result = await aexecute_code_docker(code, "python", user_id, task_id)
+        error = json.loads(result)["error"]
+        if not error:
+            if attempt > 1:
+                get_code_cache().set(key, code, model=model_name)
+            break
+        print(f"第 {attempt} 次生成的代码执行出错")
+        if attempt == 1:
+            get_code_cache().delete(key)
+        context = _retry_context(additional_context, code, error)
+
+    return _runner_result(result, code, attempt)
 
 
 def create_code_generator_tool(
-        model_name: str = "模型名XXX"
+        model_name: str = DEFAULT_MODEL
 ) -> FunctionTool:
     """创建代码生成工具"""
 
-    def generate_python_code(
+    def code_generator(
             task_description: str,
             user_id: str = "default",
             task_id: str = None,
-            additional_context: str = ""
+            additional_context: str = "",
+            use_cache: bool = True
     ) -> str:
         """
         根据任务描述生成Python代码
@@ -28,28 +315,71 @@ def create_code_generator_tool(
             user_id (str): 用户ID
             task_id (str): 任务ID
             additional_context (str): 额外的上下文信息
+            use_cache (bool): 是否使用缓存的代码，之前生成的代码有误需要重新生成时设为False
 
         Returns:
             str: 生成的Python代码
         """
-        # llm = Ollama(model=model_name, base_url="http://localhost:11434")
-        llm = LangChainLLM(ChatOpenAI(model=model_name, openai_api_key=api_key, openai_api_base=base_url))
+        return generate_python_code(task_description, user_id, task_id, additional_context,
+                                    model_name=model_name, use_cache=use_cache)
 
-        prompt = f"""{CODE_GENERATION_PROMPT}
+    async def acode_generator(
+            task_description: str,
+            user_id: str = "default",
+            task_id: str = None,
+            additional_context: str = "",
+            use_cache: bool = True
+    ) -> str:
+        return await agenerate_python_code(task_description, user_id, task_id, additional_context,
+                                           model_name=model_name, use_cache=use_cache)
 
-用户ID: {user_id}
-任务ID: {task_id}
-任务描述：{task_description}
-额外上下文：{additional_context}
+    return FunctionTool.from_defaults(
+        fn=code_generator,
+        async_fn=acode_generator,
+        name="code_generator",
+        description="根据任务描述生成Python代码的工具。需要提供user_id和task_id，返回可执行的Python代码字符串。相同的请求会直接返回缓存的代码，如果之前生成的代码有误需要重新生成，请设置use_cache=False。"
+    )
 
-请直接返回代码，无需其他解释。
-"""
 
-        response = llm.complete(prompt)
-        return response.text.strip()
+def create_code_runner_tool(
+        model_name: str = DEFAULT_MODEL,
+        max_attempts: int = CODE_RUNNER_MAX_ATTEMPTS
+) -> FunctionTool:
+    """创建代码生成并执行工具，一次工具调用完成生成、执行和出错后的修正"""
+
+    def code_runner(
+            task_description: str,
+            user_id: str,
+            task_id: str,
+            additional_context: str = ""
+    ) -> str:
+        """
+        根据任务描述生成Python代码并在Docker容器中执行
+
+        Args:
+            task_description (str): 任务描述
+            user_id (str): 用户ID
+            task_id (str): 任务ID
+            additional_context (str): 额外的上下文信息
+
+        Returns:
+            str: JSON格式的执行结果，包含执行的代码、输出、错误和尝试次数
+        """
+        return generate_and_execute_code(task_description, user_id, task_id, additional_context,
+                                         model_name=model_name, max_attempts=max_attempts)
+
+    async def acode_runner(
+            task_description: str,
+            user_id: str,
+            task_id: str,
+            additional_context: str = ""
+    ) -> str:
+        return await agenerate_and_execute_code(task_description, user_id, task_id, additional_context,
+                                                model_name=model_name, max_attempts=max_attempts)
 
     return FunctionTool.from_defaults(
-        fn=generate_python_code,
-        name="code_generator",
-        description="根据任务描述生成Python代码的工具。需要提供user_id和task_id，返回可执行的Python代码字符串。"
+        fn=code_runner,
+        async_fn=acode_runner,
+        name="code_runner",
+        description=f"根据任务描述生成Python代码并直接在Docker容器中执行，返回执行结果和执行的代码。执行出错时会根据错误自动修正代码并重新执行，最多尝试{max_attempts}次。需要提供user_id和task_id，task_id与docker_code_executor相同时共用同一个Python解释器。"
     )
@@ -1,102 +1,365 @@
 import os
-from typing import Optional
+import asyncio
+import hashlib
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Mapping, Optional
 from llama_index.core.tools import FunctionTool
+import aiohttp
 import requests
-from bs4 import BeautifulSoup
-import re
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from urllib.parse import urlparse
+from crawl_cache import CrawlCache
+from html_extractors import StreamingExtractor, get_extractor
 
 # 与 tool_code_executor.py 中的 BASE_WORK_DIR 保持一致即可
 BASE_WORK_DIR = "C:\\Users\\XXX\\agent-manus\\workspace\\tasks"
 
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+}
+REQUEST_TIMEOUT = 10
 
-def create_webpage_crawler_tool() -> FunctionTool:
-    """创建网页内容采集工具"""
+# 连接池与重试配置
+CRAWL_MAX_CONNECTIONS = 32  # 连接池总连接数
+CRAWL_PER_HOST_LIMIT = 4  # 同一站点的最大并发连接数
+CRAWL_BATCH_CONCURRENCY = 8  # 批量采集时同时进行的请求数
+CRAWL_RETRIES = 2  # 连接错误、超时、429和5xx的重试次数
+CRAWL_BACKOFF = 0.5  # 重试退避基数（秒），第n次重试等待 CRAWL_BACKOFF * 2^n
+RETRY_STATUS = (429, 500, 502, 503, 504)
 
-    def crawl_webpage(
-            url: str,
-            user_id: str = "default",
-            task_id: Optional[str] = None
-    ) -> str:
-        """
-        采集网页内容并保存为文本文件
-
-        Args:
-            url (str): 网页链接
-            user_id (str): 用户ID
-            task_id (str): 任务ID
-
-        Returns:
-            str: 保存的文件完整路径
-        """
-        try:
-            # 发送请求获取网页内容
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-            }
-            response = requests.get(url, headers=headers, timeout=10)
-            response.raise_for_status()
-            response.encoding = response.apparent_encoding
-
-            # 使用BeautifulSoup解析内容
-            soup = BeautifulSoup(response.text, 'html.parser')
-
-            # 清理网页内容
-            # 1. 移除非核心内容标签
-            for element in soup(['script', 'style', 'noscript', 'iframe', 'head',
-                                 'header', 'footer', 'nav', 'sidebar', 'comments',
-                                 'aside', 'advertisement']):
-                element.decompose()
-
-            # 2. 尝试提取文章主体内容
-            main_content = None
-            for tag in ['article', 'main', '[role="main"]', '.main-content', '#content']:
-                main_content = soup.select_one(tag)
-                if main_content:
-                    break
+# 采集缓存配置，所有用户和任务共享
+CRAWL_CACHE_DIR = os.path.normpath(os.path.join(BASE_WORK_DIR, os.pardir, "cache", "crawl"))
+CRAWL_CACHE_MAX_BYTES = 512 * 1024 * 1024
+CRAWL_CACHE_MAX_AGE = 600  # 在该时间（秒）内直接使用缓存，超过后向服务器重新验证
+
+# 流式下载配置
+CRAWL_MAX_BODY_BYTES = 5 * 1024 * 1024  # 单个页面最多下载的字节数（解压后），超出部分丢弃
+CRAWL_CHUNK_SIZE = 64 * 1024
+
+# 全局变量 - 采集缓存
+_crawl_cache: Optional[CrawlCache] = None
+
+# 全局变量 - 共享的HTTP会话，复用TCP/TLS连接
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+_aiohttp_session: Optional[aiohttp.ClientSession] = None
+_aiohttp_loop = None
+
+
+def get_crawl_cache() -> CrawlCache:
+    """获取全局采集缓存"""
+    global _crawl_cache
+
+    if _crawl_cache is None:
+        _crawl_cache = CrawlCache(
+            cache_dir=CRAWL_CACHE_DIR,
+            max_bytes=CRAWL_CACHE_MAX_BYTES,
+            max_age=CRAWL_CACHE_MAX_AGE
+        )
 
-            # 3. 提取和清理文本
-            if main_content:
-                text = main_content.get_text()
-            else:
-                # 如果找不到主体内容标签，则提取所有<p>标签内容
-                paragraphs = soup.find_all('p')
-                text = '\n'.join(p.get_text() for p in paragraphs)
-
-            # 4. 整理文本格式
-            lines = (line.strip() for line in text.splitlines())
-            chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
-            text = '\n'.join(chunk for chunk in chunks if chunk and len(chunk) > 20)
-
-            # 5. 移除多余空行和特殊字符
-            text = re.sub(r'\n\s*\n', '\n\n', text)
-            text = re.sub(r'[\x00-\x08\x0b\x0c\x0e-\x1f\x7f]', '', text)
-
-            # 创建保存目录
-            domain = urlparse(url).netloc
-            save_dir = os.path.join(
-                BASE_WORK_DIR,
-                user_id,
-                task_id if task_id else "",
-                "crawled_pages"
+    return _crawl_cache
+
+
+def get_session() -> requests.Session:
+    """获取共享的requests会话，带连接池和重试"""
+    global _session
+
+    with _session_lock:
+        if _session is None:
+            retry = Retry(
+                total=CRAWL_RETRIES,
+                backoff_factor=CRAWL_BACKOFF,
+                status_forcelist=RETRY_STATUS,
+                allowed_methods=["GET"]
             )
-            os.makedirs(save_dir, exist_ok=True)
+            adapter = HTTPAdapter(
+                pool_connections=CRAWL_MAX_CONNECTIONS,
+                pool_maxsize=CRAWL_PER_HOST_LIMIT,
+                pool_block=True,
+                max_retries=retry
+            )
+            _session = requests.Session()
+            _session.headers.update(HEADERS)
+            _session.mount("http://", adapter)
+            _session.mount("https://", adapter)
+
+    return _session
+
+
+def get_aiohttp_session() -> aiohttp.ClientSession:
+    """获取当前事件循环共享的aiohttp会话，限制总连接数与单站点连接数"""
+    global _aiohttp_session, _aiohttp_loop
+
+    loop = asyncio.get_running_loop()
+    if _aiohttp_session is None or _aiohttp_session.closed or _aiohttp_loop is not loop:
+        connector = aiohttp.TCPConnector(limit=CRAWL_MAX_CONNECTIONS, limit_per_host=CRAWL_PER_HOST_LIMIT)
+        _aiohttp_session = aiohttp.ClientSession(
+            connector=connector,
+            headers=HEADERS,
+            timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT)
+        )
+        _aiohttp_loop = loop
+
+    return _aiohttp_session
+
+
+async def aclose_crawler_sessions():
+    """关闭共享的HTTP会话"""
+    global _session, _aiohttp_session
+
+    if _aiohttp_session is not None and not _aiohttp_session.closed:
+        await _aiohttp_session.close()
+    _aiohttp_session = None
+
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+        _session = None
+
+
+def extract_text(html: str) -> str:
+    """从网页HTML中提取正文文本，后端由 html_extractors.HTML_EXTRACTOR 决定"""
+    return get_extractor()(html)
+
+
+def save_text(url: str, text: str, user_id: str, task_id: Optional[str], unique: bool = False) -> str:
+    """将提取的文本保存到任务目录下的 crawled_pages 中
+
+    Args:
+        unique: 文件名中加入链接的哈希，同一站点的多个页面不会互相覆盖
+
+    Returns:
+        str: 保存的文件完整路径
+    """
+    # 创建保存目录
+    domain = urlparse(url).netloc
+    save_dir = os.path.join(
+        BASE_WORK_DIR,
+        user_id,
+        task_id if task_id else "",
+        "crawled_pages"
+    )
+    os.makedirs(save_dir, exist_ok=True)
+
+    # 生成文件名并保存
+    if unique:
+        domain = f"{domain}_{hashlib.md5(url.encode('utf-8')).hexdigest()[:8]}"
+    filename = f"{domain}_{task_id}.txt" if task_id else f"{domain}.txt"
+    file_path = os.path.join(save_dir, filename)
+
+    with open(file_path, 'w', encoding='utf-8') as f:
+        f.write(f"Source URL: {url}\n\n")
+        f.write(text)
+
+    return file_path
+
+
+def _cache_headers(extractor: StreamingExtractor, headers: Mapping[str, str]) -> Mapping[str, str]:
+    """写入缓存的响应头：响应体被截断时不保存ETag/Last-Modified
+
+    否则重新验证时服务器返回304，会一直使用截断后的正文；不保存时过期后重新完整下载。
+    """
+    if extractor.truncated:
+        return {}
+    return headers
+
 
-            # 生成文件名并保存
-            filename = f"{domain}_{task_id}.txt" if task_id else f"{domain}.txt"
-            file_path = os.path.join(save_dir, filename)
+def get_page_text(url: str) -> str:
+    """获取网页正文，优先使用采集缓存
 
-            with open(file_path, 'w', encoding='utf-8') as f:
-                f.write(f"Source URL: {url}\n\n")
-                f.write(text)
+    缓存未过期时直接返回缓存的正文；过期后发送条件请求，304时复用缓存，
+    否则重新下载、提取正文并写入缓存。
+    """
+    cache = get_crawl_cache()
+    entry = cache.lookup(url)
+    if entry and cache.is_fresh(entry):
+        cache.stats["fresh_hits"] += 1
+        return cache.read_text(entry)
 
-            return file_path
+    # 重试由会话的连接适配器负责；流式下载，边下载边解析，超过 CRAWL_MAX_BODY_BYTES 后停止
+    with get_session().get(url, headers=cache.conditional_headers(entry), timeout=REQUEST_TIMEOUT,
+                           stream=True) as response:
+        if response.status_code == 304 and entry:
+            cache.mark_revalidated(entry)
+            return cache.read_text(entry)
 
+        response.raise_for_status()
+        extractor = StreamingExtractor(response.headers.get("Content-Type", ""), CRAWL_MAX_BODY_BYTES)
+        for chunk in response.iter_content(CRAWL_CHUNK_SIZE):
+            if not extractor.feed(chunk):
+                break
+        response_headers = response.headers
+
+    text = extractor.close()
+
+    cache.stats["misses"] += 1
+    cache.store(url, extractor.body, extractor.encoding, _cache_headers(extractor, response_headers), text)
+    return text
+
+
+async def aget_page_text(url: str, retries: int = CRAWL_RETRIES, backoff: float = CRAWL_BACKOFF) -> str:
+    """get_page_text 的异步版本，连接错误、超时、429和5xx按指数退避重试
+
+    下载的数据块的增量解析和最后的正文提取都在本次下载专用的一个线程中执行。
+    """
+    cache = get_crawl_cache()
+    entry = cache.lookup(url)
+    if entry and cache.is_fresh(entry):
+        cache.stats["fresh_hits"] += 1
+        return cache.read_text(entry)
+
+    session = get_aiohttp_session()
+    headers = cache.conditional_headers(entry)
+    # lxml的增量解析器不能在多个线程中使用，同一次下载的 feed 和 close 都在这个专用线程中执行
+    loop = asyncio.get_running_loop()
+    parser_thread = ThreadPoolExecutor(max_workers=1)
+    try:
+        for attempt in range(retries + 1):
+            try:
+                async with session.get(url, headers=headers) as response:
+                    if response.status == 304 and entry:
+                        cache.mark_revalidated(entry)
+                        return cache.read_text(entry)
+                    if response.status in RETRY_STATUS and attempt < retries:
+                        await asyncio.sleep(backoff * 2 ** attempt)
+                        continue
+                    response.raise_for_status()
+                    extractor = StreamingExtractor(response.headers.get("Content-Type", ""), CRAWL_MAX_BODY_BYTES)
+                    async for chunk in response.content.iter_chunked(CRAWL_CHUNK_SIZE):
+                        # 解码和增量解析在线程中执行，不占用事件循环
+                        if not await loop.run_in_executor(parser_thread, extractor.feed, chunk):
+                            break
+                    response_headers = response.headers
+                    break
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                if attempt >= retries:
+                    raise
+                await asyncio.sleep(backoff * 2 ** attempt)
+        else:
+            raise RuntimeError(f"多次重试后仍无法下载 {url}")
+
+        text = await loop.run_in_executor(parser_thread, extractor.close)
+    finally:
+        parser_thread.shutdown(wait=False)
+
+    cache.stats["misses"] += 1
+    cache.store(url, extractor.body, extractor.encoding, _cache_headers(extractor, response_headers), text)
+    return text
+
+
+def crawl_webpage(
+        url: str,
+        user_id: str = "default",
+        task_id: Optional[str] = None
+) -> str:
+    """
+    采集网页内容并保存为文本文件
+
+    Args:
+        url (str): 网页链接
+        user_id (str): 用户ID
+        task_id (str): 任务ID
+
+    Returns:
+        str: 保存的文件完整路径
+    """
+    try:
+        # 获取网页正文（可能来自采集缓存）
+        text = get_page_text(url)
+        return save_text(url, text, user_id, task_id)
+
+    except Exception as e:
+        raise Exception(f"Failed to crawl webpage: {str(e)}")
+
+
+async def acrawl_webpage(
+        url: str,
+        user_id: str = "default",
+        task_id: Optional[str] = None
+) -> str:
+    """crawl_webpage 的异步版本，使用aiohttp下载，正文提取放到线程中执行避免阻塞事件循环"""
+    try:
+        text = await aget_page_text(url)
+        return save_text(url, text, user_id, task_id)
+
+    except Exception as e:
+        raise Exception(f"Failed to crawl webpage: {str(e)}")
+
+
+def crawl_webpages(
+        urls: List[str],
+        user_id: str = "default",
+        task_id: Optional[str] = None
+) -> str:
+    """
+    批量采集多个网页，并发下载，每个页面完成后立即保存
+
+    Args:
+        urls (List[str]): 网页链接列表
+        user_id (str): 用户ID
+        task_id (str): 任务ID
+
+    Returns:
+        str: JSON格式的结果列表，每项包含url、file_path和error
+    """
+    # 同一站点的并发数由连接池的 pool_maxsize 和 pool_block 限制
+    def crawl_one(url: str) -> Dict[str, str]:
+        try:
+            text = get_page_text(url)
+            return {"url": url, "file_path": save_text(url, text, user_id, task_id, unique=True), "error": ""}
         except Exception as e:
-            raise Exception(f"Failed to crawl webpage: {str(e)}")
+            return {"url": url, "file_path": "", "error": str(e)}
+
+    results = []
+    with ThreadPoolExecutor(max_workers=CRAWL_BATCH_CONCURRENCY) as executor:
+        futures = [executor.submit(crawl_one, url) for url in urls]
+        for future in as_completed(futures):
+            results.append(future.result())
+
+    return json.dumps(results, ensure_ascii=False)
+
+
+async def acrawl_webpages(
+        urls: List[str],
+        user_id: str = "default",
+        task_id: Optional[str] = None
+) -> str:
+    """crawl_webpages 的异步版本，基于共享的aiohttp连接池"""
+    semaphore = asyncio.Semaphore(CRAWL_BATCH_CONCURRENCY)
+
+    async def crawl_one(url: str) -> Dict[str, str]:
+        async with semaphore:
+            try:
+                text = await aget_page_text(url)
+                return {"url": url, "file_path": save_text(url, text, user_id, task_id, unique=True), "error": ""}
+            except Exception as e:
+                return {"url": url, "file_path": "", "error": str(e) or type(e).__name__}
 
+    results = []
+    for future in asyncio.as_completed([crawl_one(url) for url in urls]):
+        results.append(await future)
+
+    return json.dumps(results, ensure_ascii=False)
+
+
+def create_webpage_crawler_tool() -> FunctionTool:
+    """创建网页内容采集工具"""
     return FunctionTool.from_defaults(
         fn=crawl_webpage,
+        async_fn=acrawl_webpage,
         name="webpage_crawler",
         description="采集指定网页的内容,清洗后保存为文本文件。需要提供url、user_id和task_id。返回保存的文件路径。"
     )
+
+
+def create_webpage_batch_crawler_tool() -> FunctionTool:
+    """创建批量网页采集工具"""
+    return FunctionTool.from_defaults(
+        fn=crawl_webpages,
+        async_fn=acrawl_webpages,
+        name="webpage_batch_crawler",
+        description="并发采集多个网页的内容，清洗后分别保存为文本文件。需要提供urls列表、user_id和task_id。返回JSON列表，每项包含url、保存的文件路径file_path和错误信息error。需要采集多个网页时优先使用此工具一次提交所有链接。"
+    )